@@ -0,0 +1,139 @@
+"""
+Benchmark do perfil leve do Chrome ('perfil leve do chrome') contra o perfil padrão.
+
+Abre o Chrome de verdade contra o Outlook local (mock_outlook_server.py), com imagens, fonte,
+vídeo e animação na caixa de entrada, e mede para cada perfil:
+  - abertura do Chrome (start_browser)
+  - tempo até a caixa de entrada (abertura + login até o painel de navegação e a página carregada)
+  - memória do Chrome (soma do RSS do chromedriver e dos processos do Chrome; requer psutil)
+  - heap JavaScript da página (Performance.getMetrics, sem dependências)
+  - imagens, fontes e vídeos pedidos ao servidor
+Os perfis se alternam a cada repetição para que variações da máquina afetem os dois igualmente.
+
+Uso:
+    python benchmark_chrome_profile.py --repeticoes 5 --imagens 40
+    python benchmark_chrome_profile.py --latencia-ms 200 --com-janela
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import rpa
+from benchmark_outlook_mock import configure_robot
+from mock_imap_server import MockMailbox
+from mock_outlook_server import start_mock_outlook_server
+
+PROFILES = [("padrão", False), ("leve", True)]
+SETTLE_SECONDS = 2  # espera a página terminar imagens, vídeo e animação antes de medir a memória
+
+
+def js_heap_mb(driver):
+    """Heap JavaScript usado pela página, em MB (None se o CDP não responder)."""
+    try:
+        driver.execute_cdp_cmd("Performance.enable", {})
+        metrics = driver.execute_cdp_cmd("Performance.getMetrics", {})["metrics"]
+    except Exception:
+        return None
+    values = {metric["name"]: metric["value"] for metric in metrics}
+    return values.get("JSHeapUsedSize", 0) / 1048576
+
+
+def chrome_process_count(driver):
+    """Processos do Chrome abertos pelo chromedriver (None sem psutil)."""
+    try:
+        import psutil
+        return len(psutil.Process(driver.service.process.pid).children(recursive=True))
+    except Exception:
+        return None
+
+
+def measure_profile(server, headless, light_profile):
+    """Abre o Chrome com o perfil, faz login e mede tempos, memória e recursos pedidos."""
+    assets_before = dict(server.asset_requests)
+    start = time.perf_counter()
+    driver = rpa.start_browser(headless=headless, light_profile=light_profile)
+    browser_seconds = time.perf_counter() - start
+    try:
+        rpa.login_to_outlook(driver)
+        rpa.wait_for_condition(lambda: rpa.page_loaded(driver), 30, "benchmark: caixa de entrada carregada")
+        inbox_seconds = time.perf_counter() - start
+        time.sleep(SETTLE_SECONDS)
+        return {
+            'abertura': browser_seconds,
+            'caixa de entrada': inbox_seconds,
+            'memoria': rpa.chrome_memory_mb(driver),
+            'heap js': js_heap_mb(driver),
+            'processos': chrome_process_count(driver),
+            'recursos': {kind: total - assets_before.get(kind, 0) for kind, total in server.asset_requests.items()},
+        }
+    finally:
+        rpa.quit_driver(driver)
+
+
+def median_of(results, key):
+    values = [result[key] for result in results if result[key] is not None]
+    return statistics.median(values) if values else None
+
+
+def print_summary(results_by_profile):
+    print("\n=== PERFIL DO CHROME: MEDIANAS ===")
+    rows = [("abertura", "s", "abertura do Chrome"), ("caixa de entrada", "s", "tempo até a caixa de entrada"),
+            ("memoria", "MB", "memória do Chrome (RSS)"), ("heap js", "MB", "heap JavaScript"),
+            ("processos", "", "processos do Chrome")]
+    baseline = results_by_profile["padrão"]
+    light = results_by_profile["leve"]
+    for key, unit, label in rows:
+        default_value = median_of(baseline, key)
+        light_value = median_of(light, key)
+        if default_value is None or light_value is None:
+            print(f"  {label:<30} indisponível" + (" (instale o psutil)" if key in ("memoria", "processos") else ""))
+            continue
+        change = (light_value - default_value) / default_value * 100 if default_value else 0
+        print(f"  {label:<30} padrão {default_value:8.2f}{unit:<2} leve {light_value:8.2f}{unit:<2} ({change:+.0f}%)")
+    for name, results in results_by_profile.items():
+        requests = {}
+        for result in results:
+            for kind, total in result['recursos'].items():
+                requests[kind] = requests.get(kind, 0) + total
+        per_run = ", ".join(f"{kind} {total / len(results):.0f}" for kind, total in sorted(requests.items())) or "nenhum"
+        print(f"  recursos pedidos por abertura ({name}): {per_run}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o perfil leve do Chrome com o padrão no Outlook local.")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Aberturas de cada perfil")
+    parser.add_argument("--imagens", type=int, default=30, help="Imagens na caixa de entrada do Outlook local")
+    parser.add_argument("--latencia-ms", type=int, default=0, help="Atraso de cada chamada ao servidor (ms)")
+    parser.add_argument("--com-janela", action="store_true", help="Mostra o navegador (padrão: headless)")
+    args = parser.parse_args()
+
+    mailbox = MockMailbox()
+    mailbox.add_message("Boletos em Aberto", [])
+    results_by_profile = {name: [] for name, _ in PROFILES}
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        server, port = start_mock_outlook_server(mailbox, latency=args.latencia_ms / 1000,
+                                                 heavy_assets=args.imagens)
+        configure_robot(Path(temp_folder), port, use_selector_cache=False)
+        print(f"Outlook local em {rpa.OUTLOOK_WEB_URL} ({args.imagens} imagens, latência {args.latencia_ms} ms)")
+        try:
+            for repetition in range(args.repeticoes):
+                # Alterna a ordem dos perfis a cada repetição
+                order = PROFILES if repetition % 2 == 0 else list(reversed(PROFILES))
+                for name, light_profile in order:
+                    result = measure_profile(server, not args.com_janela, light_profile)
+                    results_by_profile[name].append(result)
+                    memory = f"{result['memoria']:.0f} MB" if result['memoria'] is not None else "-"
+                    print(f"  [{repetition + 1}/{args.repeticoes}] {name:<7} caixa de entrada em "
+                          f"{result['caixa de entrada']:.2f}s, memória {memory}, recursos {result['recursos']}")
+        finally:
+            server.shutdown()
+
+    print_summary(results_by_profile)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
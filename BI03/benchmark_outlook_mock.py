@@ -0,0 +1,236 @@
+"""
+Benchmark de latência dos fluxos do Outlook Web contra o Outlook local (mock_outlook_server.py).
+
+Roda o login, search_and_download_attachments e send_email_with_attachment do robô
+no Chrome de verdade, mas apontando para o servidor local, e mostra o tempo de cada
+função e de cada etapa de espera (wait_step_timings), além do número de comandos enviados ao
+navegador. Serve para medir, sem o tenant real, o efeito de mudanças nas esperas e nos seletores.
+
+Uso:
+    python benchmark_outlook_mock.py --emails 3 --anexos 2 --envios 3 --pdfs 2
+    python benchmark_outlook_mock.py --latencia-ms 300 --repeticoes 2 --com-janela
+    python benchmark_outlook_mock.py --envios 10 --limite-por-minuto 4   # simula throttling no envio
+    python benchmark_outlook_mock.py --envios 5 --composicao ambos       # interface x link de composição
+    python benchmark_outlook_mock.py --envios 5 --corpo-html             # boletos no corpo, sem upload
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import rpa
+from benchmark_transport import create_fake_pdfs
+from mock_imap_server import MockMailbox
+from mock_outlook_server import start_mock_outlook_server
+
+EMAIL_SUBJECT = "Boletos em Aberto"
+
+
+def register_fake_tables(pdf_paths, hospital_name, rows=3):
+    """Tabela de boletos de mentira para cada PDF (usada pelo corpo em HTML no lugar do anexo)."""
+    header = ['Status', 'Pagador', 'Nº Nota', 'Nº Boleto', 'Data Vencimento', 'Valor']
+    for pdf_path in pdf_paths:
+        lines = [['Aberto', hospital_name, str(1000 + row), str(5000 + row), '10/01/2026', 'R$ 1.234,56']
+                 for row in range(rows)]
+        rpa.pdf_tables[pdf_path] = {'hospital': hospital_name, 'tipo': 'Bradesco', 'origem': 'Benchmark',
+                                    'linhas': [header] + lines}
+
+
+def create_fake_attachments(folder, count, size_kb):
+    """Cria planilhas de mentira (conteúdo aleatório) para anexar aos emails recebidos."""
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index in range(count):
+        path = folder / f"Boletos_Lote_{index + 1}.xlsx"
+        path.write_bytes(os.urandom(size_kb * 1024))
+        paths.append(path)
+    return paths
+
+
+class StepTimer:
+    """Mede cada chamada e guarda as etapas de espera e os comandos ao navegador feitos durante ela."""
+
+    def __init__(self):
+        self.calls = []
+        self.commands = 0
+
+    def count_commands(self, driver):
+        """Conta cada comando WebDriver (cliques, digitação, consultas, scripts) enviado pelo driver."""
+        original_execute = driver.execute
+
+        def counting_execute(driver_command, params=None):
+            self.commands += 1
+            return original_execute(driver_command, params)
+
+        driver.execute = counting_execute
+
+    def measure(self, function_name, function, *args):
+        first_step = len(rpa.wait_step_timings)
+        first_command = self.commands
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        self.calls.append({'funcao': function_name, 'segundos': elapsed,
+                           'comandos': self.commands - first_command,
+                           'etapas': rpa.wait_step_timings[first_step:]})
+        print(f"  [benchmark] {function_name}: {elapsed:.2f}s, {self.commands - first_command} comandos")
+        return result
+
+    def print_summary(self):
+        print("\n=== TEMPO POR FUNÇÃO E POR ETAPA ===")
+        for function_name in dict.fromkeys(call['funcao'] for call in self.calls):
+            calls = [call for call in self.calls if call['funcao'] == function_name]
+            total = sum(call['segundos'] for call in calls)
+            commands = sum(call['comandos'] for call in calls)
+            print(f"\n{function_name}: {len(calls)}x, total {total:.2f}s, "
+                  f"média {total / len(calls):.2f}s, máx {max(call['segundos'] for call in calls):.2f}s, "
+                  f"comandos ao navegador {commands} (média {commands / len(calls):.0f})")
+
+            steps = {}
+            for call in calls:
+                for item in call['etapas']:
+                    step = steps.setdefault(item['etapa'], {'vezes': 0, 'total': 0.0, 'maximo': 0.0, 'expiradas': 0})
+                    step['vezes'] += 1
+                    step['total'] += item['segundos']
+                    step['maximo'] = max(step['maximo'], item['segundos'])
+                    if not item['atendida']:
+                        step['expiradas'] += 1
+
+            for step_name, step in sorted(steps.items(), key=lambda s: s[1]['total'], reverse=True):
+                print(f"  {step_name:<45} {step['total']:7.2f}s em {step['vezes']:>3}x "
+                      f"(média {step['total'] / step['vezes']:.2f}s, máx {step['maximo']:.2f}s, "
+                      f"expiradas {step['expiradas']})")
+            waited = sum(step['total'] for step in steps.values())
+            print(f"  {'(fora das esperas: comandos do Selenium)':<45} {total - waited:7.2f}s")
+
+
+def configure_robot(folder, port, use_selector_cache):
+    """Aponta o robô para o servidor local e para pastas temporárias."""
+    rpa.OUTLOOK_WEB_URL = f"http://127.0.0.1:{port}/mail/inbox"
+    rpa.OUTLOOK_EMAIL = "robo@empresa.teste"
+    rpa.OUTLOOK_PASSWORD = "senha-de-teste"
+    rpa.EMAIL_SUBJECT = EMAIL_SUBJECT
+    rpa.DOWNLOAD_FOLDER = folder / "downloads"
+    rpa.DOWNLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
+    if not use_selector_cache:
+        # Cache de seletores novo: a primeira repetição mede os erros, as seguintes os acertos
+        rpa.selector_resolver = rpa.SelectorResolver(folder / "selector_cache.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede os fluxos do Outlook Web contra um Outlook local.")
+    parser.add_argument("--emails", type=int, default=2, help="Emails não lidos com o assunto")
+    parser.add_argument("--anexos", type=int, default=2, help="Anexos por email recebido")
+    parser.add_argument("--tamanho-anexo-kb", type=int, default=50, help="Tamanho de cada anexo (KB)")
+    parser.add_argument("--envios", type=int, default=2, help="Emails enviados para hospitais")
+    parser.add_argument("--pdfs", type=int, default=2, help="PDFs por email enviado")
+    parser.add_argument("--latencia-ms", type=int, default=0, help="Atraso de cada chamada ao servidor (ms)")
+    parser.add_argument("--limite-por-minuto", type=int, default=None,
+                        help="Envios aceitos por minuto pelo servidor (simula throttling)")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Quantas vezes repetir download e envio")
+    parser.add_argument("--composicao", choices=["interface", "link", "ambos"], default="interface",
+                        help="Novo email pelo botão e campos (interface), pelo link de composição ou os dois")
+    parser.add_argument("--corpo-html", action="store_true",
+                        help="Envia os boletos no corpo do email em HTML, sem anexar os PDFs")
+    parser.add_argument("--com-janela", action="store_true", help="Mostra o navegador (padrão: headless)")
+    parser.add_argument("--cache-seletores", action="store_true",
+                        help="Usa o selector_cache.json do robô em vez de um cache vazio")
+    args = parser.parse_args()
+
+    mailbox = MockMailbox()
+    timer = StepTimer()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        folder = Path(temp_folder)
+        attachments = create_fake_attachments(folder / "anexos", args.anexos, args.tamanho_anexo_kb)
+        for index in range(args.emails):
+            mailbox.add_message(f"{EMAIL_SUBJECT} - Lote {index + 1:02d}", attachments)
+        mailbox.add_message("Outro assunto", attachments)
+
+        server, port = start_mock_outlook_server(mailbox, latency=args.latencia_ms / 1000,
+                                                 send_limit_per_minute=args.limite_por_minuto)
+        configure_robot(folder, port, args.cache_seletores)
+        print(f"Outlook local em {rpa.OUTLOOK_WEB_URL} (latência {args.latencia_ms} ms)")
+
+        driver = rpa.start_browser(headless=not args.com_janela)
+        timer.count_commands(driver)
+        compose_modes = ["interface", "link"] if args.composicao == "ambos" else [args.composicao]
+        rpa.INLINE_BODY_MAX_ROWS = 10 ** 6 if args.corpo_html else 0
+        body_label = " + corpo html" if args.corpo_html else ""
+        try:
+            timer.measure("login_to_outlook", rpa.login_to_outlook, driver)
+
+            # O transporte do Outlook Web reaproveita o navegador já autenticado
+            transport = rpa.OutlookWebTransport()
+            transport.driver = driver
+            rate_controller = rpa.create_send_rate_controller()
+
+            for repetition in range(args.repeticoes):
+                print(f"\n=== REPETIÇÃO {repetition + 1} DE {args.repeticoes} ===")
+                with mailbox.lock:
+                    for item in mailbox.messages:
+                        item['seen'] = False
+                shutil.rmtree(rpa.DOWNLOAD_FOLDER, ignore_errors=True)
+                rpa.DOWNLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
+
+                folders = timer.measure("search_and_download_attachments",
+                                        rpa.search_and_download_attachments, driver)
+                downloaded = sum(len(list(Path(f).glob("*.xlsx"))) for f in folders)
+                if downloaded != args.emails * args.anexos:
+                    failures.append(f"repetição {repetition + 1}: {downloaded} anexos baixados, "
+                                    f"esperados {args.emails * args.anexos}")
+                unread = mailbox.search(unseen=True, subject=EMAIL_SUBJECT)
+                if unread:
+                    failures.append(f"repetição {repetition + 1}: {len(unread)} emails continuaram não lidos")
+
+                sent_before = len(server.sent)
+                for mode in compose_modes:
+                    rpa.COMPOSE_DEEPLINK = mode == "link"
+                    for index in range(args.envios):
+                        hospital_name = f"HOSPITAL TESTE {mode.upper()} {repetition + 1}-{index + 1}"
+                        hospital_emails = {hospital_name: {'to': [f"financeiro{index + 1}@hospital.teste"],
+                                                           'cc': [f"copia{index + 1}@hospital.teste"]}}
+                        pdf_folder = folder / "pdfs" / f"{mode}_{repetition + 1}_{index + 1}"
+                        pdf_folder.mkdir(parents=True, exist_ok=True)
+                        pdf_paths = create_fake_pdfs(pdf_folder, args.pdfs, args.tamanho_anexo_kb)
+                        if args.corpo_html:
+                            register_fake_tables(pdf_paths, hospital_name)
+                        if not timer.measure(f"send_email_with_attachment [{mode}{body_label}]",
+                                             rpa.send_email_with_attachment,
+                                             transport, pdf_paths, hospital_name, hospital_emails, rate_controller):
+                            failures.append(f"envio para {hospital_name} falhou")
+                expected_sent = args.envios * len(compose_modes)
+                if len(server.sent) - sent_before != expected_sent:
+                    failures.append(f"repetição {repetition + 1}: {len(server.sent) - sent_before} emails "
+                                    f"recebidos pelo servidor, esperados {expected_sent}")
+        finally:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            server.shutdown()
+
+    timer.print_summary()
+    rpa.selector_resolver.print_stats()
+    rate_controller.print_summary()
+
+    print(f"\nServidor: {server.downloads} anexos baixados, {len(server.uploads)} uploads, "
+          f"{len(server.sent)} emails enviados, {server.rejected} recusados por throttling")
+    for sent in server.sent:
+        print(f"  {sent['subject']} -> To={', '.join(sent['to'])} Cc={', '.join(sent['cc'])} "
+              f"({len(sent['attachments'])} anexos)")
+
+    if failures:
+        print("\nFALHAS:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    print("\nTodos os fluxos concluídos no Outlook local.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
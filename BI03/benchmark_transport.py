@@ -0,0 +1,132 @@
+"""
+Benchmark dos transportes de email (emails por minuto).
+
+Sobe um servidor SMTP local (aiosmtpd) no lugar do servidor real e compara:
+  - smtp (conexão reaproveitada): uma conexão para todos os emails, como o robô usa
+  - smtp (uma conexão por email): abre e fecha a conexão a cada email
+  - outlook web (opcional, --outlook): envio real pela interface, usando 'infos do robo.xlsx'
+
+Uso:
+    pip install aiosmtpd
+    python benchmark_transport.py --mensagens 50 --anexos 3
+    python benchmark_transport.py --mensagens 3 --outlook --destinatario teste@empresa.com
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import rpa
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class CountingHandler:
+    """Handler do aiosmtpd que só conta os emails recebidos."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def create_fake_pdfs(folder, count, size_kb):
+    """Cria PDFs de mentira com o tamanho pedido para servir de anexo."""
+    paths = []
+    for index in range(count):
+        path = Path(folder) / f"Boletos_Hospital_Teste_{index + 1}.pdf"
+        path.write_bytes(b"%PDF-1.4\n" + os.urandom(size_kb * 1024) + b"\n%%EOF\n")
+        paths.append(path)
+    return paths
+
+
+def build_messages(count, attachments, recipient):
+    return [
+        rpa.OutgoingEmail(
+            to=[recipient],
+            cc=[f"cc{index}@hospital.teste"],
+            subject=f"Boletos em aberto: HOSPITAL TESTE {index + 1}",
+            body=rpa.HOSPITAL_EMAIL_BODY,
+            attachments=attachments
+        )
+        for index in range(count)
+    ]
+
+
+def run_pooled(transport_factory, messages):
+    """Envia todas as mensagens pela mesma conexão."""
+    start = time.perf_counter()
+    with transport_factory() as transport:
+        for message in messages:
+            transport.send(message)
+    return time.perf_counter() - start
+
+
+def run_per_message(transport_factory, messages):
+    """Abre e fecha o transporte a cada mensagem."""
+    start = time.perf_counter()
+    for message in messages:
+        with transport_factory() as transport:
+            transport.send(message)
+    return time.perf_counter() - start
+
+
+def print_result(name, count, elapsed):
+    per_minute = count / (elapsed / 60) if elapsed > 0 else 0
+    print(f"  {name:<35} {count:>4} emails em {elapsed:8.2f}s -> {per_minute:10.1f} emails/min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara a vazão dos transportes de email.")
+    parser.add_argument("--mensagens", type=int, default=20, help="Quantidade de emails por cenário")
+    parser.add_argument("--anexos", type=int, default=2, help="PDFs por email")
+    parser.add_argument("--tamanho-anexo-kb", type=int, default=100, help="Tamanho de cada PDF (KB)")
+    parser.add_argument("--porta", type=int, default=8025, help="Porta do servidor SMTP local")
+    parser.add_argument("--outlook", action="store_true", help="Inclui o envio real pelo Outlook Web")
+    parser.add_argument("--destinatario", default="hospital@hospital.teste", help="Destinatário dos emails")
+    args = parser.parse_args()
+
+    if Controller is None:
+        print("ERRO: aiosmtpd não instalado. Rode: pip install aiosmtpd")
+        return 1
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=args.porta)
+    controller.start()
+
+    def local_smtp():
+        return rpa.SmtpTransport("127.0.0.1", args.porta, starttls=False, sender="robo@hospital.teste")
+
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            attachments = create_fake_pdfs(folder, args.anexos, args.tamanho_anexo_kb)
+            messages = build_messages(args.mensagens, attachments, args.destinatario)
+
+            print(f"\n=== BENCHMARK DE TRANSPORTE ({args.mensagens} emails, "
+                  f"{args.anexos} x {args.tamanho_anexo_kb} KB por email) ===")
+            print_result("smtp (conexão reaproveitada)", len(messages), run_pooled(local_smtp, messages))
+            print_result("smtp (uma conexão por email)", len(messages), run_per_message(local_smtp, messages))
+
+            if args.outlook:
+                if not rpa.load_config_from_excel():
+                    print("ERRO: Não foi possível carregar 'infos do robo.xlsx' para o Outlook Web.")
+                    return 1
+                outlook_messages = messages[:max(1, min(len(messages), 5))]
+                elapsed = run_pooled(lambda: rpa.OutlookWebTransport(headless=rpa.HEADLESS_MODE), outlook_messages)
+                print_result("outlook web (uma sessão)", len(outlook_messages), elapsed)
+
+            print(f"\nEmails recebidos pelo servidor local: {handler.received}")
+    finally:
+        controller.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
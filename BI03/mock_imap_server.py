@@ -0,0 +1,197 @@
+"""
+Servidor IMAP local mínimo para testar a busca de anexos por IMAP sem o servidor real.
+
+Atende somente o que o robô usa: LOGIN, SELECT, UID SEARCH (UNSEEN / SUBJECT),
+UID FETCH (BODY.PEEK[]), UID STORE (+FLAGS \\Seen) e LOGOUT. Aceita qualquer usuário e senha.
+
+Uso:
+    python mock_imap_server.py --assunto "Boletos em Aberto" --anexo planilhas.zip --porta 1143
+
+No 'infos do robo.xlsx': busca de anexos = imap, imap_host = 127.0.0.1, imap_port = 1143, imap_ssl = não.
+"""
+import argparse
+import mimetypes
+import re
+import socketserver
+import threading
+from email.message import EmailMessage
+from pathlib import Path
+
+
+class MockMailbox:
+    """Caixa de entrada em memória: lista de {'uid', 'subject', 'raw', 'seen'}."""
+
+    def __init__(self):
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def add_message(self, subject, attachments, sender="financeiro@empresa.teste", seen=False):
+        message = EmailMessage()
+        message['From'] = sender
+        message['To'] = "robo@empresa.teste"
+        message['Subject'] = subject
+        message.set_content("Segue em anexo.")
+        for attachment_path in attachments:
+            attachment_path = Path(attachment_path)
+            content_type, _ = mimetypes.guess_type(attachment_path.name)
+            maintype, subtype = (content_type or 'application/octet-stream').split('/', 1)
+            message.add_attachment(attachment_path.read_bytes(), maintype=maintype,
+                                   subtype=subtype, filename=attachment_path.name)
+        with self.lock:
+            uid = len(self.messages) + 1
+            self.messages.append({'uid': uid, 'subject': subject, 'raw': message.as_bytes(), 'seen': seen})
+        return uid
+
+    def search(self, unseen=False, subject=None):
+        with self.lock:
+            return [
+                item['uid'] for item in self.messages
+                if (not unseen or not item['seen'])
+                and (subject is None or subject.lower() in item['subject'].lower())
+            ]
+
+    def get(self, uid):
+        with self.lock:
+            return next((item for item in self.messages if item['uid'] == uid), None)
+
+
+def tokenize(arguments):
+    """Separa os argumentos do comando respeitando aspas."""
+    return [quoted if quoted else plain for quoted, plain in re.findall(r'"([^"]*)"|(\S+)', arguments)]
+
+
+class MockImapHandler(socketserver.StreamRequestHandler):
+
+    def send_line(self, text):
+        self.wfile.write(text.encode('utf-8') + b"\r\n")
+
+    def read_command(self):
+        """Lê uma linha de comando, resolvendo literais {N} (usados no assunto em UTF-8)."""
+        line = self.rfile.readline()
+        if not line:
+            return None
+        line = line.rstrip(b"\r\n")
+        while True:
+            match = re.search(rb"\{(\d+)\}$", line)
+            if not match:
+                break
+            self.send_line("+ Ready")
+            literal = self.rfile.read(int(match.group(1)))
+            rest = self.rfile.readline().rstrip(b"\r\n")
+            line = line[:match.start()] + b'"' + literal + b'"' + rest
+        return line.decode('utf-8', errors='replace')
+
+    def handle(self):
+        mailbox = self.server.mailbox
+        self.send_line("* OK [CAPABILITY IMAP4rev1] Mock IMAP pronto")
+
+        while True:
+            line = self.read_command()
+            if line is None:
+                return
+            parts = line.split(' ', 2)
+            if len(parts) < 2:
+                continue
+            tag, command = parts[0], parts[1].upper()
+            arguments = parts[2] if len(parts) > 2 else ''
+
+            if command == 'CAPABILITY':
+                self.send_line("* CAPABILITY IMAP4rev1")
+                self.send_line(f"{tag} OK CAPABILITY completed")
+            elif command in ('LOGIN', 'NOOP'):
+                self.send_line(f"{tag} OK {command} completed")
+            elif command in ('SELECT', 'EXAMINE'):
+                self.send_line(f"* {len(mailbox.messages)} EXISTS")
+                self.send_line("* 0 RECENT")
+                self.send_line("* FLAGS (\\Seen)")
+                self.send_line(f"{tag} OK [READ-WRITE] {command} completed")
+            elif command == 'LOGOUT':
+                self.send_line("* BYE Mock IMAP encerrando")
+                self.send_line(f"{tag} OK LOGOUT completed")
+                return
+            elif command == 'UID':
+                self.handle_uid(tag, arguments, mailbox)
+            else:
+                self.send_line(f"{tag} BAD Comando não suportado")
+
+    def handle_uid(self, tag, arguments, mailbox):
+        subcommand, _, rest = arguments.partition(' ')
+        subcommand = subcommand.upper()
+        tokens = tokenize(rest)
+
+        if subcommand == 'SEARCH':
+            upper_tokens = [token.upper() for token in tokens]
+            subject = None
+            if 'SUBJECT' in upper_tokens:
+                subject = tokens[upper_tokens.index('SUBJECT') + 1]
+            uids = mailbox.search(unseen='UNSEEN' in upper_tokens, subject=subject)
+            self.send_line("* SEARCH" + "".join(f" {uid}" for uid in uids))
+            self.send_line(f"{tag} OK SEARCH completed")
+
+        elif subcommand == 'FETCH':
+            for uid in self.parse_uids(tokens[0]):
+                item = mailbox.get(uid)
+                if item is None:
+                    continue
+                self.wfile.write(f"* {uid} FETCH (UID {uid} BODY[] {{{len(item['raw'])}}}\r\n".encode())
+                self.wfile.write(item['raw'] + b")\r\n")
+                if 'PEEK' not in rest.upper():
+                    item['seen'] = True
+            self.send_line(f"{tag} OK FETCH completed")
+
+        elif subcommand == 'STORE':
+            for uid in self.parse_uids(tokens[0]):
+                item = mailbox.get(uid)
+                if item is None:
+                    continue
+                if '\\SEEN' in rest.upper():
+                    item['seen'] = not tokens[1].startswith('-')
+                flags = "\\Seen" if item['seen'] else ""
+                self.send_line(f"* {uid} FETCH (UID {uid} FLAGS ({flags}))")
+            self.send_line(f"{tag} OK STORE completed")
+
+        else:
+            self.send_line(f"{tag} BAD UID {subcommand} não suportado")
+
+    @staticmethod
+    def parse_uids(uid_set):
+        return [int(uid) for uid in uid_set.split(',') if uid.isdigit()]
+
+
+class MockImapServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, mailbox):
+        super().__init__(address, MockImapHandler)
+        self.mailbox = mailbox
+
+
+def start_mock_imap_server(mailbox, host="127.0.0.1", port=0):
+    """Sobe o servidor em uma thread. Retorna (servidor, porta); encerre com servidor.shutdown()."""
+    server = MockImapServer((host, port), mailbox)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor IMAP local para testes do robô.")
+    parser.add_argument("--assunto", required=True, help="Assunto do email com os anexos")
+    parser.add_argument("--anexo", action="append", default=[], help="Arquivo a anexar (pode repetir)")
+    parser.add_argument("--porta", type=int, default=1143)
+    args = parser.parse_args()
+
+    mailbox = MockMailbox()
+    mailbox.add_message(args.assunto, args.anexo)
+    server = MockImapServer(("127.0.0.1", args.porta), mailbox)
+    print(f"Mock IMAP ouvindo em 127.0.0.1:{args.porta} (Ctrl+C para sair)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,647 @@
+"""
+Outlook Web local mínimo para medir e testar os fluxos do Selenium sem o tenant real.
+
+Serve páginas estáticas com os mesmos elementos que o robô procura:
+  - login: loginfmt -> passwd -> "Stay signed in?" (idBtn_Back)
+  - inbox: div[role=navigation], botão Filter com o menu Unread, lista de emails
+    (div[role=option][data-convid] com span.TtcXM), clique direito > Mark as read
+  - email aberto: assunto, anexos [data-automation-id=attachment], botão Download e Back
+  - novo email: New mail, To, Cc, Subject, Message body, input[type=file], Send e Discard
+  - link de composição: /mail/deeplink/compose?to=&cc=&subject=&body= abre o novo email preenchido
+
+Os emails vêm de uma MockMailbox (a mesma do mock_imap_server.py). Os anexos baixados,
+os uploads e os emails enviados passam pelo servidor, que guarda os enviados em `server.sent`.
+`latency` atrasa cada chamada /api/ para simular um servidor lento e `send_limit_per_minute`
+recusa os envios acima do limite com o aviso "You're sending too many messages" (throttling).
+`heavy_assets` coloca na caixa de entrada essa quantidade de imagens, além de uma fonte, um vídeo e
+uma animação, como o Outlook real; os pedidos de cada tipo ficam em `server.asset_requests`.
+Aceita qualquer usuário e senha.
+
+Uso:
+    python mock_outlook_server.py --assunto "Boletos em Aberto" --anexo planilhas.zip --porta 8030
+
+No robô, aponte OUTLOOK_WEB_URL para http://127.0.0.1:8030/mail/inbox
+(o benchmark_outlook_mock.py faz isso sozinho).
+"""
+import argparse
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from email import message_from_bytes, policy as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from mock_imap_server import MockMailbox
+
+SESSION_COOKIE = "mock_outlook_session"
+
+LOGIN_HTML = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Sign in to your account</title>
+<style>
+body { font-family: Segoe UI, Arial, sans-serif; display: flex; justify-content: center; margin-top: 80px; }
+.card { width: 360px; padding: 32px; border: 1px solid #ddd; }
+.card input { width: 100%; padding: 6px; margin: 12px 0; }
+.hidden { display: none; }
+</style></head>
+<body><div class="card">
+  <div id="emailStep"><div>Sign in</div><input name="loginfmt" type="email" aria-label="Email"></div>
+  <div id="passwordStep" class="hidden"><div>Enter password</div><input name="passwd" type="password" aria-label="Password"></div>
+  <div id="staySignedIn" class="hidden"><div>Stay signed in?</div>
+    <button id="idBtn_Back" type="button">No</button> <button id="idSIButton9" type="button">Yes</button></div>
+</div>
+<script>
+const emailInput = document.querySelector("input[name='loginfmt']");
+const passwordInput = document.querySelector("input[name='passwd']");
+function show(id) {
+  for (const step of ['emailStep', 'passwordStep', 'staySignedIn'])
+    document.getElementById(step).classList.toggle('hidden', step !== id);
+}
+emailInput.addEventListener('keydown', event => {
+  if (event.key !== 'Enter' || !emailInput.value) return;
+  show('passwordStep');
+  passwordInput.focus();
+});
+passwordInput.addEventListener('keydown', async event => {
+  if (event.key !== 'Enter' || !passwordInput.value) return;
+  await fetch('/api/login', {method: 'POST', body: JSON.stringify({user: emailInput.value})});
+  show('staySignedIn');
+});
+for (const id of ['idBtn_Back', 'idSIButton9'])
+  document.getElementById(id).addEventListener('click', () => { location.href = '/mail/inbox'; });
+emailInput.focus();
+</script>
+</body></html>
+"""
+
+APP_HTML = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Mail - Outlook</title>
+<style>
+body { font-family: Segoe UI, Arial, sans-serif; margin: 0; }
+#topbar { padding: 8px; background: #0f6cbd; }
+#app { display: flex; }
+nav { width: 180px; padding: 8px; border-right: 1px solid #ddd; min-height: 600px; }
+#main { flex: 1; padding: 8px; }
+.listItem { padding: 8px; border-bottom: 1px solid #eee; cursor: pointer; }
+.listItem.unread { font-weight: bold; }
+.menu { position: absolute; background: #fff; border: 1px solid #999; z-index: 10; }
+.menu button { display: block; width: 100%; text-align: left; padding: 6px 16px; border: 0; background: #fff; }
+.card { display: inline-block; border: 1px solid #ccc; padding: 6px; margin: 4px; cursor: pointer; }
+.card.selected { border-color: #0f6cbd; }
+.chip { border: 1px solid #8ab; border-radius: 8px; padding: 0 4px; margin-right: 4px; }
+.chip.invalid { border-color: #c33; color: #c33; }
+#compose { position: fixed; right: 16px; bottom: 16px; width: 560px; background: #fff; border: 1px solid #999; padding: 8px; }
+.field { border: 1px solid #ccc; min-height: 22px; margin: 4px 0; padding: 2px; }
+#subjectField { width: 100%; margin: 4px 0; }
+#fileInput { position: absolute; left: -9999px; }
+.hidden { display: none !important; }
+</style></head>
+<body>
+<div id="topbar"><button type="button" id="newMail" aria-label="New mail"><span>New mail</span></button></div>
+<div id="app">
+  <nav role="navigation" aria-label="Folders"><div>Inbox</div><div>Sent Items</div></nav>
+  <div id="main">
+    <div id="listView">
+      <div><b>Inbox</b> <button type="button" id="filterButton" aria-label="Filter"><i data-icon-name="Filter">&#9660;</i></button></div>
+      <div id="filterMenu" class="menu hidden" role="menu">
+        <button type="button" role="menuitem" data-filter="all" aria-label="All"><span>All</span></button>
+        <button type="button" role="menuitem" data-filter="unread" aria-label="Unread"><span>Unread</span></button>
+      </div>
+      <div id="messageList" role="listbox"></div>
+    </div>
+    <div id="readingPane" class="hidden">
+      <button type="button" id="backButton" aria-label="Back">&#8592;</button>
+      <h2 id="readingSubject" data-automation-id="subject"></h2>
+      <div id="readingFrom"></div>
+      <div id="attachmentWell"></div>
+      <div id="attachmentToolbar" class="hidden">
+        <button type="button" id="downloadButton" aria-label="Download"><span>Download</span></button>
+      </div>
+      <div id="readingBody"></div>
+    </div>
+  </div>
+</div>
+<div id="contextMenu" class="menu hidden" role="menu">
+  <button type="button" role="menuitem" id="markRead"><span>Mark as read</span></button>
+</div>
+<div id="compose" class="hidden">
+  <div id="sendBanner" class="hidden" role="alert"></div>
+  <div>To <div class="field" id="toField" role="textbox" aria-label="To" contenteditable="true"></div></div>
+  <button type="button" id="ccButton" aria-label="Add Cc recipients"><span>Cc</span></button>
+  <div id="ccRow" class="hidden">Cc <div class="field" id="ccField" role="textbox" aria-label="Cc" contenteditable="true"></div></div>
+  <input id="subjectField" type="text" aria-label="Subject" placeholder="Add a subject">
+  <div class="field" id="bodyField" role="textbox" aria-label="Message body" contenteditable="true" style="min-height: 80px"></div>
+  <div id="composeFiles" role="list"></div>
+  <input id="fileInput" type="file" multiple>
+  <button type="button" id="sendButton" aria-label="Send"><span>Send</span></button>
+  <button type="button" id="discardButton" aria-label="Discard"><span>Discard</span></button>
+</div>
+<div id="discardDialog" class="menu hidden" role="dialog" style="top: 200px; left: 40%">
+  <div>Discard message?</div>
+  <button type="button" id="confirmDiscard"><span>Discard</span></button>
+  <button type="button" id="cancelDiscard"><span>Cancel</span></button>
+</div>
+<script>
+const $ = id => document.getElementById(id);
+let unreadOnly = false;
+let openMessage = null;
+let selectedAttachment = null;
+let contextTarget = null;
+let uploads = [];
+
+async function api(path, options) {
+  const response = await fetch(path, options);
+  return response.json();
+}
+
+async function renderList() {
+  const messages = await api('/api/messages' + (unreadOnly ? '?unread=1' : ''));
+  const list = $('messageList');
+  list.innerHTML = '';
+  for (const message of messages) {
+    const row = document.createElement('div');
+    row.className = 'listItem' + (message.unread ? ' unread' : '');
+    row.setAttribute('role', 'option');
+    row.dataset.convid = message.id;
+    const sender = document.createElement('span');
+    sender.textContent = message.sender + ' ';
+    const subject = document.createElement('span');
+    subject.className = 'TtcXM';
+    subject.textContent = message.subject;
+    row.append(sender, subject);
+    row.addEventListener('click', () => openReadingPane(message.id));
+    row.addEventListener('contextmenu', event => {
+      event.preventDefault();
+      contextTarget = message.id;
+      const menu = $('contextMenu');
+      menu.style.left = event.pageX + 'px';
+      menu.style.top = event.pageY + 'px';
+      menu.classList.remove('hidden');
+    });
+    list.append(row);
+  }
+}
+
+async function openReadingPane(id) {
+  const message = await api('/api/messages/' + encodeURIComponent(id));
+  openMessage = message;
+  selectedAttachment = null;
+  $('readingSubject').textContent = message.subject;
+  $('readingFrom').textContent = message.sender;
+  $('readingBody').textContent = message.body;
+  const well = $('attachmentWell');
+  well.innerHTML = '';
+  for (const attachment of message.attachments) {
+    const card = document.createElement('div');
+    card.className = 'card';
+    card.dataset.automationId = 'attachment';
+    card.title = attachment.name;
+    card.textContent = attachment.name;
+    card.addEventListener('click', () => {
+      for (const other of well.children) other.classList.remove('selected');
+      card.classList.add('selected');
+      selectedAttachment = attachment;
+      $('attachmentToolbar').classList.remove('hidden');
+    });
+    well.append(card);
+  }
+  $('attachmentToolbar').classList.add('hidden');
+  $('listView').classList.add('hidden');
+  $('readingPane').classList.remove('hidden');
+}
+
+$('filterButton').addEventListener('click', () => $('filterMenu').classList.toggle('hidden'));
+for (const item of document.querySelectorAll('#filterMenu button')) {
+  item.addEventListener('click', async () => {
+    unreadOnly = item.dataset.filter === 'unread';
+    $('filterMenu').classList.add('hidden');
+    await renderList();
+  });
+}
+
+$('backButton').addEventListener('click', async () => {
+  openMessage = null;
+  $('readingPane').classList.add('hidden');
+  $('listView').classList.remove('hidden');
+  await renderList();
+});
+
+$('downloadButton').addEventListener('click', () => {
+  if (!openMessage || !selectedAttachment) return;
+  const link = document.createElement('a');
+  link.href = '/api/messages/' + encodeURIComponent(openMessage.id) + '/attachments/' + selectedAttachment.index;
+  link.download = selectedAttachment.name;
+  document.body.append(link);
+  link.click();
+  link.remove();
+});
+
+$('markRead').addEventListener('click', async () => {
+  $('contextMenu').classList.add('hidden');
+  if (contextTarget === null) return;
+  await api('/api/messages/' + encodeURIComponent(contextTarget) + '/read', {method: 'POST'});
+  contextTarget = null;
+  await renderList();
+});
+document.addEventListener('click', event => {
+  if (!$('contextMenu').contains(event.target)) $('contextMenu').classList.add('hidden');
+});
+
+function resetCompose() {
+  for (const id of ['toField', 'ccField', 'bodyField', 'composeFiles']) $(id).innerHTML = '';
+  $('subjectField').value = '';
+  $('fileInput').value = '';
+  $('ccRow').classList.add('hidden');
+  $('sendBanner').classList.add('hidden');
+  uploads = [];
+}
+
+$('newMail').addEventListener('click', () => {
+  resetCompose();
+  $('compose').classList.remove('hidden');
+  $('toField').focus();
+});
+$('ccButton').addEventListener('click', () => {
+  $('ccRow').classList.remove('hidden');
+  $('ccField').focus();
+});
+
+// Destinatários: cada endereço seguido de ';' ou ',' vira um chip (com erro se não parecer um email)
+function chipify(field) {
+  const textNodes = Array.from(field.childNodes).filter(node => node.nodeType === Node.TEXT_NODE);
+  const raw = textNodes.map(node => node.textContent).join('');
+  if (!/[;,]/.test(raw)) return;
+  const parts = raw.split(/[;,]/);
+  const rest = parts.pop();
+  textNodes.forEach(node => node.remove());
+  for (const address of parts.map(part => part.trim()).filter(Boolean)) {
+    const chip = document.createElement('span');
+    chip.setAttribute('role', 'listitem');
+    chip.contentEditable = 'false';
+    chip.className = 'chip';
+    chip.title = address;
+    chip.dataset.address = address;
+    if (!/^[^@\s]+@[^@\s]+\.[^@\s]+$/.test(address)) {
+      chip.classList.add('invalid');
+      chip.setAttribute('aria-invalid', 'true');
+    }
+    const name = document.createElement('span');
+    name.textContent = address;
+    const remove = document.createElement('button');
+    remove.type = 'button';
+    remove.setAttribute('aria-label', 'Remove ' + address);
+    remove.addEventListener('click', () => chip.remove());
+    chip.append(name, remove);
+    field.append(chip);
+  }
+  field.append(document.createTextNode(rest.trimStart()));
+  const range = document.createRange();
+  range.selectNodeContents(field);
+  range.collapse(false);
+  window.getSelection().removeAllRanges();
+  window.getSelection().addRange(range);
+}
+for (const id of ['toField', 'ccField']) $(id).addEventListener('input', () => chipify($(id)));
+
+function recipients(field) {
+  const chips = Array.from(field.querySelectorAll('[role=listitem]')).map(chip => chip.dataset.address);
+  const typed = Array.from(field.childNodes).filter(node => node.nodeType === Node.TEXT_NODE)
+    .map(node => node.textContent).join('');
+  return chips.concat([typed]).join(';');
+}
+
+$('fileInput').addEventListener('change', () => {
+  for (const file of $('fileInput').files) {
+    const chip = document.createElement('div');
+    chip.setAttribute('role', 'listitem');
+    chip.title = file.name;
+    const name = document.createElement('span');
+    name.textContent = file.name;
+    const progress = document.createElement('span');
+    progress.setAttribute('role', 'progressbar');
+    progress.textContent = ' ...';
+    chip.append(name, progress);
+    $('composeFiles').append(chip);
+    uploads.push(fetch('/api/upload', {
+      method: 'POST', body: file, headers: {'X-File-Name': encodeURIComponent(file.name)}
+    }).then(() => { progress.remove(); return file.name; }));
+  }
+});
+
+$('sendButton').addEventListener('click', async () => {
+  const attachments = await Promise.all(uploads);
+  const response = await fetch('/api/send', {method: 'POST', body: JSON.stringify({
+    to: recipients($('toField')),
+    cc: recipients($('ccField')),
+    subject: $('subjectField').value,
+    body: $('bodyField').innerText,
+    attachments: attachments
+  })});
+  if (!response.ok) {
+    // Throttling: o email fica na janela de composição com o aviso
+    $('sendBanner').textContent = (await response.json()).erro;
+    $('sendBanner').classList.remove('hidden');
+    return;
+  }
+  resetCompose();
+  $('compose').classList.add('hidden');
+});
+
+$('discardButton').addEventListener('click', () => $('discardDialog').classList.remove('hidden'));
+$('cancelDiscard').addEventListener('click', () => $('discardDialog').classList.add('hidden'));
+$('confirmDiscard').addEventListener('click', () => {
+  $('discardDialog').classList.add('hidden');
+  resetCompose();
+  $('compose').classList.add('hidden');
+});
+
+// Link de composição (/mail/deeplink/compose?to=&cc=&subject=&body=): novo email já preenchido
+if (location.pathname.endsWith('/deeplink/compose')) {
+  const params = new URLSearchParams(location.search);
+  resetCompose();
+  $('toField').textContent = (params.get('to') || '') + ';';
+  chipify($('toField'));
+  if (params.get('cc')) {
+    $('ccField').textContent = params.get('cc') + ';';
+    chipify($('ccField'));
+    $('ccRow').classList.remove('hidden');
+  }
+  $('subjectField').value = params.get('subject') || '';
+  $('bodyField').innerText = params.get('body') || '';
+  $('compose').classList.remove('hidden');
+}
+
+renderList();
+</script>
+</body></html>
+"""
+
+
+def split_addresses(text):
+    """Separa os endereços digitados nos campos To/Cc (vírgula, ponto e vírgula ou quebra de linha)."""
+    return [address.strip() for address in re.split(r"[,;\s]+", text or '') if address.strip()]
+
+
+def parse_mailbox_message(item):
+    """Converte um item da MockMailbox em (metadados, lista de anexos (nome, tipo, bytes))."""
+    message = message_from_bytes(item['raw'], policy=email_policy.default)
+    attachments = [
+        (part.get_filename() or f"anexo_{index + 1}", part.get_content_type(), part.get_payload(decode=True) or b"")
+        for index, part in enumerate(message.iter_attachments())
+    ]
+    body_part = message.get_body(preferencelist=('plain', 'html'))
+    summary = {
+        'id': f"conv-{item['uid']}",
+        'subject': item['subject'],
+        'sender': str(message['From'] or ''),
+        'unread': not item['seen'],
+        'body': body_part.get_content().strip() if body_part else '',
+    }
+    return summary, attachments
+
+
+ASSET_IMAGE_SIZE = 512
+
+
+def solid_png(width, height, rgb):
+    """PNG válido de uma cor só (pequeno para baixar, mas ocupa width*height*4 bytes ao ser desenhado)."""
+    raw = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+def heavy_assets_html(count):
+    """Imagens, fonte, vídeo e animação acrescentados à caixa de entrada (fora dos elementos do robô)."""
+    images = "".join(f'<img src="/assets/imagem-{index}.png" width="64" height="64" alt="">' for index in range(count))
+    return ('<style>@font-face { font-family: MockFont; src: url(/assets/fonte.woff2) format("woff2"); }'
+            '@keyframes mockSpin { to { transform: rotate(360deg); } }'
+            '.mockAssets { font-family: MockFont, sans-serif; } .mockAssets img { animation: mockSpin 2s linear infinite; }'
+            '</style><div class="mockAssets" aria-hidden="true">' + images
+            + '<video src="/assets/video.webm" autoplay muted loop width="64" height="64"></video></div>')
+
+
+class MockOutlookHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_body(status, body, "application/json; charset=utf-8", headers)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b""
+
+    def logged_in(self):
+        return f"{SESSION_COOKIE}=1" in (self.headers.get('Cookie') or '')
+
+    def find_message(self, conversation_id):
+        if not conversation_id.startswith("conv-") or not conversation_id[5:].isdigit():
+            return None
+        return self.server.mailbox.get(int(conversation_id[5:]))
+
+    def api_delay(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+
+        if parts[0] == 'mail':
+            page = APP_HTML if self.logged_in() else LOGIN_HTML
+            if self.logged_in() and self.server.heavy_assets:
+                page = page.replace("</body>", heavy_assets_html(self.server.heavy_assets) + "</body>")
+            self.send_body(200, page.encode('utf-8'), "text/html; charset=utf-8")
+            return
+        if parts[0] == 'assets' and len(parts) == 2:
+            self.send_asset(parts[1])
+            return
+        if parts[0] != 'api':
+            self.send_body(302, b"", "text/plain", {"Location": "/mail/inbox"})
+            return
+
+        self.api_delay()
+        mailbox = self.server.mailbox
+
+        if parts[1:] == ['messages']:
+            unread_only = parse_qs(url.query).get('unread') == ['1']
+            summaries = [parse_mailbox_message(mailbox.get(uid))[0] for uid in mailbox.search(unseen=unread_only)]
+            self.send_json([{key: summary[key] for key in ('id', 'subject', 'sender', 'unread')}
+                            for summary in reversed(summaries)])
+
+        elif len(parts) == 3 and parts[1] == 'messages':
+            item = self.find_message(parts[2])
+            if item is None:
+                self.send_json({'erro': 'email não encontrado'}, 404)
+                return
+            summary, attachments = parse_mailbox_message(item)
+            summary['attachments'] = [{'index': index, 'name': name, 'size': len(data)}
+                                      for index, (name, _, data) in enumerate(attachments)]
+            self.send_json(summary)
+
+        elif len(parts) == 5 and parts[1] == 'messages' and parts[3] == 'attachments':
+            item = self.find_message(parts[2])
+            attachments = parse_mailbox_message(item)[1] if item else []
+            index = int(parts[4]) if parts[4].isdigit() else -1
+            if not 0 <= index < len(attachments):
+                self.send_json({'erro': 'anexo não encontrado'}, 404)
+                return
+            name, content_type, data = attachments[index]
+            with self.server.lock:
+                self.server.downloads += 1
+            self.send_body(200, data, content_type,
+                           {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(name)}"})
+
+        elif parts[1:] == ['sent']:
+            with self.server.lock:
+                self.send_json(list(self.server.sent))
+
+        else:
+            self.send_json({'erro': 'rota não encontrada'}, 404)
+
+    def send_asset(self, name):
+        """Imagem, fonte ou vídeo da caixa de entrada (conteúdo de mentira, exceto as imagens)."""
+        kind = {'.png': 'imagens', '.woff2': 'fontes', '.webm': 'videos'}.get(os.path.splitext(name)[1])
+        if kind is None:
+            self.send_body(404, b"", "text/plain")
+            return
+        with self.server.lock:
+            self.server.asset_requests[kind] = self.server.asset_requests.get(kind, 0) + 1
+        if kind == 'imagens':
+            shade = sum(name.encode()) % 200
+            body = solid_png(ASSET_IMAGE_SIZE, ASSET_IMAGE_SIZE, (shade, 100, 255 - shade))
+            self.send_body(200, body, "image/png", {"Cache-Control": "no-store"})
+        else:
+            content_type = "font/woff2" if kind == 'fontes' else "video/webm"
+            self.send_body(200, os.urandom(200 * 1024), content_type, {"Cache-Control": "no-store"})
+
+    def do_POST(self):
+        parts = [unquote(part) for part in urlparse(self.path).path.strip('/').split('/')]
+        body = self.read_body()
+        self.api_delay()
+
+        if parts == ['api', 'login']:
+            self.send_json({'ok': True}, headers={"Set-Cookie": f"{SESSION_COOKIE}=1; Path=/"})
+
+        elif len(parts) == 4 and parts[:2] == ['api', 'messages'] and parts[3] == 'read':
+            item = self.find_message(parts[2])
+            if item is None:
+                self.send_json({'erro': 'email não encontrado'}, 404)
+                return
+            with self.server.mailbox.lock:
+                item['seen'] = True
+            self.send_json({'ok': True})
+
+        elif parts == ['api', 'upload']:
+            with self.server.lock:
+                self.server.uploads.append({'nome': unquote(self.headers.get('X-File-Name') or ''), 'bytes': len(body)})
+            self.send_json({'ok': True})
+
+        elif parts == ['api', 'send']:
+            if self.server.throttled():
+                self.send_json({'erro': "You're sending too many messages. Try again later."}, 429)
+                return
+            data = json.loads(body.decode('utf-8') or '{}')
+            sent = {
+                'to': split_addresses(data.get('to')),
+                'cc': split_addresses(data.get('cc')),
+                'subject': data.get('subject', ''),
+                'body': data.get('body', ''),
+                'attachments': list(data.get('attachments') or []),
+            }
+            with self.server.lock:
+                self.server.sent.append(sent)
+            self.send_json({'ok': True})
+
+        else:
+            self.send_json({'erro': 'rota não encontrada'}, 404)
+
+
+class MockOutlookServer(ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, mailbox, latency=0.0, send_limit_per_minute=None, heavy_assets=0):
+        super().__init__(address, MockOutlookHandler)
+        self.mailbox = mailbox
+        self.latency = latency
+        self.send_limit_per_minute = send_limit_per_minute
+        self.heavy_assets = heavy_assets
+        self.asset_requests = {}
+        self.lock = threading.Lock()
+        self.sent = []
+        self.uploads = []
+        self.downloads = 0
+        self.rejected = 0
+        self._send_times = []
+
+    def throttled(self):
+        """Registra a tentativa de envio; True se ela passa do limite por minuto."""
+        if not self.send_limit_per_minute:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self._send_times = [moment for moment in self._send_times if now - moment < 60]
+            if len(self._send_times) >= self.send_limit_per_minute:
+                self.rejected += 1
+                return True
+            self._send_times.append(now)
+            return False
+
+
+def start_mock_outlook_server(mailbox, host="127.0.0.1", port=0, latency=0.0, send_limit_per_minute=None,
+                              heavy_assets=0):
+    """Sobe o servidor em uma thread. Retorna (servidor, porta); encerre com servidor.shutdown()."""
+    server = MockOutlookServer((host, port), mailbox, latency, send_limit_per_minute, heavy_assets)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Outlook Web local para testes do robô.")
+    parser.add_argument("--assunto", required=True, help="Assunto do email com os anexos")
+    parser.add_argument("--anexo", action="append", default=[], help="Arquivo a anexar (pode repetir)")
+    parser.add_argument("--emails", type=int, default=1, help="Quantidade de emails não lidos com o assunto")
+    parser.add_argument("--latencia-ms", type=int, default=0, help="Atraso de cada chamada ao servidor (ms)")
+    parser.add_argument("--limite-por-minuto", type=int, default=None, help="Envios aceitos por minuto (throttling)")
+    parser.add_argument("--recursos", type=int, default=0,
+                        help="Imagens na caixa de entrada (mais uma fonte, um vídeo e uma animação)")
+    parser.add_argument("--porta", type=int, default=8030)
+    args = parser.parse_args()
+
+    mailbox = MockMailbox()
+    for _ in range(args.emails):
+        mailbox.add_message(args.assunto, args.anexo)
+    server = MockOutlookServer(("127.0.0.1", args.porta), mailbox, args.latencia_ms / 1000, args.limite_por_minuto,
+                               args.recursos)
+    print(f"Mock Outlook em http://127.0.0.1:{args.porta}/mail/inbox (Ctrl+C para sair)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for sent in server.sent:
+            print(f"  Enviado: {sent['subject']} -> {', '.join(sent['to'])} ({len(sent['attachments'])} anexos)")
+
+
+if __name__ == "__main__":
+    main()
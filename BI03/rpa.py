@@ -1,13 +1,32 @@
 import time
 import sys
 import io
-import pyautogui
+import os
+import subprocess
 import shutil
 import pandas as pd  
 import zipfile
+import json
+import sqlite3
+import argparse
+import threading
+import queue
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 import unicodedata
 import re 
+import hashlib
+import statistics
+import html
+import smtplib
+import imaplib
+import ssl
+import mimetypes
+from email import message_from_bytes, policy as email_policy
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
 from pathlib import Path
+from urllib.parse import urlencode, quote
 from dotenv import load_dotenv
 from openpyxl import load_workbook
 from selenium import webdriver
@@ -18,11 +37,12 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.support import expected_conditions as EC
+from urllib3.exceptions import TimeoutError as HttpTimeoutError
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Configurar encoding para UTF-8 para evitar problemas com caracteres especiais
 if sys.stdout.encoding != 'UTF-8':
@@ -209,6 +229,46 @@ def group_pdfs_by_hospital(pdf_files):
     
     return final_grouping
 
+def recipient_set_key(hospital_email_data):
+    """Chave do conjunto de destinatários (To e Cc, sem diferença de maiúsculas nem de ordem)."""
+    return (tuple(sorted({address.strip().lower() for address in hospital_email_data['to']})),
+            tuple(sorted({address.strip().lower() for address in hospital_email_data['cc']})))
+
+def coalesce_hospitals_by_recipients(hospital_pdfs, hospital_emails):
+    """
+    Junta em uma única mensagem os hospitais com exatamente os mesmos destinatários (To e Cc),
+    como filiais de um mesmo grupo. O grupo recebe o nome 'HOSPITAL A + HOSPITAL B', todos os PDFs
+    e, nos dados de email, a lista 'hospitais' usada para montar uma seção por hospital no corpo.
+    Retorna (PDFs por mensagem, relação de emails com as entradas dos grupos).
+    """
+    groups = {}
+    for hospital_name, pdf_paths in hospital_pdfs.items():
+        hospital_email_data = find_hospital_email(hospital_name, hospital_emails)
+        # Sem email na planilha: segue sozinho (o envio registra o erro)
+        key = recipient_set_key(hospital_email_data) if hospital_email_data else ('sem email', hospital_name)
+        groups.setdefault(key, []).append((hospital_name, pdf_paths))
+    
+    message_pdfs = {}
+    message_emails = dict(hospital_emails)
+    for members in groups.values():
+        if len(members) == 1:
+            hospital_name, pdf_paths = members[0]
+            message_pdfs[hospital_name] = pdf_paths
+            continue
+        
+        group_name = " + ".join(hospital_name for hospital_name, _ in members)
+        hospital_email_data = find_hospital_email(members[0][0], hospital_emails)
+        message_emails[group_name] = {
+            'to': hospital_email_data['to'],
+            'cc': hospital_email_data['cc'],
+            'hospitais': [(hospital_name, list(pdf_paths)) for hospital_name, pdf_paths in members],
+        }
+        message_pdfs[group_name] = [pdf_path for _, pdf_paths in members for pdf_path in pdf_paths]
+        print(f"Mesmos destinatários: {group_name} -> uma mensagem com {len(message_pdfs[group_name])} PDFs")
+    
+    print(f"{len(hospital_pdfs)} hospitais em {len(message_pdfs)} mensagens (uma por conjunto de destinatários)")
+    return message_pdfs, message_emails
+
 # ================== CONFIGURAÇÕES ==================
 load_dotenv()
 
@@ -216,6 +276,7 @@ load_dotenv()
 BASE_DIR = Path.cwd()  # Pasta BI03
 DOWNLOAD_FOLDER = BASE_DIR / "downloads"
 PROCESSED_FOLDER = BASE_DIR / "boletos_pdf"
+CHECKPOINT_FOLDER = BASE_DIR / "checkpoints"  # Tabelas lidas das planilhas (retomada por etapa)
 
 # Caminho do arquivo de configurações - DINÂMICO
 def find_config_excel_path():
@@ -258,16 +319,113 @@ LOG_AUTOMATION_EMAIL = None
 EMAILS_EXCEL_PATH = None
 OUTLOOK_EMAIL = None
 OUTLOOK_PASSWORD = None
+CHROMEDRIVER_PATH = None  # Opcional: chromedriver fixado manualmente
+HEADLESS_MODE = False  # Opcional: executa o Chrome sem janela visível
+LIGHT_CHROME_PROFILE = False  # Opcional: Chrome sem imagens, mídia, fontes baixadas, extensões e GPU
+SEND_CONCURRENCY = 1  # Opcional: quantas sessões do Outlook enviam emails ao mesmo tempo
+MAIL_TRANSPORT = 'outlook'  # Opcional: 'outlook' (interface web) ou 'smtp'
+SMTP_HOST = 'smtp.office365.com'
+SMTP_PORT = 587
+SMTP_USER = None  # Padrão: email_user
+SMTP_PASSWORD = None  # Padrão: email_pass
+SMTP_STARTTLS = True
+FETCH_BACKEND = 'outlook'  # Opcional: busca dos anexos pela interface ('outlook') ou por 'imap'
+IMAP_HOST = 'outlook.office365.com'
+IMAP_PORT = 993
+IMAP_USER = None  # Padrão: email_user
+IMAP_PASSWORD = None  # Padrão: email_pass
+IMAP_SSL = True
+PIPELINE_MODE = True  # Opcional: etapas sobrepostas (pipeline) ou uma depois da outra
+SEND_MIN_INTERVAL = 1  # Opcional: menor intervalo entre emails quando o servidor está saudável (segundos)
+SEND_MAX_INTERVAL = 300  # Opcional: maior intervalo entre emails durante o throttling (segundos)
+COMPOSE_DEEPLINK = False  # Opcional: abre o novo email por link com To, Cc, assunto e corpo preenchidos
+COALESCE_RECIPIENTS = False  # Opcional: um email só para os hospitais com os mesmos destinatários
+INLINE_BODY_MAX_ROWS = 0  # Opcional: até quantos boletos a tabela vai no corpo do email, sem anexo (0 = sempre anexa)
+RECYCLE_EVERY_EMAILS = 100  # Opcional: reabre o navegador de envio (com novo login) a cada N emails (0 = nunca)
+CHROME_MAX_MEMORY_MB = 2048  # Opcional: reabre o navegador quando a memória do Chrome passa disso (0 = sem limite; requer psutil)
+WEBDRIVER_CALL_TIMEOUT = 120  # Opcional: tempo máximo de cada comando ao navegador (segundos)
+STANDBY_SESSIONS = 0  # Opcional: navegadores reserva já logados para trocar na hora uma sessão de envio (0 = nenhum)
+ATTACHMENT_BUDGET_MB = 20  # Opcional: tamanho máximo dos anexos de um email; acima disso, emails numerados (0 = sem limite)
+SEND_DEADLINE = None  # Opcional: horário (HH:MM) a partir do qual nenhum email começa; o resto fica para a próxima execução
 DEFAULT_WAIT_TIME = 3
 
-# Variável global para armazenar o status dos envios
-email_status_report = []
+# Pasta com os chromedrivers em cache, um por versão principal do Chrome
+DRIVER_CACHE_FOLDER = BASE_DIR / "drivers"
+
+class EmailStatusCollector:
+    """
+    Armazena o status dos envios de forma segura entre threads.
+    Pode ser percorrido como uma lista de dicionários {'hospital', 'arquivo', 'situacao'}.
+    """
+    
+    def __init__(self):
+        self._items = []
+        self._lock = threading.Lock()
+    
+    def add(self, hospital, arquivo, situacao):
+        """Registra o status de um envio."""
+        with self._lock:
+            self._items.append({
+                'hospital': hospital,
+                'arquivo': arquivo,
+                'situacao': situacao
+            })
+    
+    def snapshot(self):
+        """Retorna uma cópia dos status registrados até agora."""
+        with self._lock:
+            return list(self._items)
+    
+    def __iter__(self):
+        return iter(self.snapshot())
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+    
+    def counts(self):
+        """
+        Quantos envios saíram, quantos ficaram para a próxima execução (horário limite) e quantos
+        deram erro: {'enviados', 'adiados', 'erros'}.
+        """
+        items = self.snapshot()
+        enviados = sum(1 for item in items if item['situacao'] == 'Enviado')
+        adiados = sum(1 for item in items if item['situacao'] == DEFERRED_STATUS)
+        return {'enviados': enviados, 'adiados': adiados, 'erros': len(items) - enviados - adiados}
+
+# Situação dos hospitais deixados para a próxima execução pelo horário limite (não é erro)
+DEFERRED_STATUS = 'Adiado - horário limite do envio'
+
+# Status de todos os envios (compartilhado entre as sessões de envio)
+email_status_report = EmailStatusCollector()
+
+def parse_bool_config(value, default=False):
+    """Interpreta valores de configuração do tipo sim/não."""
+    if value is None or str(value).strip() == '':
+        return default
+    return remove_accents(str(value)).strip().lower() in ('sim', 's', 'true', 'verdadeiro', '1', 'yes', 'x')
+
+def parse_int_config(value, default, minimum=None):
+    """Interpreta valores numéricos inteiros da configuração."""
+    try:
+        number = int(float(str(value).strip().replace(',', '.')))
+    except (TypeError, ValueError):
+        return default
+    if minimum is not None and number < minimum:
+        return minimum
+    return number
 
 def load_config_from_excel():
     """
     Carrega as configurações do arquivo Excel.
     """
     global EMAIL_SUBJECT, PDF_FOLDER_PATH, LOG_AUTOMATION_EMAIL, EMAILS_EXCEL_PATH, OUTLOOK_EMAIL, OUTLOOK_PASSWORD
+    global CHROMEDRIVER_PATH, HEADLESS_MODE, LIGHT_CHROME_PROFILE, SEND_CONCURRENCY
+    global MAIL_TRANSPORT, SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_STARTTLS
+    global FETCH_BACKEND, IMAP_HOST, IMAP_PORT, IMAP_USER, IMAP_PASSWORD, IMAP_SSL, PIPELINE_MODE
+    global SEND_MIN_INTERVAL, SEND_MAX_INTERVAL, COMPOSE_DEEPLINK, COALESCE_RECIPIENTS, INLINE_BODY_MAX_ROWS
+    global ATTACHMENT_BUDGET_MB, SEND_DEADLINE, RECYCLE_EVERY_EMAILS, CHROME_MAX_MEMORY_MB, WEBDRIVER_CALL_TIMEOUT
+    global STANDBY_SESSIONS
     
     try:
         if not CONFIG_EXCEL_PATH.exists():
@@ -313,6 +471,45 @@ def load_config_from_excel():
         # Converte caminho para Path object
         PDF_FOLDER_PATH = Path(PDF_FOLDER_PATH)
         
+        # Configurações opcionais
+        chromedriver_path = config_dict.get('caminho do chromedriver', '')
+        CHROMEDRIVER_PATH = Path(chromedriver_path) if chromedriver_path else None
+        HEADLESS_MODE = parse_bool_config(config_dict.get('modo headless', ''), default=False)
+        LIGHT_CHROME_PROFILE = parse_bool_config(config_dict.get('perfil leve do chrome', ''), default=False)
+        SEND_CONCURRENCY = parse_int_config(config_dict.get('envios simultaneos', ''), default=1, minimum=1)
+        MAIL_TRANSPORT = remove_accents(config_dict.get('transporte de email', '') or 'outlook').strip().lower()
+        if MAIL_TRANSPORT not in ('outlook', 'smtp'):
+            print(f"AVISO: Transporte de email desconhecido '{MAIL_TRANSPORT}', usando 'outlook'")
+            MAIL_TRANSPORT = 'outlook'
+        SMTP_HOST = config_dict.get('smtp_host', '') or SMTP_HOST
+        SMTP_PORT = parse_int_config(config_dict.get('smtp_port', ''), default=587, minimum=1)
+        SMTP_USER = config_dict.get('smtp_user', '') or OUTLOOK_EMAIL
+        SMTP_PASSWORD = config_dict.get('smtp_pass', '') or OUTLOOK_PASSWORD
+        SMTP_STARTTLS = parse_bool_config(config_dict.get('smtp_starttls', ''), default=True)
+        FETCH_BACKEND = remove_accents(config_dict.get('busca de anexos', '') or 'outlook').strip().lower()
+        if FETCH_BACKEND not in ('outlook', 'imap'):
+            print(f"AVISO: Busca de anexos desconhecida '{FETCH_BACKEND}', usando 'outlook'")
+            FETCH_BACKEND = 'outlook'
+        IMAP_HOST = config_dict.get('imap_host', '') or IMAP_HOST
+        IMAP_SSL = parse_bool_config(config_dict.get('imap_ssl', ''), default=True)
+        IMAP_PORT = parse_int_config(config_dict.get('imap_port', ''), default=993 if IMAP_SSL else 143, minimum=1)
+        IMAP_USER = config_dict.get('imap_user', '') or OUTLOOK_EMAIL
+        IMAP_PASSWORD = config_dict.get('imap_pass', '') or OUTLOOK_PASSWORD
+        PIPELINE_MODE = parse_bool_config(config_dict.get('pipeline em estagios', ''), default=True)
+        SEND_MIN_INTERVAL = parse_int_config(config_dict.get('intervalo minimo entre envios', ''), default=1, minimum=0)
+        SEND_MAX_INTERVAL = parse_int_config(config_dict.get('intervalo maximo entre envios', ''), default=300,
+                                             minimum=max(SEND_MIN_INTERVAL, 1))
+        COMPOSE_DEEPLINK = parse_bool_config(config_dict.get('compor por link', ''), default=False)
+        COALESCE_RECIPIENTS = parse_bool_config(config_dict.get('agrupar hospitais por destinatarios', ''), default=False)
+        INLINE_BODY_MAX_ROWS = parse_int_config(config_dict.get('corpo em html ate linhas', ''), default=0, minimum=0)
+        ATTACHMENT_BUDGET_MB = parse_int_config(config_dict.get('tamanho maximo dos anexos mb', ''), default=20, minimum=0)
+        SEND_DEADLINE = config_dict.get('horario limite do envio', '') or None
+        RECYCLE_EVERY_EMAILS = parse_int_config(config_dict.get('reciclar navegador a cada emails', ''), default=100, minimum=0)
+        CHROME_MAX_MEMORY_MB = parse_int_config(config_dict.get('memoria maxima do chrome mb', ''), default=2048, minimum=0)
+        WEBDRIVER_CALL_TIMEOUT = parse_int_config(config_dict.get('tempo maximo por comando do navegador', ''),
+                                                  default=120, minimum=10)
+        STANDBY_SESSIONS = parse_int_config(config_dict.get('sessoes reserva do navegador', ''), default=0, minimum=0)
+        
         print("Configurações carregadas com sucesso!")
         return True
         
@@ -321,8 +518,8 @@ def load_config_from_excel():
         return False
 
 def clean_folders():
-    """Limpa todas as pastas (downloads e faturas_pdf) antes de iniciar o processo."""
-    folders_to_clean = [DOWNLOAD_FOLDER, PROCESSED_FOLDER]
+    """Limpa todas as pastas (downloads, faturas_pdf e checkpoints) antes de iniciar o processo."""
+    folders_to_clean = [DOWNLOAD_FOLDER, PROCESSED_FOLDER, CHECKPOINT_FOLDER]
     
     for folder in folders_to_clean:
         try:
@@ -350,60 +547,53 @@ def create_folders():
     """Garante que as pastas de downloads e processados existam."""
     DOWNLOAD_FOLDER.mkdir(exist_ok=True)
     PROCESSED_FOLDER.mkdir(exist_ok=True)
+    CHECKPOINT_FOLDER.mkdir(exist_ok=True)
     print("Pastas criadas/verificadas com sucesso")
 
-def extract_zip_files():
+def extract_zip_file(zip_file):
     """
-    Extrai automaticamente todos os arquivos ZIP da pasta de downloads.
+    Extrai um arquivo ZIP e move o conteúdo para a pasta onde o ZIP está
+    (a pasta de downloads do email de origem).
     """
-    print("Verificando arquivos ZIP para extração...")
-    
-    # Procura por arquivos ZIP na pasta de downloads
-    zip_files = list(DOWNLOAD_FOLDER.glob("*.zip"))
-    
-    if not zip_files:
-        print("Nenhum arquivo ZIP encontrado para extrair.")
-        return
-    
-    for zip_file in zip_files:
-        try:
-            print(f"Extraindo arquivo: {zip_file.name}")
-            
-            # Cria uma pasta temporária para extração (opcional)
-            extract_folder = DOWNLOAD_FOLDER / zip_file.stem
-            extract_folder.mkdir(exist_ok=True)
-            
-            # Extrai o arquivo ZIP
-            with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-                zip_ref.extractall(extract_folder)
+    try:
+        print(f"Extraindo arquivo: {zip_file.name}")
+        
+        # Cria uma pasta temporária (oculta) para extração
+        target_folder = zip_file.parent
+        extract_folder = target_folder / f".{zip_file.stem}"
+        extract_folder.mkdir(exist_ok=True)
+        
+        # Extrai o arquivo ZIP
+        with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+            zip_ref.extractall(extract_folder)
+        
+        # Lista os arquivos extraídos
+        extracted_files = list(extract_folder.glob("*"))
+        print(f"Arquivos extraídos de {zip_file.name}:")
+        for file in extracted_files:
+            print(f"  - {file.name}")
             
-            # Lista os arquivos extraídos
-            extracted_files = list(extract_folder.glob("*"))
-            print(f"Arquivos extraídos de {zip_file.name}:")
-            for file in extracted_files:
-                print(f"  - {file.name}")
+            # Move os arquivos extraídos para a pasta do ZIP
+            if file.is_file():
+                destination = target_folder / file.name
+                # Se já existir um arquivo com o mesmo nome, adiciona um sufixo
+                if destination.exists():
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    name_parts = file.stem, file.suffix
+                    destination = target_folder / f"{name_parts[0]}_{timestamp}{name_parts[1]}"
                 
-                # Move os arquivos extraídos para a pasta principal de downloads
-                if file.is_file():
-                    destination = DOWNLOAD_FOLDER / file.name
-                    # Se já existir um arquivo com o mesmo nome, adiciona um sufixo
-                    if destination.exists():
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        name_parts = file.stem, file.suffix
-                        destination = DOWNLOAD_FOLDER / f"{name_parts[0]}_{timestamp}{name_parts[1]}"
-                    
-                    shutil.move(str(file), str(destination))
-                    print(f"    Movido para: {destination.name}")
-            
-            # Remove a pasta temporária de extração
-            shutil.rmtree(extract_folder)
-            
-            print(f"Extração concluída para: {zip_file.name}")
-            
-        except zipfile.BadZipFile:
-            print(f"ERRO: {zip_file.name} não é um arquivo ZIP válido")
-        except Exception as e:
-            print(f"ERRO ao extrair {zip_file.name}: {e}")
+                shutil.move(str(file), str(destination))
+                print(f"    Movido para: {destination.name}")
+        
+        # Remove a pasta temporária de extração
+        shutil.rmtree(extract_folder)
+        
+        print(f"Extração concluída para: {zip_file.name}")
+        
+    except zipfile.BadZipFile:
+        print(f"ERRO: {zip_file.name} não é um arquivo ZIP válido")
+    except Exception as e:
+        print(f"ERRO ao extrair {zip_file.name}: {e}")
 
 def normalize_column_name(col_name):
     """Normaliza nomes de colunas para facilitar o mapeamento."""
@@ -429,57 +619,128 @@ def normalize_column_name(col_name):
             .replace('ô', 'o')
             .replace('ú', 'u'))
 
-def process_excel_files_and_generate_pdfs():
+def find_downloaded_excel_files():
+    """Planilhas baixadas, em todas as subpastas de downloads (ignora pastas temporárias ocultas)."""
+    return sorted(
+        path for pattern in ("*.xlsx", "*.xls") for path in DOWNLOAD_FOLDER.rglob(pattern)
+        if not any(part.startswith('.') for part in path.relative_to(DOWNLOAD_FOLDER).parts)
+    )
+
+def file_sha256(path):
+    """Hash do conteúdo do arquivo (identifica planilhas reenviadas)."""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def parse_excel_file(excel_file):
     """
-    Processa os arquivos Excel extraídos e gera PDFs com o formato específico de cada arquivo.
+    Lê uma planilha de boletos e padroniza conforme o banco.
+    Retorna (dados, tipo) com tipo 'Bradesco' ou 'Itau', ou (None, None) se não reconhecer o arquivo.
     """
-    print("Iniciando processamento dos arquivos Excel...")
-    
-    # Encontra TODOS os arquivos Excel na pasta de downloads
-    excel_files = list(DOWNLOAD_FOLDER.glob("*.xlsx")) + list(DOWNLOAD_FOLDER.glob("*.xls"))
-    
-    if not excel_files:
-        print("Nenhum arquivo Excel encontrado para processar.")
-        return []
+    df = pd.read_excel(excel_file)
     
-    print(f"Arquivos Excel encontrados: {[f.name for f in excel_files]}")
+    if 'bradesco' in excel_file.name.lower():
+        return clean_bradesco_data(df), 'Bradesco'
+    if 'itau' in excel_file.name.lower():
+        return clean_itau_data(df), 'Itau'
     
-    all_pdf_files = []
+    print(f"  AVISO: Tipo de arquivo não reconhecido: {excel_file.name}")
+    return None, None
+
+def save_table_checkpoint(df_clean, excel_file, file_type, file_hash):
+    """Grava a tabela padronizada em CHECKPOINT_FOLDER para uma nova execução não reler a planilha."""
+    CHECKPOINT_FOLDER.mkdir(exist_ok=True)
+    table_path = CHECKPOINT_FOLDER / f"{file_hash[:16]}_{remove_accents(file_type)}.pkl"
+    df_clean.to_pickle(table_path)
+    return {'arquivo': str(excel_file), 'tipo': file_type, 'tabela': str(table_path)}
+
+def parse_excel_files(excel_files):
+    """
+    Lê e padroniza cada planilha (uma vez por conteúdo) e grava a tabela no checkpoint.
+    Retorna a lista de tabelas {'arquivo', 'tipo', 'tabela'} e registra a etapa 'leitura' no manifesto.
+    """
+    tables = []
+    processed_hashes = {}
     
     # Processa CADA arquivo separadamente
     for excel_file in excel_files:
         try:
-            print(f"\nProcessando arquivo: {excel_file.name}")
+            print(f"\nProcessando arquivo: {excel_file.relative_to(DOWNLOAD_FOLDER)}")
             
-            # Lê o arquivo Excel
-            df = pd.read_excel(excel_file)
+            # A mesma planilha reenviada em outro email é processada uma vez só
+            file_hash = file_sha256(excel_file)
+            if file_hash in processed_hashes:
+                print(f"  Ignorado: mesmo conteúdo de {processed_hashes[file_hash].relative_to(DOWNLOAD_FOLDER)}")
+                continue
+            processed_hashes[file_hash] = excel_file
             
-            # Processa conforme o tipo de arquivo
-            if 'bradesco' in excel_file.name.lower():
-                pdf_files = process_bradesco_file(df, excel_file)
-            elif 'itau' in excel_file.name.lower():
-                pdf_files = process_itau_file(df, excel_file)
-            else:
-                print(f"  AVISO: Tipo de arquivo não reconhecido: {excel_file.name}")
+            # Lê e padroniza conforme o tipo de arquivo
+            df_clean, file_type = parse_excel_file(excel_file)
+            if df_clean is None:
                 continue
             
+            tables.append(save_table_checkpoint(df_clean, excel_file, file_type, file_hash))
+            
+        except Exception as e:
+            print(f"ERRO ao processar {excel_file.name}: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    record_stage('leitura', {str(path): file_hash for file_hash, path in processed_hashes.items()},
+                 files_digest(table['tabela'] for table in tables), tabelas=tables)
+    return tables
+
+def render_tables_to_pdfs(tables):
+    """
+    Gera os PDFs de cada tabela lida (parse_excel_files ou checkpoint) e registra a etapa 'pdf' no manifesto.
+    """
+    all_pdf_files = []
+    pdf_digests = {}
+    
+    for table in tables:
+        excel_file = Path(table['arquivo'])
+        try:
+            df_clean = pd.read_pickle(table['tabela'])
+            pdf_files = generate_pdfs_for_file(df_clean, excel_file, table['tipo'])
+            
             if pdf_files:
                 all_pdf_files.extend(pdf_files)
+                # O hash é tirado agora: depois do envio os PDFs são excluídos
+                pdf_digests.update(files_digest(pdf_files))
                 print(f"  PDFs gerados para {excel_file.name}: {len(pdf_files)}")
             else:
                 print(f"  Nenhum PDF gerado para {excel_file.name}")
             
         except Exception as e:
-            print(f"ERRO ao processar {excel_file.name}: {e}")
+            print(f"ERRO ao gerar os PDFs de {excel_file.name}: {e}")
             import traceback
             traceback.print_exc()
     
+    record_stage('pdf', files_digest(table['tabela'] for table in tables), pdf_digests,
+                 prioridades=priorities_for_manifest(all_pdf_files))
+    return all_pdf_files
+
+def process_excel_files_and_generate_pdfs():
+    """
+    Processa os arquivos Excel extraídos e gera PDFs com o formato específico de cada arquivo.
+    """
+    print("Iniciando processamento dos arquivos Excel...")
+    
+    # Encontra TODOS os arquivos Excel na pasta de downloads (inclusive nas subpastas de cada email)
+    excel_files = find_downloaded_excel_files()
+    
+    if not excel_files:
+        print("Nenhum arquivo Excel encontrado para processar.")
+        return []
+    
+    print(f"Arquivos Excel encontrados: {[str(f.relative_to(DOWNLOAD_FOLDER)) for f in excel_files]}")
+    
+    all_pdf_files = render_tables_to_pdfs(parse_excel_files(excel_files))
+    
     print(f"\nTotal de PDFs gerados: {len(all_pdf_files)}")
     return all_pdf_files
 
-def process_bradesco_file(df, excel_file):
+def clean_bradesco_data(df):
     """
-    Processa arquivo Bradesco e gera PDFs com formato específico do Bradesco.
+    Padroniza os dados de um arquivo Bradesco (colunas, valores e datas).
     """
     print("  Formatando como Bradesco...")
     
@@ -523,12 +784,11 @@ def process_bradesco_file(df, excel_file):
     print(f"  Colunas Bradesco: {list(df_clean.columns)}")
     print(f"  Registros Bradesco: {len(df_clean)}")
     
-    # Gera PDFs para cada hospital
-    return generate_pdfs_for_file(df_clean, excel_file, 'Bradesco')
+    return df_clean
 
-def process_itau_file(df, excel_file):
+def clean_itau_data(df):
     """
-    Processa arquivo Itaú e gera PDFs com formato específico do Itaú.
+    Padroniza os dados de um arquivo Itaú (colunas, valores, datas e status).
     """
     print("  Formatando como Itau...")  # Mudei para "Itau" sem acento
     
@@ -576,8 +836,7 @@ def process_itau_file(df, excel_file):
     print(f"  Colunas Itau: {list(df_clean.columns)}")
     print(f"  Registros Itau: {len(df_clean)}")
     
-    # Gera PDFs para cada hospital - use "Itau" sem acento
-    return generate_pdfs_for_file(df_clean, excel_file, 'Itau')
+    return df_clean
 
 def format_date(date_value):
     """
@@ -614,6 +873,21 @@ def format_date(date_value):
     except:
         return str(date_value)
 
+def split_by_hospital(df, file_type):
+    """Separa os dados padronizados por hospital (coluna Pagador): lista de (hospital, dados)."""
+    if df.empty:
+        return []
+    
+    hospitals = df['Pagador'].unique()
+    print(f"  Hospitais encontrados no {file_type}: {len(hospitals)}")
+    
+    groups = []
+    for hospital in hospitals:
+        hospital_data = df[df['Pagador'] == hospital].copy()
+        if not hospital_data.empty:
+            groups.append((hospital, hospital_data))
+    return groups
+
 def generate_pdfs_for_file(df, excel_file, file_type):
     """
     Gera PDFs para um arquivo específico.
@@ -625,20 +899,12 @@ def generate_pdfs_for_file(df, excel_file, file_type):
         print(f"  AVISO: Nenhum dado válido encontrado no {file_type}")
         return pdf_files
     
-    # Agrupa por hospital
-    hospitals = df['Pagador'].unique()
-    
-    print(f"  Hospitais encontrados no {file_type}: {len(hospitals)}")
-    
-    for hospital in hospitals:
+    for hospital, hospital_data in split_by_hospital(df, file_type):
         try:
-            hospital_data = df[df['Pagador'] == hospital].copy()
-            
-            if hospital_data.empty:
-                continue
-                
-            # Gera o PDF específico para o tipo de arquivo
-            pdf_path = generate_specific_pdf(hospital, hospital_data, excel_file, file_type)
+            # Gera o PDF específico para o tipo de arquivo (a prioridade vem dos dados, antes de gerar)
+            pdf_path = build_pdf_path(hospital, file_type)
+            record_boleto_priority(pdf_path, hospital_data)
+            pdf_path = generate_specific_pdf(hospital, hospital_data, excel_file, file_type, pdf_path)
             if pdf_path:
                 pdf_files.append(pdf_path)
                 
@@ -649,12 +915,11 @@ def generate_pdfs_for_file(df, excel_file, file_type):
     
     return pdf_files
 
-def generate_specific_pdf(hospital_name, hospital_data, excel_file, file_type):
+def build_pdf_path(hospital_name, file_type, reserved_paths=None):
     """
-    Gera PDF com formato específico para cada tipo de arquivo.
+    Caminho do PDF de um hospital. Não repete um PDF já existente nem um caminho já
+    reservado em `reserved_paths` (o caminho escolhido é adicionado ao conjunto).
     """
-    print(f"  Gerando PDF {file_type} para: {hospital_name}")
-    
     # Remove acentos do nome do hospital e do tipo de arquivo
     hospital_name_clean = remove_accents(hospital_name)
     file_type_clean = remove_accents(file_type)
@@ -667,9 +932,66 @@ def generate_specific_pdf(hospital_name, hospital_data, excel_file, file_type):
     pdf_filename = f"Boleto_{safe_hospital_name}_{file_type_clean}_{datetime.now().strftime('%Y%m%d')}.pdf"
     pdf_path = PROCESSED_FOLDER / pdf_filename
     
+    # Outra planilha do mesmo banco (ex: vinda de outro email) não sobrescreve o PDF anterior
+    counter = 2
+    while pdf_path.exists() or (reserved_paths is not None and pdf_path in reserved_paths):
+        pdf_path = PROCESSED_FOLDER / f"{Path(pdf_filename).stem}_{counter}.pdf"
+        counter += 1
+    
+    if reserved_paths is not None:
+        reserved_paths.add(pdf_path)
+    return pdf_path
+
+def build_boleto_table_data(hospital_data):
+    """Cabeçalho e linhas formatadas (texto) da tabela de boletos de um hospital."""
+    table_data = []
+    
+    # Usa as colunas específicas do DataFrame
+    columns = list(hospital_data.columns)
+    headers = columns
+    table_data.append(headers)
+    
+    # Dados da tabela
+    for _, row in hospital_data.iterrows():
+        table_row = []
+        for col in columns:
+            value = row[col]
+            
+            # Formata a coluna Valor
+            if col == 'Valor':
+                if pd.isna(value) or value == 0:
+                    table_row.append("R$ 0,00")
+                else:
+                    try:
+                        valor_float = float(value)
+                        table_row.append(f"R$ {valor_float:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
+                    except (ValueError, TypeError):
+                        table_row.append(f"R$ {value}")
+            else:
+                if pd.isna(value) or value == '':
+                    table_row.append("")
+                else:
+                    table_row.append(str(value))
+        
+        table_data.append(table_row)
+    
+    return table_data
+
+def generate_specific_pdf(hospital_name, hospital_data, excel_file, file_type, pdf_path=None):
+    """
+    Gera PDF com formato específico para cada tipo de arquivo.
+    `pdf_path` pode vir reservado (ver build_pdf_path); se não vier, é calculado aqui.
+    """
+    print(f"  Gerando PDF {file_type} para: {hospital_name}")
+    
+    if pdf_path is None:
+        pdf_path = build_pdf_path(hospital_name, file_type)
+    
     try:
         # Cria o documento PDF
-        doc = SimpleDocTemplate(str(pdf_path), pagesize=A4)
+        # invariant=1: sem data de criação/ID aleatório, o mesmo conteúdo gera o mesmo arquivo
+        # (o outbox reconhece pelo hash um email já enviado em uma execução anterior)
+        doc = SimpleDocTemplate(str(pdf_path), pagesize=A4, invariant=1)
         elements = []
         
         # Estilos
@@ -690,37 +1012,8 @@ def generate_specific_pdf(hospital_name, hospital_data, excel_file, file_type):
         elements.append(info_paragraph)
         elements.append(Spacer(1, 12))
         
-        # Prepara os dados para a tabela
-        table_data = []
-        
-        # Usa as colunas específicas do DataFrame
-        columns = list(hospital_data.columns)
-        headers = columns
-        table_data.append(headers)
-        
-        # Dados da tabela
-        for _, row in hospital_data.iterrows():
-            table_row = []
-            for col in columns:
-                value = row[col]
-                
-                # Formata a coluna Valor
-                if col == 'Valor':
-                    if pd.isna(value) or value == 0:
-                        table_row.append("R$ 0,00")
-                    else:
-                        try:
-                            valor_float = float(value)
-                            table_row.append(f"R$ {valor_float:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
-                        except (ValueError, TypeError):
-                            table_row.append(f"R$ {value}")
-                else:
-                    if pd.isna(value) or value == '':
-                        table_row.append("")
-                    else:
-                        table_row.append(str(value))
-            
-            table_data.append(table_row)
+        # Prepara os dados para a tabela (os mesmos do corpo em HTML)
+        table_data = build_boleto_table_data(hospital_data)
         
         # Cria a tabela
         if len(table_data) > 1:
@@ -746,7 +1039,12 @@ def generate_specific_pdf(hospital_name, hospital_data, excel_file, file_type):
         # Constrói o PDF
         doc.build(elements)
         
-        print(f"    PDF gerado: {pdf_filename}")
+        # Guarda a tabela para o corpo em HTML (hospitais com poucos boletos)
+        if INLINE_BODY_MAX_ROWS > 0:
+            pdf_tables[pdf_path] = {'hospital': hospital_name, 'tipo': file_type,
+                                    'origem': excel_file.stem, 'linhas': table_data}
+        
+        print(f"    PDF gerado: {pdf_path.name}")
         return pdf_path
         
     except Exception as e:
@@ -979,169 +1277,882 @@ def find_hospital_email(hospital_name, hospital_emails):
     print(f"AVISO: Nenhum match de email encontrado para: '{hospital_name}'")
     return None
 
-def start_browser(headless=False):
-    """Inicia o navegador Chrome controlado pelo Selenium."""
+# ================== RESOLUÇÃO OFFLINE DO CHROMEDRIVER ==================
+
+# Caminho já resolvido nesta execução (evita repetir a resolução a cada navegador)
+_resolved_chromedriver_path = None
+_chromedriver_lock = threading.Lock()
+
+def get_chromedriver_filename():
+    """Retorna o nome do executável do chromedriver para o sistema atual."""
+    return "chromedriver.exe" if os.name == 'nt' else "chromedriver"
+
+def get_installed_chrome_version():
+    """
+    Descobre a versão do Chrome instalado sem acessar a rede.
+    Retorna a versão completa (ex: '126.0.6478.126') ou None se não encontrar.
+    """
+    # Windows: o próprio Chrome registra a versão no registro
+    try:
+        import winreg
+        for hive in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+            try:
+                with winreg.OpenKey(hive, r"Software\Google\Chrome\BLBeacon") as key:
+                    version, _ = winreg.QueryValueEx(key, "version")
+                    if version:
+                        return str(version)
+            except OSError:
+                continue
+    except ImportError:
+        pass
+
+    # Windows: instalações por máquina têm uma pasta com o nome da versão
+    for env_var in ('PROGRAMFILES', 'PROGRAMFILES(X86)', 'LOCALAPPDATA'):
+        base = os.environ.get(env_var)
+        if not base:
+            continue
+        application_folder = Path(base) / "Google" / "Chrome" / "Application"
+        if application_folder.exists():
+            versions = [d.name for d in application_folder.iterdir()
+                        if d.is_dir() and re.fullmatch(r'\d+\.\d+\.\d+\.\d+', d.name)]
+            if versions:
+                return max(versions, key=lambda v: [int(p) for p in v.split('.')])
+
+    # Linux/Mac: pergunta a versão ao executável
+    executables = [
+        'google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser',
+        '/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+    ]
+    for executable in executables:
+        executable_path = shutil.which(executable) or (executable if Path(executable).exists() else None)
+        if not executable_path:
+            continue
+        version = get_executable_version(executable_path)
+        if version:
+            return version
+
+    return None
+
+def get_executable_version(executable_path):
+    """Executa '<programa> --version' e extrai o número da versão."""
+    try:
+        output = subprocess.run(
+            [str(executable_path), '--version'],
+            capture_output=True, text=True, timeout=10
+        ).stdout
+    except Exception:
+        return None
+
+    match = re.search(r'(\d+\.\d+\.\d+\.\d+)', output or '')
+    return match.group(1) if match else None
+
+def get_major_version(version):
+    """Retorna a versão principal (ex: '126') de uma versão completa."""
+    return version.split('.')[0] if version else None
+
+def find_chromedriver_path():
+    """
+    Procura um chromedriver compatível com o Chrome instalado, nesta ordem:
+      1. Caminho fixado na configuração ('caminho do chromedriver')
+      2. Cache local em drivers/<versão principal>/
+      3. Download via webdriver-manager (apenas se houver rede), guardando no cache
+    Retorna uma tupla (caminho, origem). O caminho é None se nada for encontrado.
+    """
+    chrome_version = get_installed_chrome_version()
+    chrome_major = get_major_version(chrome_version)
+    print(f"Versão do Chrome instalada: {chrome_version or 'não identificada'}")
+
+    # 1. Chromedriver fixado manualmente
+    if CHROMEDRIVER_PATH:
+        if CHROMEDRIVER_PATH.exists():
+            driver_major = get_major_version(get_executable_version(CHROMEDRIVER_PATH))
+            if chrome_major and driver_major and driver_major != chrome_major:
+                print(f"AVISO: Chromedriver fixado é da versão {driver_major}, mas o Chrome é {chrome_major}")
+            return str(CHROMEDRIVER_PATH), "fixado na configuração"
+        print(f"AVISO: Chromedriver configurado não existe: {CHROMEDRIVER_PATH}")
+
+    # 2. Cache local por versão principal do Chrome
+    driver_filename = get_chromedriver_filename()
+    if chrome_major:
+        cached_driver = DRIVER_CACHE_FOLDER / chrome_major / driver_filename
+        if cached_driver.exists():
+            return str(cached_driver), "cache local"
+
+    # Chromedriver solto na pasta de cache, aceito se a versão principal bater
+    loose_driver = DRIVER_CACHE_FOLDER / driver_filename
+    if loose_driver.exists():
+        driver_major = get_major_version(get_executable_version(loose_driver))
+        if not chrome_major or driver_major == chrome_major:
+            return str(loose_driver), "cache local"
+
+    # 3. Último recurso: webdriver-manager (precisa de rede)
+    try:
+        downloaded_driver = Path(ChromeDriverManager().install())
+        driver_major = get_major_version(get_executable_version(downloaded_driver)) or chrome_major
+        if driver_major:
+            cache_folder = DRIVER_CACHE_FOLDER / driver_major
+            cache_folder.mkdir(parents=True, exist_ok=True)
+            cached_driver = cache_folder / driver_filename
+            shutil.copy2(downloaded_driver, cached_driver)
+            print(f"Chromedriver guardado no cache local: {cached_driver}")
+            return str(cached_driver), "download (webdriver-manager)"
+        return str(downloaded_driver), "download (webdriver-manager)"
+    except Exception as e:
+        print(f"AVISO: Não foi possível baixar o chromedriver: {e}")
+
+    return None, "não encontrado"
+
+def resolve_chromedriver_path():
+    """
+    Resolve o chromedriver uma única vez por execução e registra o tempo gasto.
+    Retorna None se nenhum driver foi encontrado (o Selenium tenta resolver sozinho).
+    """
+    global _resolved_chromedriver_path
+
+    start = time.perf_counter()
+
+    # Várias sessões podem iniciar ao mesmo tempo: só uma resolve, as demais reaproveitam
+    with _chromedriver_lock:
+        if _resolved_chromedriver_path and Path(_resolved_chromedriver_path).exists():
+            driver_path, source = _resolved_chromedriver_path, "já resolvido nesta execução"
+        else:
+            driver_path, source = find_chromedriver_path()
+            _resolved_chromedriver_path = driver_path
+
+    elapsed = time.perf_counter() - start
+    print(f"Resolução do chromedriver: {elapsed:.2f}s ({source}) -> {driver_path or 'Selenium Manager'}")
+    return driver_path
+
+def set_download_directory(driver, folder):
+    """
+    Define a pasta de downloads do navegador via CDP.
+    Necessário no modo headless, onde o Chrome bloqueia downloads por padrão.
+    """
+    params = {"behavior": "allow", "downloadPath": str(Path(folder).resolve())}
+    try:
+        driver.execute_cdp_cmd("Browser.setDownloadBehavior", params)
+    except Exception:
+        # Versões antigas do Chrome só têm o comando no domínio Page
+        driver.execute_cdp_cmd("Page.setDownloadBehavior", params)
+
+# Perfil leve ('perfil leve do chrome'): o robô só lê textos e atributos (aria-label, role), então
+# imagens, vídeos, fontes baixadas, animações, extensões, GPU e o tráfego em segundo plano do Chrome
+# só gastam tempo de carregamento e memória. Os ícones do Outlook aparecem como quadrados.
+LIGHT_CHROME_ARGUMENTS = [
+    "--disable-extensions",
+    "--disable-component-extensions-with-background-pages",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--no-first-run",
+    "--disable-gpu",
+    "--renderer-process-limit=2",
+    "--mute-audio",
+    "--autoplay-policy=user-gesture-required",
+    "--force-prefers-reduced-motion",
+    "--disable-features=Translate,OptimizationHints,MediaRouter",
+]
+LIGHT_CHROME_BLOCKED_URLS = ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4", "*.webm", "*.mp3", "*.ogg"]
+
+def start_browser(headless=False, light_profile=None):
+    """
+    Inicia o navegador Chrome controlado pelo Selenium.
+    `light_profile` (padrão: 'perfil leve do chrome') usa LIGHT_CHROME_ARGUMENTS e bloqueia imagens e mídia.
+    """
+    if light_profile is None:
+        light_profile = LIGHT_CHROME_PROFILE
     options = webdriver.ChromeOptions()
     if headless:
         options.add_argument("--headless=new")
+        # Sem janela, maximize_window não tem efeito: define o tamanho da tela
+        options.add_argument("--window-size=1920,1080")
 
     prefs = {
         "download.default_directory": str(DOWNLOAD_FOLDER.resolve()),
         "download.prompt_for_download": False,
     }
+    if light_profile:
+        for argument in LIGHT_CHROME_ARGUMENTS:
+            options.add_argument(argument)
+        prefs["profile.managed_default_content_settings.images"] = 2
     options.add_experimental_option("prefs", prefs)
 
+    driver_path = resolve_chromedriver_path()
+    service = ChromeService(driver_path) if driver_path else ChromeService()
+
     driver = webdriver.Chrome(
-        service=ChromeService(ChromeDriverManager().install()),
+        service=service,
         options=options
     )
-    driver.maximize_window()
+    apply_webdriver_timeouts(driver)
+    
+    if light_profile:
+        # Fontes e mídia não têm preferência própria: são bloqueadas pela URL via CDP
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LIGHT_CHROME_BLOCKED_URLS})
+        except Exception as e:
+            print(f"AVISO: Não foi possível bloquear fontes e mídia no perfil leve: {e}")
+    
+    if headless:
+        # O login da Microsoft trata "HeadlessChrome" de forma diferente: usa o user agent normal
+        try:
+            user_agent = driver.execute_cdp_cmd("Browser.getVersion", {})["userAgent"]
+            driver.execute_cdp_cmd("Network.setUserAgentOverride",
+                                   {"userAgent": user_agent.replace("HeadlessChrome", "Chrome")})
+        except Exception as e:
+            print(f"AVISO: Não foi possível ajustar o user agent do modo headless: {e}")
+        set_download_directory(driver, DOWNLOAD_FOLDER)
+        print("Navegador iniciado em modo headless")
+    else:
+        driver.maximize_window()
     return driver
 
-def login_to_outlook(driver):
-    """Realiza login no Outlook Web."""
-    driver.get(OUTLOOK_WEB_URL)
-    wait = WebDriverWait(driver, DEFAULT_WAIT_TIME)
+# ================== CONSULTAS AO DOM EM LOTE (UMA IDA AO NAVEGADOR) ==================
 
-    # Email
-    email_input = wait.until(EC.presence_of_element_located((By.NAME, "loginfmt")))
-    email_input.send_keys(OUTLOOK_EMAIL)
-    email_input.send_keys(Keys.ENTER)
-    time.sleep(2)
+# Avalia vários seletores e filtros de visibilidade/texto dentro do navegador.
+# Cada find_elements/is_displayed/.text do Selenium é uma requisição HTTP ao chromedriver;
+# este script faz tudo em uma única chamada a execute_script.
+DOM_QUERY_SCRIPT = """
+const locators = arguments[0];
+const options = arguments[1];
+const seen = new Set();
+const results = [];
+const needles = (options.text_contains || []).map(t => t.toLowerCase());
 
-    # Senha
-    password_input = wait.until(EC.presence_of_element_located((By.NAME, "passwd")))
-    password_input.send_keys(OUTLOOK_PASSWORD)
-    password_input.send_keys(Keys.ENTER)
-    time.sleep(2)
+function isVisible(el) {
+    if (!el.isConnected) return false;
+    const style = window.getComputedStyle(el);
+    if (style.visibility === 'hidden' || style.display === 'none') return false;
+    return !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+}
 
-    # Botão "Não" em "Stay signed in?"
-    try:
-        no_button = wait.until(EC.element_to_be_clickable((By.ID, "idBtn_Back")))
-        no_button.click()
-    except:
-        pass
+function findAll(locator) {
+    const [kind, selector] = locator;
+    if (kind === 'xpath') {
+        const snapshot = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        const nodes = [];
+        for (let i = 0; i < snapshot.snapshotLength; i++) nodes.push(snapshot.snapshotItem(i));
+        return nodes;
+    }
+    return Array.from(document.querySelectorAll(selector));
+}
 
-    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div[role='navigation']")))
-    print("Login realizado com sucesso.")
+for (let index = 0; index < locators.length; index++) {
+    let nodes;
+    try { nodes = findAll(locators[index]); } catch (e) { continue; }
+    for (const el of nodes) {
+        if (seen.has(el)) continue;
+        const visible = isVisible(el);
+        if (options.visible_only && !visible) continue;
+        if (options.enabled_only && (el.disabled || el.getAttribute('aria-disabled') === 'true')) continue;
+        const text = (visible ? el.innerText : el.textContent) || '';
+        if (needles.length) {
+            const sources = options.match_text ? [text] : [];
+            const haystack = sources.concat(options.attributes.map(a => el.getAttribute(a) || '')).join(' ').toLowerCase();
+            if (!needles.some(n => haystack.includes(n))) continue;
+        }
+        seen.add(el);
+        results.push({element: el, index: index, text: text});
+        if (options.first_only) return results;
+    }
+}
+return results;
+"""
 
-def search_and_download_attachments(driver):
+def to_dom_query_locator(locator):
+    """Converte um seletor (by, selector) do Selenium em ['css'|'xpath', selector] para o script."""
+    by, selector = locator
+    if by == By.XPATH:
+        return ['xpath', selector]
+    if by == By.ID:
+        return ['css', f'[id="{selector}"]']
+    if by == By.NAME:
+        return ['css', f'[name="{selector}"]']
+    if by == By.TAG_NAME:
+        return ['css', selector]
+    if by == By.CLASS_NAME:
+        return ['css', f'.{selector}']
+    return ['css', selector]
+
+def query_dom(driver, locators, visible_only=True, enabled_only=False, text_contains=None,
+              attributes=None, match_text=True, first_only=False):
     """
-    Procura emails não lidos com o assunto específico e baixa TODOS os anexos individualmente.
+    Avalia todos os seletores e filtros no navegador em uma única chamada.
+    - visible_only: só elementos visíveis
+    - enabled_only: ignora elementos desabilitados
+    - text_contains: só elementos cujo texto (e/ou os `attributes` informados) contém algum dos termos
+    - match_text: se False, `text_contains` é verificado apenas nos `attributes`
+    - first_only: para no primeiro resultado (respeitando a ordem dos seletores)
+    Retorna uma lista de dicionários {'element', 'locator', 'text'}, sem elementos repetidos.
     """
-    wait = WebDriverWait(driver, DEFAULT_WAIT_TIME)
+    options = {
+        'visible_only': visible_only,
+        'enabled_only': enabled_only,
+        'text_contains': list(text_contains or []),
+        'attributes': list(attributes or []),
+        'match_text': match_text,
+        'first_only': first_only,
+    }
+    raw_results = driver.execute_script(
+        DOM_QUERY_SCRIPT, [to_dom_query_locator(locator) for locator in locators], options) or []
+    return [
+        {'element': item['element'], 'locator': locators[item['index']], 'text': item['text']}
+        for item in raw_results
+    ]
 
-    # Garante que estamos na inbox
-    driver.get(OUTLOOK_WEB_URL)
-    time.sleep(DEFAULT_WAIT_TIME)
+def query_dom_first(driver, locators, **kwargs):
+    """Retorna o primeiro resultado de query_dom (ou None)."""
+    results = query_dom(driver, locators, first_only=True, **kwargs)
+    return results[0] if results else None
 
-    # CLICA NO BOTÃO DE FILTRO (ícone de filtro)
-    print("Clicando no botão de filtro...")
-    try:
-        filter_button = wait.until(EC.element_to_be_clickable(
-            (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div[1]/div/div/div/div[3]/div/div/div[1]/div/div[1]/div[1]/div/div[2]/button[2]/span/i")))
-        filter_button.click()
-        print("Botão de filtro clicado com sucesso")
-    except Exception as e:
-        print(f"ERRO ao clicar no botão de filtro: {e}")
-        # Tenta seletores alternativos para o botão de filtro
-        alternative_filter_selectors = [
-            (By.CSS_SELECTOR, "button[aria-label*='Filter']"),
-            (By.CSS_SELECTOR, "button[data-icon-name*='Filter']"),
-            (By.CSS_SELECTOR, "i[data-icon-name*='Filter']"),
-            (By.XPATH, "//button[contains(@aria-label, 'Filter')]"),
-            (By.XPATH, "//i[contains(@data-icon-name, 'Filter')]"),
-        ]
-        
-        filter_found = False
-        for by, selector in alternative_filter_selectors:
-            try:
-                filter_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                filter_button.click()
-                print(f"Botão de filtro encontrado com seletor alternativo: {selector}")
-                filter_found = True
-                break
-            except:
-                continue
-        
-        if not filter_found:
-            print("Não foi possível encontrar o botão de filtro")
-            return
+# ================== ESPERA POR CONDIÇÕES (SUBSTITUI PAUSAS FIXAS) ==================
 
-    time.sleep(DEFAULT_WAIT_TIME)
+WAIT_POLL_INTERVAL = 0.2  # Intervalo entre verificações das condições (segundos)
 
-    # CLICA EM "UNREAD" NO MENU DE FILTRO
-    print("Clicando em 'Unread'...")
-    try:
-        unread_option = wait.until(EC.element_to_be_clickable(
-            (By.XPATH, "/html/body/div[10]/div/div/div[2]/span[3]/span")))
-        unread_option.click()
-        print("Opção 'Unread' clicada com sucesso")
-    except Exception as e:
-        print(f"ERRO ao clicar em 'Unread': {e}")
-        # Tenta seletores alternativos para a opção Unread
-        alternative_unread_selectors = [
-            (By.CSS_SELECTOR, "span[aria-label*='Unread']"),
-            (By.CSS_SELECTOR, "button[aria-label*='Unread']"),
-            (By.XPATH, "//span[contains(text(), 'Unread')]"),
-            (By.XPATH, "//button[contains(text(), 'Unread')]"),
-            (By.XPATH, "//*[contains(text(), 'Unread')]"),
-        ]
-        
-        unread_found = False
-        for by, selector in alternative_unread_selectors:
-            try:
-                unread_option = wait.until(EC.element_to_be_clickable((by, selector)))
-                unread_option.click()
-                print(f"Opção 'Unread' encontrada com seletor alternativo: {selector}")
-                unread_found = True
-                break
-            except:
-                continue
-        
-        if not unread_found:
-            print("Não foi possível encontrar a opção 'Unread'")
-            return
+# Seletores do campo To, usados para saber se a janela de composição está aberta
+COMPOSE_TO_LOCATORS = [
+    (By.CSS_SELECTOR, "div[aria-label='To'][contenteditable='true']"),
+    (By.CSS_SELECTOR, "div[role='textbox'][aria-label*='To']"),
+]
 
-    time.sleep(DEFAULT_WAIT_TIME * 2)  # Aguarda mais tempo para os filtros serem aplicados
+# Tempo realmente esperado em cada etapa: [{'etapa': str, 'segundos': float, 'atendida': bool}]
+wait_step_timings = []
 
-    # ENCONTRA E IDENTIFICA O EMAIL CORRETO COM O ASSUNTO CONFIGURADO
-    print(f"Procurando email com '{EMAIL_SUBJECT}'...")
-    
-    target_email_element = None
-    email_text = ""
-    
-    try:
-        # Método 1: Procura pelo elemento específico com classe TtcXM
-        subject_elements = driver.find_elements(By.XPATH, f"//span[@class='TtcXM' and contains(text(), '{EMAIL_SUBJECT}')]")
-        
-        if subject_elements:
-            target_email_element = subject_elements[0]
-            email_text = target_email_element.text
-            print(f"ENCONTRADO: Email com '{EMAIL_SUBJECT}' - {email_text}")
-        else:
-            # Método 2: Procura por qualquer elemento contendo o assunto
-            all_elements = driver.find_elements(By.XPATH, f"//*[contains(text(), '{EMAIL_SUBJECT}')]")
-            for element in all_elements:
-                if element.is_displayed() and EMAIL_SUBJECT in element.text:
-                    target_email_element = element
-                    email_text = element.text
-                    print(f"ENCONTRADO: Email com '{EMAIL_SUBJECT}' - {email_text}")
-                    break
-        
-        if not target_email_element:
-            print(f"ERRO: Nenhum email com '{EMAIL_SUBJECT}' encontrado")
-            return
-            
-    except Exception as e:
-        print(f"ERRO ao procurar email com '{EMAIL_SUBJECT}': {e}")
-        return
+def wait_for_condition(condition, timeout, step_name, poll_interval=WAIT_POLL_INTERVAL):
+    """
+    Verifica `condition` a cada `poll_interval` segundos até que ela retorne um valor
+    verdadeiro ou o `timeout` acabe. Registra o tempo real esperado na etapa.
+    Retorna o valor da condição, ou None se o tempo acabar.
+    """
+    start = time.monotonic()
+    result = None
+    while True:
+        try:
+            result = condition()
+        except Exception:
+            result = None
+        if result or time.monotonic() - start >= timeout:
+            break
+        time.sleep(poll_interval)
 
-    # CLICA NO EMAIL PARA ABRIR E BAIXAR OS ANEXOS
+    elapsed = time.monotonic() - start
+    wait_step_timings.append({'etapa': step_name, 'segundos': elapsed, 'atendida': bool(result)})
+    if not result:
+        print(f"  [espera] '{step_name}' não atendida após {elapsed:.1f}s")
+    return result
+
+def page_loaded(driver):
+    """Condição: o documento terminou de carregar."""
+    return driver.execute_script("return document.readyState") == 'complete'
+
+def visible_element(driver, locators):
+    """Condição: retorna o primeiro elemento visível entre os seletores (by, selector) informados."""
+    match = query_dom_first(driver, locators)
+    return match['element'] if match else None
+
+def no_visible_element(driver, locators):
+    """Condição: nenhum dos seletores (by, selector) tem elemento visível."""
+    return visible_element(driver, locators) is None
+
+def text_visible(driver, text):
+    """Condição: algum elemento visível contém o texto informado."""
+    return visible_element(driver, [(By.XPATH, f"//*[contains(text(), '{text}')]")])
+
+def is_focused(driver, element):
+    """Condição: o elemento informado está com o foco do teclado."""
+    return driver.execute_script("return document.activeElement === arguments[0];", element)
+
+def element_text_stable(element, stable_for=0.5):
+    """
+    Cria uma condição que fica verdadeira quando o texto/valor do elemento
+    para de mudar por `stable_for` segundos (ex: autocomplete terminou de resolver).
+    """
+    state = {'text': None, 'since': time.monotonic()}
+
+    def condition():
+        current = element.text or element.get_attribute('value') or ''
+        now = time.monotonic()
+        if current != state['text']:
+            state['text'] = current
+            state['since'] = now
+            return False
+        return now - state['since'] >= stable_for
+
+    return condition
+
+class DownloadWatcher:
+    """
+    Acompanha uma pasta de downloads por polling rápido e entrega cada arquivo assim que
+    ele fica completo: sem marcador de download parcial (.crdownload/.part/.tmp, inclusive
+    o "nome.ext.crdownload" ao lado) e com tamanho estável por `stable_for` segundos.
+    Subpastas também são acompanhadas (ex: uma por email); pastas ocultas (".nome") são
+    temporárias e ficam de fora. Arquivos que já existiam quando o watcher foi criado são ignorados.
+    
+    Quem baixa chama finish() ao terminar de disparar os downloads; iter_completed()
+    entrega os arquivos conforme ficam prontos e para quando não resta nada em andamento.
+    """
+    PARTIAL_SUFFIXES = ('.crdownload', '.part', '.tmp')
+    
+    def __init__(self, folder, stable_for=0.5, poll_interval=WAIT_POLL_INTERVAL):
+        self.folder = Path(folder)
+        self.stable_for = stable_for
+        self.poll_interval = poll_interval
+        self._ignored = set(self._files())
+        self._sizes = {}  # arquivo -> (tamanho, desde quando está com esse tamanho)
+        self._completed = []
+        self._delivered = 0
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+    
+    def _files(self):
+        for path in self.folder.rglob('*'):
+            if path.is_file() and not any(part.startswith('.') for part in path.relative_to(self.folder).parts):
+                yield path
+    
+    def _is_partial(self, path):
+        if path.suffix.lower() in self.PARTIAL_SUFFIXES:
+            return True
+        return any(path.with_name(path.name + suffix).exists() for suffix in self.PARTIAL_SUFFIXES)
+    
+    def poll(self):
+        """Uma varredura da pasta. Retorna os arquivos que acabaram de ficar completos."""
+        with self._lock:
+            now = time.monotonic()
+            newly_completed = []
+            completed = set(self._completed)
+            
+            # Arquivos que sumiram antes de estabilizar (renomeados/movidos) deixam de ser acompanhados
+            for path in [path for path in self._sizes if not path.exists()]:
+                del self._sizes[path]
+            
+            for path in self._files():
+                if path in self._ignored or path in completed or self._is_partial(path):
+                    continue
+                try:
+                    size = path.stat().st_size
+                except OSError:
+                    continue
+                
+                previous = self._sizes.get(path)
+                if previous is None or previous[0] != size:
+                    self._sizes[path] = (size, now)
+                elif now - previous[1] >= self.stable_for:
+                    del self._sizes[path]
+                    self._completed.append(path)
+                    newly_completed.append(path)
+            
+            return newly_completed
+    
+    def in_progress(self):
+        """True se há download parcial ou arquivo ainda mudando de tamanho na pasta."""
+        with self._lock:
+            if self._sizes:
+                return True
+        return any(
+            path.suffix.lower() in self.PARTIAL_SUFFIXES
+            for path in self._files() if path not in self._ignored
+        )
+    
+    def completed_count(self):
+        with self._lock:
+            return len(self._completed)
+    
+    def wait_for_files(self, count, timeout, step_name):
+        """Aguarda `count` novos arquivos completos a partir de agora."""
+        target = self.completed_count() + count
+        
+        def files_completed():
+            self.poll()
+            return self.completed_count() >= target
+        
+        return wait_for_condition(files_completed, timeout, step_name, self.poll_interval)
+    
+    def wait_until_idle(self, timeout, step_name):
+        """Aguarda até não haver nenhum download em andamento."""
+        def downloads_idle():
+            self.poll()
+            return not self.in_progress()
+        
+        return wait_for_condition(downloads_idle, timeout, step_name, self.poll_interval)
+    
+    def finish(self):
+        """Sinaliza que nenhum download novo será disparado."""
+        self._finished.set()
+    
+    def iter_completed(self, timeout=None):
+        """
+        Gera cada arquivo completo, na ordem em que terminou, até finish() ter sido chamado
+        e não restar download em andamento (ou estourar `timeout` segundos, se informado).
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            self.poll()
+            with self._lock:
+                ready = self._completed[self._delivered:]
+                self._delivered = len(self._completed)
+            for path in ready:
+                yield path
+            
+            if not ready and self._finished.is_set() and not self.in_progress():
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                print(f"AVISO: Tempo esgotado aguardando downloads em {self.folder}")
+                return
+            if not ready:
+                time.sleep(self.poll_interval)
+
+def print_wait_summary():
+    """Mostra no console quanto tempo foi gasto esperando em cada etapa."""
+    if not wait_step_timings:
+        return
+
+    summary = {}
+    for item in wait_step_timings:
+        step = summary.setdefault(item['etapa'], {'vezes': 0, 'total': 0.0, 'maximo': 0.0, 'expiradas': 0})
+        step['vezes'] += 1
+        step['total'] += item['segundos']
+        step['maximo'] = max(step['maximo'], item['segundos'])
+        if not item['atendida']:
+            step['expiradas'] += 1
+
+    print("\n=== TEMPO DE ESPERA POR ETAPA ===")
+    for step_name, step in sorted(summary.items(), key=lambda s: s[1]['total'], reverse=True):
+        print(f"  {step_name}: {step['total']:.1f}s em {step['vezes']}x "
+              f"(máx {step['maximo']:.1f}s, expiradas {step['expiradas']})")
+    print(f"  Total esperado: {sum(s['total'] for s in summary.values()):.1f}s")
+
+# ================== CACHE ADAPTATIVO DE SELETORES ==================
+
+# Arquivo onde fica salvo qual seletor funcionou para cada elemento da tela
+SELECTOR_CACHE_PATH = BASE_DIR / "selector_cache.json"
+
+# Atraso entre a liberação de um seletor e o próximo da lista (prioridade sem esperar o timeout inteiro)
+SELECTOR_FALLBACK_STAGGER = 0.5
+
+class SelectorResolver:
+    """
+    Localiza elementos lógicos da tela (novo email, To, Cc, assunto, corpo, enviar...)
+    a partir de uma lista de seletores alternativos. Lembra em disco qual seletor
+    funcionou para cada elemento e tenta esse primeiro na próxima vez.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = Path(cache_path)
+        self._lock = threading.Lock()
+        self._winners = self._load()
+        self._stats = {}
+
+    def _load(self):
+        """Carrega os seletores vencedores salvos em execuções anteriores."""
+        try:
+            if self.cache_path.exists():
+                with open(self.cache_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"AVISO: Cache de seletores ignorado ({e})")
+        return {}
+
+    def _save(self):
+        """Grava os seletores vencedores em disco (chamado com o lock adquirido)."""
+        try:
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                json.dump(self._winners, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"AVISO: Não foi possível salvar o cache de seletores: {e}")
+
+    @staticmethod
+    def _key(locator):
+        by, selector = locator
+        return f"{by}|{selector}"
+
+    def _ordered(self, name, locators):
+        """Coloca o seletor que funcionou da última vez na frente da lista."""
+        with self._lock:
+            winner = self._winners.get(name)
+        ordered = list(locators)
+        for index, locator in enumerate(ordered):
+            if self._key(locator) == winner:
+                ordered.insert(0, ordered.pop(index))
+                return ordered, True
+        return ordered, False
+
+    @staticmethod
+    def _match(driver, locators, clickable):
+        """
+        Verifica os seletores liberados em uma única consulta ao DOM.
+        Retorna (elemento, seletor) do primeiro que casar, ou (None, None).
+        """
+        try:
+            match = query_dom_first(driver, locators, visible_only=clickable, enabled_only=clickable)
+        except Exception:
+            match = None
+        return (match['element'], match['locator']) if match else (None, None)
+
+    def find(self, driver, name, locators, timeout, clickable=False):
+        """
+        Procura o elemento `name` usando os seletores informados até `timeout` segundos.
+        O seletor em cache é verificado imediatamente; os demais entram na busca um a um,
+        com SELECTOR_FALLBACK_STAGGER segundos de diferença, respeitando a ordem da lista.
+        Retorna o elemento ou None.
+        """
+        candidates, has_cached = self._ordered(name, locators)
+        stagger = min(SELECTOR_FALLBACK_STAGGER, timeout / max(len(candidates), 1))
+
+        start = time.monotonic()
+        element, winner = None, None
+        while True:
+            elapsed = time.monotonic() - start
+            released = [locator for index, locator in enumerate(candidates) if elapsed >= index * stagger]
+            element, winner = self._match(driver, released, clickable)
+            if element is not None or time.monotonic() - start >= timeout:
+                break
+            time.sleep(WAIT_POLL_INTERVAL)
+
+        elapsed = time.monotonic() - start
+        hit = has_cached and winner == candidates[0]
+        self._record(name, winner, hit, elapsed)
+        wait_step_timings.append({'etapa': f"seletor: {name}", 'segundos': elapsed, 'atendida': element is not None})
+
+        if winner:
+            print(f"  [seletor] '{name}' encontrado com: {winner[0]} = {winner[1]}{' (cache)' if hit else ''}")
+        else:
+            print(f"  [seletor] '{name}' não encontrado após {elapsed:.1f}s")
+        return element
+
+    def _record(self, name, winner, hit, elapsed):
+        """Atualiza acertos/erros do cache e salva o novo vencedor, se mudou."""
+        with self._lock:
+            stats = self._stats.setdefault(name, {'acertos': 0, 'erros': 0, 'segundos_perdidos': 0.0})
+            if hit:
+                stats['acertos'] += 1
+            else:
+                stats['erros'] += 1
+                stats['segundos_perdidos'] += elapsed
+
+            if winner and self._winners.get(name) != self._key(winner):
+                self._winners[name] = self._key(winner)
+                self._save()
+
+    def print_stats(self):
+        """Mostra acertos, erros e o tempo perdido com erros do cache por elemento."""
+        with self._lock:
+            stats = dict(self._stats)
+        if not stats:
+            return
+
+        print("\n=== CACHE DE SELETORES ===")
+        for name, item in sorted(stats.items()):
+            print(f"  {name}: {item['acertos']} acertos, {item['erros']} erros, "
+                  f"{item['segundos_perdidos']:.1f}s perdidos em erros")
+        total_lost = sum(item['segundos_perdidos'] for item in stats.values())
+        print(f"  Total perdido em erros: {total_lost:.1f}s")
+
+selector_resolver = SelectorResolver(SELECTOR_CACHE_PATH)
+
+# ================== ANEXOS PELO INPUT DE ARQUIVO (SEM DIÁLOGO DO SISTEMA) ==================
+
+# Indicadores de upload ainda em andamento na janela de composição
+UPLOAD_PROGRESS_LOCATORS = [
+    (By.CSS_SELECTOR, "[role='progressbar']"),
+    (By.CSS_SELECTOR, "[aria-label*='Uploading']"),
+    (By.CSS_SELECTOR, "[aria-label*='Carregando']"),
+]
+
+def find_file_input(driver):
+    """
+    Procura o input[type=file] da janela de composição.
+    O Outlook pode só criar o input depois que o menu Insert > Attach file é aberto.
+    """
+    file_inputs = driver.find_elements(By.CSS_SELECTOR, "input[type='file']")
+    if file_inputs:
+        return file_inputs
+    
+    print("Input de arquivo não encontrado, abrindo menu de anexos...")
+    menu_selectors = [
+        (By.CSS_SELECTOR, "button[aria-label*='Insert']"),
+        (By.CSS_SELECTOR, "button[aria-label*='Attach file']"),
+        (By.CSS_SELECTOR, "button[data-icon-name*='Attach file']"),
+    ]
+    for by, selector in menu_selectors:
+        try:
+            button = visible_element(driver, [(by, selector)])
+            if button:
+                button.click()
+                file_inputs = wait_for_condition(
+                    lambda: driver.find_elements(By.CSS_SELECTOR, "input[type='file']"),
+                    DEFAULT_WAIT_TIME, "anexos: input de arquivo")
+                if file_inputs:
+                    return file_inputs
+        except Exception:
+            continue
+    
+    return []
+
+def attach_files_via_file_input(driver, file_paths, step_prefix):
+    """
+    Anexa os arquivos enviando os caminhos direto para o input[type=file] da janela
+    de composição, sem abrir o diálogo do sistema operacional (não depende de tela/foco).
+    Todos os arquivos vão em uma única chamada e depois aguarda o upload de todos.
+    Retorna False se o input de arquivo não foi encontrado ou se o upload não foi confirmado
+    (o email não pode sair sem os anexos).
+    """
+    file_paths = [Path(p) for p in file_paths]
+    
+    file_inputs = find_file_input(driver)
+    if not file_inputs:
+        print("ERRO: Input de arquivo não encontrado na janela de composição")
+        return False
+    
+    # Prefere o input que aceita vários arquivos
+    file_input = next((fi for fi in file_inputs if fi.get_attribute('multiple') is not None), file_inputs[-1])
+    if len(file_paths) > 1 and file_input.get_attribute('multiple') is None:
+        driver.execute_script("arguments[0].multiple = true;", file_input)
+    
+    print(f"Enviando {len(file_paths)} arquivo(s) pelo input de arquivo: {[p.name for p in file_paths]}")
+    file_input.send_keys("\n".join(str(p.resolve()) for p in file_paths))
+    
+    # Aguarda todos os nomes aparecerem e nenhum upload em andamento
+    uploaded = wait_for_condition(
+        lambda: all(text_visible(driver, p.name) for p in file_paths) and no_visible_element(driver, UPLOAD_PROGRESS_LOCATORS),
+        30 + 10 * len(file_paths), f"{step_prefix}: upload dos anexos")
+    
+    if not uploaded:
+        print("ERRO: Upload dos anexos não confirmado dentro do tempo limite")
+        return False
+    return True
+
+def login_to_outlook(driver):
+    """Realiza login no Outlook Web."""
+    driver.get(OUTLOOK_WEB_URL)
+    wait = WebDriverWait(driver, DEFAULT_WAIT_TIME)
+
+    # Email
+    email_input = wait.until(EC.presence_of_element_located((By.NAME, "loginfmt")))
+    email_input.send_keys(OUTLOOK_EMAIL)
+    email_input.send_keys(Keys.ENTER)
+    wait_for_condition(lambda: visible_element(driver, [(By.NAME, "passwd")]), DEFAULT_WAIT_TIME * 3, "login: campo de senha")
+
+    # Senha
+    password_input = wait.until(EC.presence_of_element_located((By.NAME, "passwd")))
+    password_input.send_keys(OUTLOOK_PASSWORD)
+    password_input.send_keys(Keys.ENTER)
+    wait_for_condition(lambda: visible_element(driver, [(By.ID, "idBtn_Back"), (By.CSS_SELECTOR, "div[role='navigation']")]),
+                       DEFAULT_WAIT_TIME * 3, "login: senha aceita")
+
+    # Botão "Não" em "Stay signed in?"
+    try:
+        no_button = wait.until(EC.element_to_be_clickable((By.ID, "idBtn_Back")))
+        no_button.click()
+    except:
+        pass
+
+    wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "div[role='navigation']")))
+    print("Login realizado com sucesso.")
+
+# Limite de emails baixados por execução (proteção contra laço se a lista não atualizar)
+MAX_EMAILS_PER_RUN = 20
+
+def open_unread_email_list(driver):
+    """
+    Abre a inbox e aplica o filtro 'Unread'. Retorna False se o filtro não puder ser aplicado.
+    """
+    # Garante que estamos na inbox
+    driver.get(OUTLOOK_WEB_URL)
+    wait_for_condition(
+        lambda: page_loaded(driver) and visible_element(driver, [(By.CSS_SELECTOR, "div[role='navigation']")]),
+        DEFAULT_WAIT_TIME * 5, "download: inbox carregada")
+
+    # CLICA NO BOTÃO DE FILTRO (ícone de filtro)
+    print("Clicando no botão de filtro...")
+    filter_selectors = [
+        (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div[1]/div/div/div/div[3]/div/div/div[1]/div/div[1]/div[1]/div/div[2]/button[2]/span/i"),
+        (By.CSS_SELECTOR, "button[aria-label*='Filter']"),
+        (By.CSS_SELECTOR, "button[data-icon-name*='Filter']"),
+        (By.CSS_SELECTOR, "i[data-icon-name*='Filter']"),
+        (By.XPATH, "//button[contains(@aria-label, 'Filter')]"),
+        (By.XPATH, "//i[contains(@data-icon-name, 'Filter')]"),
+    ]
+    
+    filter_button = selector_resolver.find(driver, 'filtro', filter_selectors, DEFAULT_WAIT_TIME * 2, clickable=True)
+    if not filter_button:
+        print("Não foi possível encontrar o botão de filtro")
+        return False
+    
+    try:
+        filter_button.click()
+        print("Botão de filtro clicado com sucesso")
+    except Exception as e:
+        print(f"ERRO ao clicar no botão de filtro: {e}")
+        return False
+
+    wait_for_condition(lambda: text_visible(driver, 'Unread'), DEFAULT_WAIT_TIME * 2, "download: menu de filtro aberto")
+
+    # CLICA EM "UNREAD" NO MENU DE FILTRO
+    print("Clicando em 'Unread'...")
+    unread_selectors = [
+        (By.XPATH, "/html/body/div[10]/div/div/div[2]/span[3]/span"),
+        (By.CSS_SELECTOR, "span[aria-label*='Unread']"),
+        (By.CSS_SELECTOR, "button[aria-label*='Unread']"),
+        (By.XPATH, "//span[contains(text(), 'Unread')]"),
+        (By.XPATH, "//button[contains(text(), 'Unread')]"),
+        (By.XPATH, "//*[contains(text(), 'Unread')]"),
+    ]
+    
+    unread_option = selector_resolver.find(driver, 'filtro_nao_lidos', unread_selectors, DEFAULT_WAIT_TIME * 2, clickable=True)
+    if not unread_option:
+        print("Não foi possível encontrar a opção 'Unread'")
+        return False
+    
+    try:
+        unread_option.click()
+        print("Opção 'Unread' clicada com sucesso")
+    except Exception as e:
+        print(f"ERRO ao clicar em 'Unread': {e}")
+        return False
+
+    # Aguarda o filtro ser aplicado e o email com o assunto aparecer na lista
+    wait_for_condition(lambda: text_visible(driver, EMAIL_SUBJECT), DEFAULT_WAIT_TIME * 3, "download: filtro 'Unread' aplicado")
+    return True
+
+def find_unread_subject_emails(driver):
+    """Elementos da lista com o assunto configurado, na ordem em que aparecem."""
+    # Método 1: elemento específico com classe TtcXM
+    subject_elements = driver.find_elements(By.XPATH, f"//span[@class='TtcXM' and contains(text(), '{EMAIL_SUBJECT}')]")
+    if subject_elements:
+        return subject_elements
+    
+    # Método 2: qualquer elemento visível contendo o assunto (uma consulta ao DOM)
+    matches = query_dom(driver, [(By.XPATH, f"//*[contains(text(), '{EMAIL_SUBJECT}')]")],
+                        text_contains=[EMAIL_SUBJECT])
+    return [match['element'] for match in matches]
+
+def get_email_container(element):
+    """Linha clicável da lista que contém o elemento do assunto."""
+    return element.find_element(By.XPATH, "./ancestor::div[contains(@class, 'listItem') or contains(@role, 'option') or contains(@data-convid, '')][1]")
+
+def get_email_key(element):
+    """Identifica um email da lista (id da conversa ou, na falta dele, o texto da linha)."""
+    try:
+        container = get_email_container(element)
+        return container.get_attribute('data-convid') or container.get_attribute('id') or container.text
+    except Exception:
+        return element.text
+
+def create_message_download_folder(index):
+    """Subpasta de downloads de um email: downloads/email_01, email_02..."""
+    folder = DOWNLOAD_FOLDER / f"email_{index:02d}"
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+def open_email(driver, target_email_element):
+    """Abre o email da lista e aguarda o painel de leitura. Retorna False se não abrir."""
+    # CLICA NO EMAIL PARA ABRIR E BAIXAR OS ANEXOS
     print("Clicando no email para abrir...")
     try:
         # Encontra o elemento pai clicável do email
-        email_container = target_email_element.find_element(By.XPATH, "./ancestor::div[contains(@class, 'listItem') or contains(@role, 'option') or contains(@data-convid, '')][1]")
+        email_container = get_email_container(target_email_element)
         email_container.click()
         print("Email aberto com sucesso")
     except Exception as e:
@@ -1152,9 +2163,15 @@ def search_and_download_attachments(driver):
             print("Email aberto com clique direto")
         except Exception as e2:
             print(f"ERRO ao clicar diretamente: {e2}")
-            return
+            return False
 
-    time.sleep(DEFAULT_WAIT_TIME * 2)
+    # Aguarda o painel de leitura mostrar os anexos ou o assunto do email aberto
+    wait_for_condition(lambda: visible_element(driver, [
+        (By.CSS_SELECTOR, "[data-automation-id*='attachment']"),
+        (By.CSS_SELECTOR, "[aria-label*='Attachment']"),
+        (By.CSS_SELECTOR, "[data-automation-id*='subject']"),
+        (By.XPATH, "//button[contains(@aria-label, 'Download')]"),
+    ]), DEFAULT_WAIT_TIME * 2, "download: email aberto")
     
     # VERIFICA SE O EMAIL FOI ABERTO CORRETAMENTE
     try:
@@ -1183,6 +2200,14 @@ def search_and_download_attachments(driver):
     except Exception as e:
         print(f"Erro ao verificar assunto do email aberto: {e}")
     
+    return True
+
+def download_open_email_attachments(driver, download_watcher):
+    """
+    Baixa TODOS os anexos do email aberto, um por vez, aguardando cada download terminar.
+    """
+    wait = WebDriverWait(driver, DEFAULT_WAIT_TIME)
+    
     # PROCURA E BAIXA TODOS OS ANEXOS INDIVIDUALMENTE
     print("Procurando todos os anexos para download...")
     
@@ -1195,24 +2220,14 @@ def search_and_download_attachments(driver):
             (By.XPATH, "//*[contains(text(), 'attachment') or contains(text(), 'Anexo')]"),
         ]
         
-        attachment_elements = []
+        # Uma única consulta ao DOM para todos os seletores (já sem duplicatas)
+        attachment_matches = query_dom(driver, attachment_selectors, visible_only=False)
         for by, selector in attachment_selectors:
-            try:
-                elements = driver.find_elements(by, selector)
-                if elements:
-                    attachment_elements.extend(elements)
-                    print(f"Encontrados {len(elements)} elementos de anexo com seletor: {selector}")
-            except:
-                continue
+            found = sum(1 for match in attachment_matches if match['locator'] == (by, selector))
+            if found:
+                print(f"Encontrados {found} elementos de anexo com seletor: {selector}")
         
-        # Remove duplicatas
-        unique_attachments = []
-        seen_elements = set()
-        for element in attachment_elements:
-            element_id = element.id
-            if element_id not in seen_elements:
-                seen_elements.add(element_id)
-                unique_attachments.append(element)
+        unique_attachments = [match['element'] for match in attachment_matches]
         
         print(f"Total de anexos únicos encontrados: {len(unique_attachments)}")
         
@@ -1227,7 +2242,8 @@ def search_and_download_attachments(driver):
                 try:
                     print(f"Baixando anexo {i+1} de {len(download_buttons)}...")
                     download_btn.click()
-                    time.sleep(DEFAULT_WAIT_TIME * 2)  # Aguarda entre downloads
+                    # Aguarda o download terminar antes do próximo
+                    download_watcher.wait_for_files(1, DEFAULT_WAIT_TIME * 10, "download: arquivo baixado")
                     print(f"Anexo {i+1} baixado com sucesso")
                 except Exception as e:
                     print(f"Erro ao baixar anexo {i+1}: {e}")
@@ -1240,7 +2256,10 @@ def search_and_download_attachments(driver):
                     
                     # Clica no anexo para abrir as opções
                     attachment.click()
-                    time.sleep(DEFAULT_WAIT_TIME)
+                    wait_for_condition(lambda: visible_element(driver, [
+                        (By.CSS_SELECTOR, "button[aria-label*='Download']"),
+                        (By.CSS_SELECTOR, "button[title*='Download']"),
+                    ]), DEFAULT_WAIT_TIME, "download: opções do anexo")
                     
                     # Procura e clica no botão de download
                     download_selectors = [
@@ -1251,21 +2270,18 @@ def search_and_download_attachments(driver):
                     ]
                     
                     download_found = False
-                    for by, selector in download_selectors:
-                        try:
-                            download_btn = wait.until(EC.element_to_be_clickable((by, selector)))
-                            download_btn.click()
-                            print(f"Anexo {i+1} baixado com sucesso")
-                            download_found = True
-                            break
-                        except:
-                            continue
+                    download_btn = selector_resolver.find(driver, 'baixar_anexo', download_selectors, DEFAULT_WAIT_TIME, clickable=True)
+                    if download_btn:
+                        download_btn.click()
+                        print(f"Anexo {i+1} baixado com sucesso")
+                        download_found = True
                     
                     if not download_found:
                         print(f"AVISO: Não foi possível baixar o anexo {i+1}")
                     
-                    # Aguarda entre downloads para evitar conflitos
-                    time.sleep(DEFAULT_WAIT_TIME * 2)
+                    # Aguarda o download terminar antes do próximo para evitar conflitos
+                    if download_found:
+                        download_watcher.wait_for_files(1, DEFAULT_WAIT_TIME * 10, "download: arquivo baixado")
                     
                 except Exception as e:
                     print(f"Erro ao processar anexo {i+1}: {e}")
@@ -1284,11 +2300,11 @@ def search_and_download_attachments(driver):
         except Exception as fallback_error:
             print(f"ERRO no método fallback: {fallback_error}")
 
-    time.sleep(DEFAULT_WAIT_TIME * 3)  # Aguarda downloads completarem
+    # Aguarda downloads completarem
+    download_watcher.wait_until_idle(DEFAULT_WAIT_TIME * 10, "download: downloads concluídos")
 
-    # MARCA O EMAIL COMO LIDO - SEM RECARREGAR A PÁGINA
-    print("Marcando email como lido com clique direito...")
-    
+def return_to_email_list(driver):
+    """Volta do email aberto para a lista, sem recarregar a página."""
     # VOLTA PARA A LISTA DE EMAILS SEM RECARREGAR A PÁGINA
     try:
         print("Voltando para a lista de emails usando botão Back...")
@@ -1301,16 +2317,12 @@ def search_and_download_attachments(driver):
         ]
         
         back_found = False
-        for by, selector in back_selectors:
-            try:
-                back_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                back_button.click()
-                print("Voltou para a lista de emails usando botão Back")
-                back_found = True
-                time.sleep(DEFAULT_WAIT_TIME * 2)
-                break
-            except:
-                continue
+        back_button = selector_resolver.find(driver, 'voltar', back_selectors, DEFAULT_WAIT_TIME, clickable=True)
+        if back_button:
+            back_button.click()
+            print("Voltou para a lista de emails usando botão Back")
+            back_found = True
+            wait_for_condition(lambda: text_visible(driver, EMAIL_SUBJECT), DEFAULT_WAIT_TIME * 2, "download: lista de emails")
         
         # SE NÃO ENCONTRAR O BOTÃO BACK, USA O ESC PARA VOLTAR
         if not back_found:
@@ -1318,28 +2330,24 @@ def search_and_download_attachments(driver):
             actions = ActionChains(driver)
             actions.send_keys(Keys.ESCAPE).perform()
             print("Tecla ESC pressionada para voltar à lista")
-            time.sleep(DEFAULT_WAIT_TIME * 2)
+            wait_for_condition(lambda: text_visible(driver, EMAIL_SUBJECT), DEFAULT_WAIT_TIME * 2, "download: lista de emails")
             
     except Exception as e:
         print(f"Erro ao voltar para lista de emails: {e}")
         # NÃO RECARREGA A PÁGINA - continua mesmo com erro
 
-    # MARCA O EMAIL COMO LIDO NA LISTA DE NÃO LIDOS
+def mark_email_as_read(driver, email_key):
+    """Marca como lido (clique direito > Mark as read) o email identificado por `email_key`."""
+    print("Marcando email como lido com clique direito...")
     try:
         print(f"Encontrando o email com '{EMAIL_SUBJECT}' na lista de não lidos...")
         
-        # Encontra o email específico com o assunto na lista atual
-        target_email_element = None
-        
-        # Procura pelo email com o assunto na lista atual
-        subject_elements = driver.find_elements(By.XPATH, f"//span[@class='TtcXM' and contains(text(), '{EMAIL_SUBJECT}')]")
-        if not subject_elements:
-            subject_elements = driver.find_elements(By.XPATH, f"//*[contains(text(), '{EMAIL_SUBJECT}')]")
-        
-        for element in subject_elements:
-            if element.is_displayed() and EMAIL_SUBJECT in element.text:
-                target_email_element = element
-                break
+        # Procura o mesmo email (pela identificação da linha) entre os que têm o assunto
+        subject_emails = find_unread_subject_emails(driver)
+        target_email_element = next(
+            (element for element in subject_emails if get_email_key(element) == email_key),
+            subject_emails[0] if subject_emails else None
+        )
         
         if not target_email_element:
             print("AVISO: Não foi possível encontrar o email na lista atual, mas continuando...")
@@ -1347,7 +2355,7 @@ def search_and_download_attachments(driver):
             return
         
         # Encontra o container completo do email
-        email_container = target_email_element.find_element(By.XPATH, "./ancestor::div[contains(@class, 'listItem') or contains(@role, 'option') or contains(@data-convid, '')][1]")
+        email_container = get_email_container(target_email_element)
         
         # CLIQUE DIREITO NO EMAIL
         print("Clicando com botão direito no email...")
@@ -1355,561 +2363,2054 @@ def search_and_download_attachments(driver):
         actions.context_click(email_container).perform()
         print("Clique direito realizado no email")
         
-        # Aguarda 1 segundo para o menu carregar
-        time.sleep(1)
+        # Aguarda o menu de contexto carregar
+        wait_for_condition(lambda: text_visible(driver, 'Mark as read'), DEFAULT_WAIT_TIME, "download: menu de contexto")
         
-        # USA O XPATH ESPECÍFICO PARA "MARK AS READ"
+        # USA O XPATH ESPECÍFICO PARA "MARK AS READ" (COM ALTERNATIVA SIMPLIFICADA)
         print("Clicando em 'Mark as read'...")
+        mark_as_read_selectors = [
+            (By.XPATH, "//span[@class='fui-MenuItem__content r1ls86vo' and contains(text(), 'Mark as read')]"),
+            (By.XPATH, "//span[contains(text(), 'Mark as read')]"),
+        ]
+        mark_as_read_option = selector_resolver.find(driver, 'marcar_como_lido', mark_as_read_selectors, DEFAULT_WAIT_TIME, clickable=True)
         try:
-            mark_as_read_option = wait.until(EC.element_to_be_clickable(
-                (By.XPATH, "//span[@class='fui-MenuItem__content r1ls86vo' and contains(text(), 'Mark as read')]")))
+            if not mark_as_read_option:
+                raise Exception("Opção 'Mark as read' não encontrada")
             mark_as_read_option.click()
             print("SUCESSO: Email marcado como lido na lista de não lidos!")
-            
         except Exception as e:
             print(f"ERRO ao clicar em 'Mark as read': {e}")
-            print("Tentando alternativa...")
-            
-            # TENTA ALTERNATIVA SIMPLIFICADA
-            try:
-                mark_as_read_alternative = wait.until(EC.element_to_be_clickable(
-                    (By.XPATH, "//span[contains(text(), 'Mark as read')]")))
-                mark_as_read_alternative.click()
-                print("SUCESSO: Email marcado como lido usando alternativa!")
-                
-            except Exception as e2:
-                print(f"ERRO na alternativa: {e2}")
-                print("Não foi possível marcar o email como lido")
+            print("Não foi possível marcar o email como lido")
         
     except Exception as e:
         print(f"ERRO ao marcar email como lido: {e}")
 
-    time.sleep(DEFAULT_WAIT_TIME)
-    print("Processo de download e marcação como lido concluído!")
+    # Aguarda o menu de contexto fechar (ação aplicada)
+    wait_for_condition(lambda: no_visible_element(driver, [(By.XPATH, "//span[contains(text(), 'Mark as read')]")]),
+                       DEFAULT_WAIT_TIME, "download: marcado como lido")
 
-def send_email_with_attachment(driver, pdf_paths, hospital_name, hospital_emails):
+def search_and_download_attachments(driver, download_watcher=None):
     """
-    Envia um email com MÚLTIPLOS PDFs anexados para os emails específicos do hospital.
-    AGORA ACEITA LISTA DE PDFs E CONTINUA MESMO COM ERRO.
+    Procura TODOS os emails não lidos com o assunto configurado e baixa os anexos de cada um
+    em uma subpasta própria (downloads/email_01, email_02...), marcando cada email como lido.
+    Cada download é acompanhado pelo `download_watcher` (criado aqui se não for informado).
+    Retorna a lista de subpastas usadas.
     """
-    global email_status_report
+    if download_watcher is None:
+        download_watcher = DownloadWatcher(DOWNLOAD_FOLDER)
     
-    wait = WebDriverWait(driver, 15)
+    processed_keys = set()
+    message_folders = []
     
     try:
-        # VERIFICAÇÃO DOS ARQUIVOS PDF - se nenhum existir, registra erro mas continua
-        valid_pdfs = []
-        for pdf_path in pdf_paths:
-            if pdf_path.exists():
-                valid_pdfs.append(pdf_path)
-            else:
-                print(f"AVISO: Arquivo PDF não encontrado: {pdf_path}")
-        
-        if not valid_pdfs:
-            print(f"ERRO: Nenhum arquivo PDF válido encontrado para {hospital_name}")
-            email_status_report.append({
-                'hospital': hospital_name,
-                'arquivo': 'Nenhum arquivo válido',
-                'situacao': 'Erro - Nenhum PDF encontrado'
-            })
-            return False
-        
-        # Busca os emails do hospital usando match flexível
-        hospital_email_data = find_hospital_email(hospital_name, hospital_emails)
-        if not hospital_email_data:
-            print(f"AVISO: Não foram encontrados emails para o hospital {hospital_name}")
-            email_status_report.append({
-                'hospital': hospital_name,
-                'arquivo': f"{len(pdf_paths)} arquivos",
-                'situacao': 'Erro - Email do hospital não encontrado na planilha'
-            })
-            return False
-        
-        to_emails = hospital_email_data['to']
-        cc_emails = hospital_email_data['cc']
-        
-        print(f"Enviando email para {hospital_name}: To={', '.join(to_emails)}, Cc={', '.join(cc_emails)}")
-        print(f"Arquivos PDF ({len(valid_pdfs)}): {[p.name for p in valid_pdfs]}")
-        
-        print("Procurando botao de novo email...")
-        
-        # Tenta varios seletores para o botao New mail
-        new_email_selectors = [
-            (By.XPATH, "//button[.//span[contains(text(), 'New') or contains(text(), 'Novo')]]"),
-            (By.CSS_SELECTOR, "button[aria-label*='New mail'], button[aria-label*='Nova mensagem']"),
-            (By.CSS_SELECTOR, "button[data-tid*='newMail']"),
-            (By.XPATH, "//button[contains(@aria-label, 'New mail')]"),
-            (By.CSS_SELECTOR, "button[title*='New Mail']"),
-            (By.CSS_SELECTOR, "i[data-icon-name*='Mail']"),
-        ]
-        
-        new_email_button = None
-        for by, selector in new_email_selectors:
-            try:
-                new_email_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                print(f"Botao New mail encontrado com: {by} = {selector}")
+        while len(message_folders) < MAX_EMAILS_PER_RUN:
+            # Recarrega a lista filtrada a cada email: os já marcados como lidos saem dela
+            if not open_unread_email_list(driver):
                 break
-            except:
-                continue
-        
-        if not new_email_button:
-            # Tenta método alternativo
-            try:
-                all_buttons = driver.find_elements(By.TAG_NAME, "button")
-                for button in all_buttons:
-                    try:
-                        text = button.text.lower()
-                        aria_label = button.get_attribute('aria-label') or ''
-                        if 'new' in text or 'novo' in text or 'mail' in text or 'email' in text or 'mensagem' in text:
-                            if button.is_displayed() and button.is_enabled():
-                                button.click()
-                                new_email_button = button
-                                print("Botão New mail encontrado por texto/aria-label")
-                                break
-                    except:
-                        continue
-            except Exception as e:
-                print(f"Erro no método alternativo: {e}")
             
-        if not new_email_button:
-            raise Exception("Nao foi possivel encontrar o botao de novo email")
-            
-        new_email_button.click()
-        time.sleep(3)
-        
-        print("Aguardando janela de novo email carregar...")
-        time.sleep(5)
-        
-        print("Preenchendo destinatario...")
-        # Campo To - SELEÇÕES ESPECÍFICAS PARA O OUTLOOK WEB
-        to_selectors = [
-            (By.CSS_SELECTOR, "div[aria-label='To'][contenteditable='true']"),
-            (By.CSS_SELECTOR, "div[aria-label*='To'][contenteditable='true']"),
-            (By.CSS_SELECTOR, "div[role='textbox'][aria-label*='To']"),
-            (By.CSS_SELECTOR, "div.EditorClass[contenteditable='true']"),
-            (By.CSS_SELECTOR, "div[contenteditable='true'][aria-label*='To']"),
-            (By.XPATH, "//div[@contenteditable='true' and contains(@aria-label, 'To')]"),
-            (By.XPATH, "//div[@role='textbox' and contains(@aria-label, 'To')]"),
-        ]
-        
-        to_field = None
-        for by, selector in to_selectors:
-            try:
-                to_field = wait.until(EC.presence_of_element_located((by, selector)))
-                print(f"Campo To encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
-        
-        if not to_field:
-            # Busca alternativa por qualquer div contenteditable que possa ser o campo To
+            print(f"Procurando email com '{EMAIL_SUBJECT}'...")
             try:
-                divs = driver.find_elements(By.CSS_SELECTOR, "div[contenteditable='true']")
-                for div in divs:
-                    try:
-                        aria_label = div.get_attribute('aria-label') or ''
-                        if 'to' in aria_label.lower() or 'para' in aria_label.lower():
-                            to_field = div
-                            print("Campo To encontrado por busca alternativa em divs contenteditable")
-                            break
-                    except:
-                        continue
+                candidates = [element for element in find_unread_subject_emails(driver)
+                              if get_email_key(element) not in processed_keys]
             except Exception as e:
-                print(f"Erro na busca alternativa do campo To: {e}")
-        
-        if to_field:
-            print("Preenchendo campo To (div contenteditable)...")
-            
-            # Foca no campo
-            to_field.click()
-            time.sleep(1)
-            
-            # Limpa o conteúdo existente usando JavaScript
-            try:
-                driver.execute_script("arguments[0].innerHTML = '';", to_field)
-                print("Conteúdo limpo via JavaScript")
-            except:
-                # Fallback: usa ActionChains para limpar
-                try:
-                    actions = ActionChains(driver)
-                    actions.key_down(Keys.CONTROL).send_keys('a').key_up(Keys.CONTROL).perform()
-                    time.sleep(1)
-                    actions.send_keys(Keys.DELETE).perform()
-                    time.sleep(1)
-                    print("Conteúdo limpo via ActionChains")
-                except Exception as e:
-                    print(f"Erro ao limpar campo: {e}")
-            
-            # Digita os emails um por um com pausas
-            to_emails_str = ', '.join(to_emails)
-            print(f"Digitando emails no campo To: {to_emails_str}")
-            
-            for email in to_emails:
-                to_field.send_keys(email)
-                time.sleep(0.5)
-                to_field.send_keys(",")
-                time.sleep(0.3)
-            
-            # Remove a última vírgula se existir
-            time.sleep(1)
-            
-            print("Campo To preenchido com sucesso")
-            time.sleep(2)
-            
-            # Pressiona TAB para sair do campo e confirmar os emails
-            print("Pressionando TAB para sair do campo To...")
-            actions = ActionChains(driver)
-            actions.send_keys(Keys.TAB).perform()
-            time.sleep(2)
+                print(f"ERRO ao procurar email com '{EMAIL_SUBJECT}': {e}")
+                break
             
-        else:
-            print("ERRO: Campo To não encontrado")
-            raise Exception("Campo To não encontrado")
-        
-        # PREENCHER CAMPO CC
-        print("Preenchendo campo Cc...")
-        if cc_emails:  # So preenche se houver emails no Cc
-            print(f"Emails CC encontrados: {cc_emails}")
+            if not candidates:
+                if not message_folders:
+                    print(f"ERRO: Nenhum email com '{EMAIL_SUBJECT}' encontrado")
+                break
             
-            # Tenta varios seletores para o campo Cc
-            cc_selectors = [
-                # Primeiro tenta encontrar por texto/clique no link "Cc"
-                (By.XPATH, "//span[contains(text(), 'Cc')]"),
-                (By.CSS_SELECTOR, "button[aria-label*='Cc']"),
-                (By.CSS_SELECTOR, "a[aria-label*='Cc']"),
-                
-                # Depois tenta os campos de entrada
-                (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div[1]/div/div/div/div[3]/div/div/div[3]/div[1]/div/div/div/div/div[3]/div[1]/div/div[4]/div/span/span[2]/div/div[1]"),
-                (By.CSS_SELECTOR, "div[role='textbox'][aria-label='Cc']"),
-                (By.CSS_SELECTOR, "input[aria-label*='Cc']"),
-                (By.CSS_SELECTOR, "div[aria-label*='Cc']"),
-            ]
+            target_email_element = candidates[0]
+            email_key = get_email_key(target_email_element)
+            processed_keys.add(email_key)
             
-            cc_field = None
-            cc_found_by_click = False
+            message_folder = create_message_download_folder(len(message_folders) + 1)
+            message_folders.append(message_folder)
+            print(f"\n--- Email {len(message_folders)}: {target_email_element.text} -> {message_folder.name} ---")
             
-            # Estrategia 1: Tenta clicar no link/texto "Cc" primeiro
-            for by, selector in cc_selectors[:3]:
-                try:
-                    cc_link = wait.until(EC.element_to_be_clickable((by, selector)))
-                    print(f"Link Cc encontrado com: {by} = {selector}")
-                    cc_link.click()
-                    print("Clicou no link Cc")
-                    cc_found_by_click = True
-                    time.sleep(2)
-                    break
-                except:
-                    continue
+            # Os anexos deste email vão para a subpasta dele
+            set_download_directory(driver, message_folder)
             
-            # Estrategia 2: Se nao encontrou o link, tenta encontrar o campo diretamente
-            if not cc_found_by_click:
-                print("Nao encontrou link Cc, procurando campo diretamente...")
-                for by, selector in cc_selectors[3:]:
-                    try:
-                        cc_field = wait.until(EC.presence_of_element_located((by, selector)))
-                        print(f"Campo Cc encontrado com: {by} = {selector}")
-                        break
-                    except:
-                        continue
+            if not open_email(driver, target_email_element):
+                continue
             
-            # Preenche o campo Cc
-            if cc_found_by_click or cc_field:
-                # Se clicou no link Cc, agora precisa encontrar o campo que apareceu
-                if cc_found_by_click:
-                    time.sleep(1)
-                    # Procura o campo Cc que deve ter aparecido apos o clique
-                    cc_field_selectors = [
-                        (By.CSS_SELECTOR, "div[role='textbox'][aria-label='Cc']"),
-                        (By.CSS_SELECTOR, "input[aria-label*='Cc']"),
-                        (By.CSS_SELECTOR, "div[aria-label*='Cc']"),
-                    ]
-                    
-                    for by, selector in cc_field_selectors:
-                        try:
-                            cc_field = wait.until(EC.presence_of_element_located((by, selector)))
-                            print(f"Campo Cc apareceu apos clique: {by} = {selector}")
-                            break
-                        except:
-                            continue
+            download_open_email_attachments(driver, download_watcher)
+            return_to_email_list(driver)
+            mark_email_as_read(driver, email_key)
+    finally:
+        try:
+            set_download_directory(driver, DOWNLOAD_FOLDER)
+        except Exception:
+            pass
+    
+    print(f"Processo de download e marcação como lido concluído! Emails processados: {len(message_folders)}")
+    return message_folders
+
+# ================== BUSCA DE ANEXOS POR IMAP (SEM INTERFACE) ==================
+# Com 'busca de anexos' = 'imap', o email é localizado pelo servidor (SEARCH UNSEEN SUBJECT),
+# os anexos são gravados direto na pasta de downloads e o email recebe a flag \Seen.
+# Não abre navegador nem depende de filtros, menus ou downloads do Chrome.
+
+IMAP_TIMEOUT = 60
+
+def unique_download_path(folder, filename):
+    """Caminho livre na pasta para o nome do anexo (acrescenta _1, _2... se já existir)."""
+    safe_name = Path(filename).name.strip() or "anexo"
+    path = folder / safe_name
+    counter = 1
+    while path.exists():
+        path = folder / f"{Path(safe_name).stem}_{counter}{Path(safe_name).suffix}"
+        counter += 1
+    return path
+
+def connect_imap():
+    """Abre a conexão IMAP autenticada com a caixa de entrada selecionada."""
+    print(f"Conectando ao IMAP {IMAP_HOST}:{IMAP_PORT}...")
+    if IMAP_SSL:
+        connection = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT, ssl_context=ssl.create_default_context(),
+                                       timeout=IMAP_TIMEOUT)
+    else:
+        connection = imaplib.IMAP4(IMAP_HOST, IMAP_PORT, timeout=IMAP_TIMEOUT)
+    connection.login(IMAP_USER, IMAP_PASSWORD)
+    connection.select('INBOX')
+    return connection
+
+def save_message_attachments(raw_message, folder):
+    """Grava cada anexo da mensagem (bytes RFC 822) na pasta. Retorna os caminhos gravados."""
+    message = message_from_bytes(raw_message, policy=email_policy.default)
+    saved_files = []
+    
+    for part in message.iter_attachments():
+        filename = part.get_filename()
+        if not filename:
+            continue
+        
+        target_path = unique_download_path(folder, filename)
+        target_path.write_bytes(part.get_payload(decode=True) or b"")
+        saved_files.append(target_path)
+        print(f"  Anexo salvo: {target_path.name} ({target_path.stat().st_size} bytes)")
+    
+    return saved_files
+
+def download_attachments_via_imap():
+    """
+    Procura TODOS os emails NÃO LIDOS com o assunto configurado pelo IMAP, grava os anexos
+    de cada um em uma subpasta própria (downloads/email_01, email_02...) e marca cada email
+    como lido. Retorna a lista de arquivos gravados.
+    """
+    connection = connect_imap()
+    
+    try:
+        # Assunto em UTF-8 vai como literal (pode ter acentos)
+        print(f"Procurando emails não lidos com assunto: {EMAIL_SUBJECT}")
+        connection.literal = EMAIL_SUBJECT.encode('utf-8')
+        status, data = connection.uid('SEARCH', 'CHARSET', 'UTF-8', 'UNSEEN', 'SUBJECT')
+        if status != 'OK':
+            raise Exception(f"Busca IMAP falhou: {data}")
+        
+        uids = data[0].split() if data and data[0] else []
+        if not uids:
+            print("Nenhum email não lido com esse assunto foi encontrado.")
+            return []
+        
+        print(f"Emails encontrados: {len(uids)}")
+        saved_files = []
+        
+        for index, uid in enumerate(uids[:MAX_EMAILS_PER_RUN], start=1):
+            try:
+                message_folder = create_message_download_folder(index)
+                print(f"\n--- Email {index} (UID {uid.decode()}) -> {message_folder.name} ---")
                 
-                if cc_field:
-                    # Limpa o campo primeiro (caso tenha algo)
-                    cc_field.clear()
-                    time.sleep(1)
-                    
-                    # Junta todos os emails CC com virgula
-                    cc_emails_str = ', '.join(cc_emails)
-                    cc_field.send_keys(cc_emails_str)
-                    print(f"Cc preenchido com: {cc_emails_str}")
-                    time.sleep(2)
-                    
-                    # Pressiona TAB para sair do campo Cc
-                    cc_field.send_keys(Keys.TAB)
-                    time.sleep(1)
-                else:
-                    print("AVISO: Campo Cc nao encontrado apos clique no link")
+                # PEEK não marca como lido; a flag só é gravada depois que os anexos estão no disco
+                status, data = connection.uid('FETCH', uid, '(BODY.PEEK[])')
+                raw_message = next((item[1] for item in data if isinstance(item, tuple)), None)
+                if status != 'OK' or raw_message is None:
+                    raise Exception(f"Não foi possível baixar o email UID {uid.decode()}")
+                
+                message_files = save_message_attachments(raw_message, message_folder)
+                saved_files.extend(message_files)
+                print(f"Anexos salvos: {len(message_files)}")
+                
+                connection.uid('STORE', uid, '+FLAGS', '(\\Seen)')
+                print("Email marcado como lido.")
+            except Exception as e:
+                print(f"ERRO ao processar email UID {uid.decode()}: {e} (continuando com os próximos)")
+        
+        print(f"Total de anexos salvos: {len(saved_files)}")
+        return saved_files
+        
+    finally:
+        try:
+            connection.logout()
+        except Exception:
+            pass
+
+# ================== RECICLAGEM DA SESSÃO DO NAVEGADOR (MEMÓRIA E LATÊNCIA) ==================
+# Em execuções longas a memória do Outlook Web cresce e cada email fica mais lento. O navegador de
+# envio é fechado e aberto de novo (com novo login) a cada 'reciclar navegador a cada emails', quando
+# a memória do Chrome passa de 'memoria maxima do chrome mb', quando a latência dos últimos emails
+# passa de RECYCLE_LATENCY_FACTOR vezes a do início da sessão, ou depois de um comando travado.
+# Cada comando ao navegador tem o tempo máximo 'tempo maximo por comando do navegador'.
+
+RECYCLE_LATENCY_WINDOW = 5  # emails usados para medir a latência (início da sessão e mais recentes)
+RECYCLE_LATENCY_FACTOR = 3
+
+# Erros que indicam a sessão do navegador travada ou perdida (e não só um elemento não encontrado)
+BROKEN_SESSION_MARKERS = ("timed out receiving message from renderer", "invalid session id",
+                          "chrome not reachable", "disconnected", "no such window", "session deleted",
+                          "max retries exceeded", "connection refused")
+
+def apply_webdriver_timeouts(driver):
+    """Tempo máximo de cada comando HTTP ao chromedriver, do carregamento de página e dos scripts."""
+    try:
+        # Sem isso o Selenium espera a resposta do chromedriver indefinidamente
+        driver.command_executor._client_config.timeout = WEBDRIVER_CALL_TIMEOUT
+    except AttributeError:
+        print("AVISO: Esta versão do Selenium não permite limitar o tempo dos comandos ao navegador")
+    driver.set_page_load_timeout(WEBDRIVER_CALL_TIMEOUT)
+    driver.set_script_timeout(WEBDRIVER_CALL_TIMEOUT)
+
+def is_broken_session_error(error):
+    """True se o erro é de comando travado (tempo máximo esgotado) ou de sessão do navegador perdida."""
+    if isinstance(error, (HttpTimeoutError, TimeoutError, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in BROKEN_SESSION_MARKERS)
+
+def chrome_memory_mb(driver):
+    """
+    Memória (soma do RSS) do chromedriver e dos processos do Chrome abertos por ele, em MB.
+    Retorna None se o psutil não estiver instalado ou o processo não for encontrado.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        service_process = psutil.Process(driver.service.process.pid)
+        processes = [service_process] + service_process.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return None
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / 1048576
+
+class BrowserSessionWatchdog:
+    """Acompanha os emails, a latência e a memória de uma sessão do navegador e diz quando reciclar."""
+    
+    def __init__(self):
+        self.recycles = 0
+        self._memory_warning_shown = False
+        self.reset()
+    
+    def reset(self):
+        """Nova sessão: zera a contagem, a latência de referência e o motivo."""
+        self.sent = 0
+        self.latencies = []
+        self.baseline = None
+        self.reason = None
+    
+    def record_send(self, seconds, driver):
+        """Registra um email enviado e verifica os limites da sessão."""
+        self.sent += 1
+        self.latencies.append(seconds)
+        if self.baseline is None and len(self.latencies) >= RECYCLE_LATENCY_WINDOW:
+            self.baseline = statistics.median(self.latencies[:RECYCLE_LATENCY_WINDOW])
+        
+        if RECYCLE_EVERY_EMAILS and self.sent >= RECYCLE_EVERY_EMAILS:
+            self.reason = f"{self.sent} emails enviados nesta sessão"
+            return
+        
+        if CHROME_MAX_MEMORY_MB:
+            memory = chrome_memory_mb(driver)
+            if memory is None and not self._memory_warning_shown:
+                print("AVISO: psutil não instalado (ou processo do Chrome não encontrado): memória do navegador não monitorada")
+                self._memory_warning_shown = True
+            elif memory is not None and memory > CHROME_MAX_MEMORY_MB:
+                self.reason = f"memória do Chrome em {memory:.0f} MB (limite {CHROME_MAX_MEMORY_MB} MB)"
+                return
+        
+        if self.baseline and len(self.latencies) >= 2 * RECYCLE_LATENCY_WINDOW:
+            recent = statistics.median(self.latencies[-RECYCLE_LATENCY_WINDOW:])
+            if recent > self.baseline * RECYCLE_LATENCY_FACTOR:
+                self.reason = f"latência dos últimos emails em {recent:.1f}s (início da sessão: {self.baseline:.1f}s)"
+    
+    def record_failure(self, error):
+        """Um comando travado ou a sessão perdida obrigam a reciclar antes do próximo email."""
+        if is_broken_session_error(error):
+            self.reason = f"sessão do navegador travada ou perdida ({str(error).splitlines()[0][:100]})"
+
+# ================== SESSÕES RESERVA DO NAVEGADOR (JÁ AUTENTICADAS) ==================
+# Com 'sessoes reserva do navegador' > 0, uma thread mantém esse número de navegadores já logados no
+# Outlook Web, verificados a cada STANDBY_HEALTH_INTERVAL segundos (os que caíram ou perderam o login
+# são trocados). Uma sessão de envio que abre, é reciclada ou cai pega um deles na hora, sem esperar
+# start_browser + login, e a thread repõe a reserva em segundo plano. Cada reserva é um Chrome aberto.
+
+STANDBY_HEALTH_INTERVAL = 60
+OUTLOOK_READY_LOCATORS = [(By.CSS_SELECTOR, "div[role='navigation']")]
+
+def session_healthy(driver):
+    """A sessão responde e continua logada (painel de navegação do Outlook visível)."""
+    try:
+        return visible_element(driver, OUTLOOK_READY_LOCATORS) is not None
+    except Exception:
+        return False
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+class StandbySessionPool:
+    """
+    Navegadores reserva já autenticados. take() entrega um na hora (ou None se a reserva estiver vazia);
+    a thread da reserva faz os logins, as verificações e a reposição. Só a thread usa um navegador
+    enquanto ele está na reserva.
+    """
+    
+    def __init__(self, size, headless=False):
+        self.size = size
+        self.headless = headless
+        self.created = 0
+        self.taken = 0
+        self.discarded = 0
+        self._ready = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sessoes-reserva", daemon=True)
+    
+    def start(self):
+        print(f"Preparando {self.size} sessão(ões) reserva do navegador em segundo plano...")
+        self._thread.start()
+        return self
+    
+    def take(self):
+        """Retira uma sessão pronta da reserva, ou None se não houver."""
+        with self._lock:
+            driver = self._ready.pop(0) if self._ready else None
+            if driver:
+                self.taken += 1
+        self._wake.set()  # repõe a reserva
+        return driver
+    
+    def _missing(self):
+        """Quantas sessões faltam para completar a reserva."""
+        with self._lock:
+            return self.size - len(self._ready)
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self._check_health()
+            while not self._stop.is_set() and self._missing() > 0:
+                if not self._add_session():
+                    break  # login falhou: tenta de novo na próxima verificação
+            self._wake.wait(STANDBY_HEALTH_INTERVAL)
+            self._wake.clear()
+    
+    def _add_session(self):
+        driver = None
+        try:
+            driver = start_browser(headless=self.headless)
+            login_to_outlook(driver)
+        except Exception as e:
+            print(f"AVISO: Não foi possível preparar uma sessão reserva do navegador: {e}")
+            if driver:
+                quit_driver(driver)
+            return False
+        with self._lock:
+            if not self._stop.is_set():
+                self._ready.append(driver)
+                self.created += 1
+                return True
+        quit_driver(driver)
+        return False
+    
+    def _check_health(self):
+        """Verifica uma sessão por vez (as demais continuam disponíveis para take())."""
+        with self._lock:
+            sessions = list(self._ready)
+        for driver in sessions:
+            with self._lock:
+                if driver not in self._ready:
+                    continue  # retirada por uma sessão de envio
+                self._ready.remove(driver)
+            if session_healthy(driver):
+                with self._lock:
+                    self._ready.append(driver)
             else:
-                print("AVISO: Campo Cc nao encontrado, continuando sem preencher Cc")
+                print("AVISO: Sessão reserva do navegador caiu ou perdeu o login; será trocada")
+                quit_driver(driver)
+                with self._lock:
+                    self.discarded += 1
+    
+    def stop(self):
+        """Encerra a thread e fecha os navegadores que sobraram na reserva."""
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=WEBDRIVER_CALL_TIMEOUT)
+        with self._lock:
+            sessions, self._ready = self._ready, []
+        for driver in sessions:
+            quit_driver(driver)
+        print(f"Sessões reserva: {self.created} preparadas, {self.taken} usadas, {self.discarded} trocadas")
+
+# Reserva de navegadores logados (iniciada no começo do programa; None = desativada)
+standby_pool = None
+
+def start_standby_pool():
+    """Inicia a reserva de navegadores logados, se configurada (só no envio pelo Outlook Web)."""
+    global standby_pool
+    if STANDBY_SESSIONS > 0 and MAIL_TRANSPORT == 'outlook':
+        standby_pool = StandbySessionPool(STANDBY_SESSIONS, headless=HEADLESS_MODE).start()
+
+def stop_standby_pool():
+    global standby_pool
+    if standby_pool:
+        standby_pool.stop()
+        standby_pool = None
+
+# ================== TRANSPORTE DE EMAIL (OUTLOOK WEB OU SMTP) ==================
+# O envio passa por um transporte: a automação do Outlook Web (padrão) ou uma conexão SMTP
+# autenticada, reaproveitada para todos os emails da sessão. Escolhido por 'transporte de email'.
+
+SMTP_TIMEOUT = 60
+
+class OutgoingEmail:
+    """
+    Mensagem a ser enviada: destinatários, assunto, corpo e anexos (lista de Path).
+    `html_body` é a versão em HTML do corpo (opcional); `inline_files` são os PDFs cujo
+    conteúdo foi para o corpo em vez de ir anexado (identificam a mensagem no outbox).
+    """
+    
+    def __init__(self, to, cc, subject, body, attachments, html_body=None, inline_files=None):
+        self.to = list(to)
+        self.cc = list(cc or [])
+        self.subject = subject
+        self.body = body
+        self.attachments = list(attachments or [])
+        self.html_body = html_body
+        self.inline_files = list(inline_files or [])
+
+class MailTransport(ABC):
+    """
+    Interface dos transportes de email. Uso:
+        with create_mail_transport() as transport:
+            transport.send(message)
+    send() levanta exceção quando o email não sai. Um transporte sem send() falha já ao ser criado.
+    """
+    name = "base"
+    recycles = 0  # Quantas vezes a sessão foi reaberta (Outlook Web)
+    
+    def open(self):
+        pass
+    
+    @abstractmethod
+    def send(self, message):
+        """Envia a mensagem (OutgoingEmail); levanta exceção se ela não sair."""
+    
+    def close(self):
+        pass
+    
+    def __enter__(self):
+        self.open()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+class OutlookWebTransport(MailTransport):
+    """
+    Envio pela interface do Outlook Web, com navegador e login próprios (ou uma sessão reserva já
+    logada, se houver). O navegador é reciclado antes de um email quando o BrowserSessionWatchdog pede.
+    """
+    name = "outlook"
+    
+    def __init__(self, headless=False):
+        self.headless = headless
+        self.driver = None
+        self.watchdog = BrowserSessionWatchdog()
+    
+    @property
+    def recycles(self):
+        return self.watchdog.recycles
+    
+    def open(self):
+        self.driver = standby_pool.take() if standby_pool else None
+        if self.driver:
+            print("Usando uma sessão reserva do navegador (já logada)")
         else:
-            print("Nenhum email para preencher no campo Cc")
-        # FIM DO CAMPO CC
+            self.driver = start_browser(headless=self.headless)
+            login_to_outlook(self.driver)
+        self.watchdog.reset()
+    
+    def recycle(self, reason):
+        """Fecha o navegador e abre outro, com novo login."""
+        print(f"Reciclando o navegador de envio: {reason}")
+        self.close()
+        self.open()
+        self.watchdog.recycles += 1
+    
+    def send(self, message):
+        if self.watchdog.reason or self.driver is None:
+            self.recycle(self.watchdog.reason or "navegador fechado")
+        start = time.monotonic()
+        try:
+            compose_outlook_email(self.driver, message)
+        except Exception as e:
+            self.watchdog.record_failure(e)
+            raise
+        self.watchdog.record_send(time.monotonic() - start, self.driver)
+    
+    def close(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except:
+                pass
+            self.driver = None
+
+class SmtpTransport(MailTransport):
+    """
+    Envio por SMTP/MIME sobre uma única conexão autenticada, aberta em open() e
+    reaproveitada por todos os emails. Se o servidor derrubar a conexão, reconecta uma vez.
+    """
+    name = "smtp"
+    
+    def __init__(self, host, port=587, user=None, password=None, starttls=True, sender=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender or user
+        self.server = None
+    
+    def open(self):
+        self.server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        self.server.ehlo()
+        if self.starttls:
+            self.server.starttls(context=ssl.create_default_context())
+            self.server.ehlo()
+        if self.user and self.password:
+            self.server.login(self.user, self.password)
+    
+    def send(self, message):
+        mime_message = build_mime_message(message, self.sender)
+        try:
+            self._send_mime(mime_message)
+        except smtplib.SMTPResponseException as e:
+            # Respostas 4xx (421, 450, 451, 452...) e recusas por cota são limite temporário
+            if is_throttle_response(e.smtp_code, e.smtp_error):
+                raise MailThrottledError(f"SMTP {e.smtp_code} {decode_smtp_text(e.smtp_error)}") from e
+            raise
+        except smtplib.SMTPRecipientsRefused as e:
+            if e.recipients and all(is_throttle_response(code, text) for code, text in e.recipients.values()):
+                code, text = next(iter(e.recipients.values()))
+                raise MailThrottledError(f"SMTP {code} {decode_smtp_text(text)}") from e
+            raise
+    
+    def _send_mime(self, mime_message):
+        try:
+            self.server.send_message(mime_message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+            print(f"Conexão SMTP perdida ({e}), reconectando...")
+            self.close()
+            self.open()
+            self.server.send_message(mime_message)
+    
+    def close(self):
+        if self.server:
+            try:
+                self.server.quit()
+            except Exception:
+                try:
+                    self.server.close()
+                except Exception:
+                    pass
+            self.server = None
+
+def build_mime_message(message, sender):
+    """Monta a mensagem MIME (texto + anexos) a partir de um OutgoingEmail."""
+    mime_message = EmailMessage()
+    mime_message['From'] = sender
+    mime_message['To'] = ', '.join(message.to)
+    if message.cc:
+        mime_message['Cc'] = ', '.join(message.cc)
+    mime_message['Subject'] = message.subject
+    mime_message['Date'] = formatdate(localtime=True)
+    mime_message['Message-ID'] = make_msgid()
+    mime_message.set_content(message.body)
+    if message.html_body:
+        mime_message.add_alternative(message.html_body, subtype='html')
+    
+    for attachment_path in message.attachments:
+        content_type, _ = mimetypes.guess_type(attachment_path.name)
+        maintype, subtype = (content_type or 'application/octet-stream').split('/', 1)
+        mime_message.add_attachment(attachment_path.read_bytes(), maintype=maintype,
+                                    subtype=subtype, filename=attachment_path.name)
+    
+    return mime_message
+
+def create_mail_transport():
+    """Cria o transporte configurado em 'transporte de email' (ainda não aberto)."""
+    if MAIL_TRANSPORT == 'smtp':
+        return SmtpTransport(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD,
+                             starttls=SMTP_STARTTLS, sender=OUTLOOK_EMAIL)
+    return OutlookWebTransport(headless=HEADLESS_MODE)
+
+HOSPITAL_EMAIL_BODY = """Prezados(as), Bom dia.
+
+Segue abaixo a relação de boletos em aberto com o hospital, caso tenha sido efetuado o pagamento favor enviar o comprovante para baixa.."""
+
+# ================== DESTINATÁRIOS EM LOTE (TO/CC) ==================
+# Todos os endereços de um campo vão em um único send_keys separados por ';'. Depois de o Outlook
+# resolver, uma única leitura do DOM confere os chips de destinatário; só os endereços que não
+# viraram chip válido são digitados de novo, um por um.
+
+RECIPIENT_SEPARATOR = ';'
+
+# Lista de chips do próprio campo: o campo, se os chips ficam dentro dele; o elemento indicado
+# por aria-owns/aria-controls; ou o poço de chips mais próximo que não contenha outro campo
+# (para nunca juntar os chips do To com os do Cc). Retorna null se não encontrar.
+RECIPIENT_CHIP_LIST_JS = """
+const CHIP_SELECTOR = "[role='listitem'], [role='option'], [class*='chip'], [class*='persona'], [class*='Persona']";
+const EDITABLE_SELECTOR = "input:not([type='hidden']), textarea, [contenteditable='true']";
+function chipList(field) {
+    if (field.querySelector(CHIP_SELECTOR)) return field;
+    for (const attribute of ['aria-owns', 'aria-controls']) {
+        for (const id of (field.getAttribute(attribute) || '').split(/\\s+/).filter(Boolean)) {
+            const owned = document.getElementById(id);
+            // A lista de sugestões (listbox) não é a lista de chips
+            if (owned && owned.getAttribute('role') !== 'listbox') return owned;
+        }
+    }
+    for (let node = field.parentElement; node && node !== document.body; node = node.parentElement) {
+        const otherField = Array.from(node.querySelectorAll(EDITABLE_SELECTOR))
+            .some(el => el !== field && !field.contains(el) && !el.contains(field));
+        if (otherField) return null;
+        if (node.getAttribute('role') === 'group' || node.getAttribute('role') === 'list'
+            || node.querySelector(CHIP_SELECTOR)) return node;
+    }
+    return null;
+}
+"""
+
+# Situação de cada endereço nos chips do campo: resolvido, chip com erro ou ausente
+RECIPIENT_CHIPS_SCRIPT = RECIPIENT_CHIP_LIST_JS + """
+const field = arguments[0];
+const addresses = arguments[1];
+const container = chipList(field);
+if (!container) return null;
+const chips = Array.from(container.querySelectorAll(CHIP_SELECTOR));
+const describe = el => [el.innerText, el.title, el.getAttribute('aria-label')].filter(Boolean).join(' ').toLowerCase();
+const isInvalid = el => el.getAttribute('aria-invalid') === 'true'
+    || /error|invalid|unresolved/i.test(el.getAttribute('class') || '')
+    || !!el.querySelector('[aria-invalid="true"]');
+const result = {resolvidos: [], falhas: [], ausentes: [], chips_validos: chips.filter(chip => !isInvalid(chip)).length};
+for (const address of addresses) {
+    const chip = chips.find(item => describe(item).includes(address.toLowerCase()));
+    if (!chip) result.ausentes.push(address);
+    else if (isInvalid(chip)) result.falhas.push(address);
+    else result.resolvidos.push(address);
+}
+return result;
+"""
+
+# Remove (pelo botão do próprio chip) os chips com erro dos endereços informados
+REMOVE_RECIPIENT_CHIPS_SCRIPT = RECIPIENT_CHIP_LIST_JS + """
+const field = arguments[0];
+const addresses = arguments[1].map(address => address.toLowerCase());
+const container = chipList(field);
+if (!container) return 0;
+let removed = 0;
+for (const chip of container.querySelectorAll(CHIP_SELECTOR)) {
+    const text = [chip.innerText, chip.title, chip.getAttribute('aria-label')].join(' ').toLowerCase();
+    const button = chip.querySelector("button[aria-label*='Remove'], button[aria-label*='Remover'], button");
+    if (button && addresses.some(address => text.includes(address))) {
+        button.click();
+        removed++;
+    }
+}
+return removed;
+"""
+
+def read_recipient_chips(driver, field, addresses):
+    """
+    Situação de cada endereço nos chips do campo, em uma única leitura do DOM.
+    Falha se a lista de chips do campo não for encontrada (a busca não se estende a outros campos).
+    """
+    status = driver.execute_script(RECIPIENT_CHIPS_SCRIPT, field, list(addresses))
+    if status is None:
+        raise RuntimeError("Lista de destinatários do campo não encontrada")
+    return status
+
+def enter_recipients(driver, field, addresses, step_name):
+    """
+    Digita todos os endereços no campo de uma vez e confere os chips resolvidos.
+    Os que falharem são digitados de novo um por um. Retorna os endereços que continuaram sem resolver.
+    """
+    field.send_keys(RECIPIENT_SEPARATOR.join(addresses) + RECIPIENT_SEPARATOR)
+    wait_for_condition(element_text_stable(field), 5, f"{step_name} resolvidos")
+    
+    status = read_recipient_chips(driver, field, addresses)
+    failed = list(status['falhas'])
+    # Chips resolvidos podem mostrar só o nome de exibição: um endereço ausente
+    # só é considerado falha se faltarem chips válidos para todos os endereços
+    if status['ausentes'] and status['chips_validos'] < len(addresses) - len(failed):
+        failed += status['ausentes']
+    
+    if not failed:
+        print(f"{len(addresses)} destinatário(s) resolvido(s) de uma vez")
+        return []
+    
+    print(f"AVISO: {len(failed)} destinatário(s) não resolvido(s) de uma vez: {failed}. Digitando um por um...")
+    if status['chips_validos'] == 0:
+        # Nada virou chip: limpa o texto digitado para não duplicar os endereços
+        driver.execute_script("arguments[0].innerHTML = '';", field)
+    elif status['falhas']:
+        driver.execute_script(REMOVE_RECIPIENT_CHIPS_SCRIPT, field, status['falhas'])
+    
+    unresolved = []
+    for address in failed:
+        field.send_keys(address + RECIPIENT_SEPARATOR)
+        if not wait_for_condition(lambda: address in read_recipient_chips(driver, field, [address])['resolvidos'],
+                                  3, f"{step_name} endereço individual"):
+            unresolved.append(address)
+    
+    if unresolved:
+        print(f"AVISO: Destinatário(s) sem resolver após a digitação individual: {unresolved}")
+    return unresolved
+
+COMPOSE_DEEPLINK_MAX_URL = 2000  # Links maiores são truncados pelo navegador/Outlook: compõe pela interface
+
+def build_compose_deeplink(message):
+    """Link de composição do Outlook Web com To, Cc, assunto e corpo (em texto) já preenchidos."""
+    params = {'to': ','.join(message.to), 'subject': message.subject}
+    # O corpo em HTML não cabe no link: é colado no editor depois de abrir o email
+    if not message.html_body:
+        params['body'] = message.body
+    if message.cc:
+        params['cc'] = ','.join(message.cc)
+    base_url = OUTLOOK_WEB_URL.split('/mail', 1)[0]
+    return f"{base_url}/mail/deeplink/compose?{urlencode(params, quote_via=quote)}"
+
+def open_compose_deeplink(driver, message, step_prefix):
+    """
+    Abre o novo email pelo link de composição. Retorna False se o link não couber na URL ou se o
+    Outlook não preencher os campos (o rascunho é descartado e a composição segue pela interface).
+    """
+    compose_url = build_compose_deeplink(message)
+    if len(compose_url) > COMPOSE_DEEPLINK_MAX_URL:
+        print(f"Link de composição com {len(compose_url)} caracteres, compondo pela interface")
+        return False
+    
+    print("Abrindo novo email pelo link de composição...")
+    driver.get(compose_url)
+    
+    # Campos preenchidos pelo link: To com destinatários e o assunto da mensagem
+    def prefilled_fields():
+        to_field = visible_element(driver, COMPOSE_TO_LOCATORS)
+        subject_field = to_field and visible_element(driver, [(By.CSS_SELECTOR, "input[aria-label*='Subject']")])
+        return bool(subject_field and (to_field.text or '').strip()
+                    and subject_field.get_attribute('value') == message.subject)
+    
+    if wait_for_condition(prefilled_fields, 15, f"{step_prefix}: novo email pelo link"):
+        if message.html_body:
+            fill_compose_body(driver, message, step_prefix)
+        return True
+    
+    print("AVISO: O link de composição não preencheu os campos, compondo pela interface")
+    discard_outlook_draft(driver, step_prefix)
+    driver.get(OUTLOOK_WEB_URL)
+    return False
+
+def compose_outlook_email(driver, message, step_prefix="envio"):
+    """
+    Compõe e envia uma mensagem pela interface do Outlook Web: novo email, To, Cc,
+    assunto, corpo, anexos e Enviar. Levanta exceção se algum passo essencial falhar.
+    Com 'compor por link', To, Cc, assunto e corpo vêm no link de composição e só os
+    anexos e o Enviar passam pela interface.
+    """
+    if not (COMPOSE_DEEPLINK and open_compose_deeplink(driver, message, step_prefix)):
+        fill_compose_fields(driver, message, step_prefix)
+    attach_and_send_outlook_email(driver, message, step_prefix)
+
+def fill_compose_fields(driver, message, step_prefix):
+    """Novo email pelo botão e preenchimento de To, Cc, assunto e corpo campo a campo."""
+    print("Procurando botao de novo email...")
+    
+    # Tenta varios seletores para o botao New mail
+    new_email_selectors = [
+        (By.XPATH, "//button[.//span[contains(text(), 'New') or contains(text(), 'Novo')]]"),
+        (By.CSS_SELECTOR, "button[aria-label*='New mail'], button[aria-label*='Nova mensagem']"),
+        (By.CSS_SELECTOR, "button[data-tid*='newMail']"),
+        (By.XPATH, "//button[contains(@aria-label, 'New mail')]"),
+        (By.CSS_SELECTOR, "button[title*='New Mail']"),
+        (By.CSS_SELECTOR, "i[data-icon-name*='Mail']"),
+    ]
+    
+    new_email_button = selector_resolver.find(driver, 'novo_email', new_email_selectors, 15, clickable=True)
+    
+    if not new_email_button:
+        # Tenta método alternativo
+        try:
+            # Todos os botões filtrados por texto, visibilidade e estado em uma única consulta ao DOM
+            match = query_dom_first(driver, [(By.TAG_NAME, "button")], enabled_only=True,
+                                    text_contains=['new', 'novo', 'mail', 'email', 'mensagem'])
+            if match:
+                new_email_button = match['element']
+                print("Botão New mail encontrado por texto/aria-label")
+        except Exception as e:
+            print(f"Erro no método alternativo: {e}")
         
-        print("Preenchendo assunto...")
-        # Campo Subject
-        subject_selectors = [
-            (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div/div/div[3]/div/div/div[3]/div[1]/div/div/div/div/div[3]/div[2]/span/input"),
-            (By.CSS_SELECTOR, "input[aria-label*='Subject']"),
-            (By.CSS_SELECTOR, "input[placeholder*='Add a subject']"),
-            (By.CSS_SELECTOR, "input[name*='Subject']"),
+    if not new_email_button:
+        raise Exception("Nao foi possivel encontrar o botao de novo email")
+        
+    new_email_button.click()
+    
+    print("Aguardando janela de novo email carregar...")
+    # Aguarda a janela de composição abrir (campo To visível)
+    wait_for_condition(lambda: visible_element(driver, COMPOSE_TO_LOCATORS), 15, f"{step_prefix}: janela de novo email")
+    
+    print("Preenchendo destinatario...")
+    # Campo To - SELEÇÕES ESPECÍFICAS PARA O OUTLOOK WEB
+    to_selectors = [
+        (By.CSS_SELECTOR, "div[aria-label='To'][contenteditable='true']"),
+        (By.CSS_SELECTOR, "div[aria-label*='To'][contenteditable='true']"),
+        (By.CSS_SELECTOR, "div[role='textbox'][aria-label*='To']"),
+        (By.CSS_SELECTOR, "div.EditorClass[contenteditable='true']"),
+        (By.CSS_SELECTOR, "div[contenteditable='true'][aria-label*='To']"),
+        (By.XPATH, "//div[@contenteditable='true' and contains(@aria-label, 'To')]"),
+        (By.XPATH, "//div[@role='textbox' and contains(@aria-label, 'To')]"),
+    ]
+    
+    to_field = selector_resolver.find(driver, 'campo_para', to_selectors, 15)
+    
+    if not to_field:
+        # Busca alternativa por qualquer div contenteditable que possa ser o campo To
+        try:
+            # Filtra os divs pelo aria-label dentro do navegador (uma única consulta ao DOM)
+            match = query_dom_first(driver, [(By.CSS_SELECTOR, "div[contenteditable='true']")], visible_only=False,
+                                    text_contains=['to', 'para'], attributes=['aria-label'], match_text=False)
+            if match:
+                to_field = match['element']
+                print("Campo To encontrado por busca alternativa em divs contenteditable")
+        except Exception as e:
+            print(f"Erro na busca alternativa do campo To: {e}")
+    
+    if to_field:
+        print("Preenchendo campo To (div contenteditable)...")
+        
+        # Foca no campo
+        to_field.click()
+        wait_for_condition(lambda: is_focused(driver, to_field), 2, f"{step_prefix}: foco no campo To")
+        
+        # Limpa o conteúdo existente usando JavaScript
+        try:
+            driver.execute_script("arguments[0].innerHTML = '';", to_field)
+            print("Conteúdo limpo via JavaScript")
+        except:
+            # Fallback: usa ActionChains para limpar
+            try:
+                actions = ActionChains(driver)
+                actions.key_down(Keys.CONTROL).send_keys('a').key_up(Keys.CONTROL).perform()
+                actions.send_keys(Keys.DELETE).perform()
+                wait_for_condition(lambda: not to_field.text.strip(), 2, f"{step_prefix}: campo To limpo")
+                print("Conteúdo limpo via ActionChains")
+            except Exception as e:
+                print(f"Erro ao limpar campo: {e}")
+        
+        # Digita todos os emails de uma vez e confere os chips resolvidos
+        print(f"Digitando emails no campo To: {'; '.join(message.to)}")
+        enter_recipients(driver, to_field, message.to, f"{step_prefix}: destinatários To")
+        
+        print("Campo To preenchido com sucesso")
+        
+        # Pressiona TAB para sair do campo e confirmar os emails
+        print("Pressionando TAB para sair do campo To...")
+        actions = ActionChains(driver)
+        actions.send_keys(Keys.TAB).perform()
+        wait_for_condition(lambda: not is_focused(driver, to_field), 2, f"{step_prefix}: saída do campo To")
+        
+    else:
+        print("ERRO: Campo To não encontrado")
+        raise Exception("Campo To não encontrado")
+    
+    # PREENCHER CAMPO CC
+    print("Preenchendo campo Cc...")
+    if message.cc:  # So preenche se houver emails no Cc
+        print(f"Emails CC encontrados: {message.cc}")
+        
+        # Tenta varios seletores para o campo Cc
+        cc_selectors = [
+            # Primeiro tenta encontrar por texto/clique no link "Cc"
+            (By.XPATH, "//span[contains(text(), 'Cc')]"),
+            (By.CSS_SELECTOR, "button[aria-label*='Cc']"),
+            (By.CSS_SELECTOR, "a[aria-label*='Cc']"),
+            
+            # Depois tenta os campos de entrada
+            (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div[1]/div/div/div/div[3]/div/div/div[3]/div[1]/div/div/div/div/div[3]/div[1]/div/div[4]/div/span/span[2]/div/div[1]"),
+            (By.CSS_SELECTOR, "div[role='textbox'][aria-label='Cc']"),
+            (By.CSS_SELECTOR, "input[aria-label*='Cc']"),
+            (By.CSS_SELECTOR, "div[aria-label*='Cc']"),
         ]
         
-        subject_field = None
-        for by, selector in subject_selectors:
+        cc_field = None
+        cc_found_by_click = False
+        
+        # Estrategia 1: Tenta clicar no link/texto "Cc" primeiro
+        cc_link = selector_resolver.find(driver, 'link_cc', cc_selectors[:3], DEFAULT_WAIT_TIME, clickable=True)
+        if cc_link:
             try:
-                subject_field = wait.until(EC.presence_of_element_located((by, selector)))
-                print(f"Campo Subject encontrado com: {by} = {selector}")
+                cc_link.click()
+                print("Clicou no link Cc")
+                cc_found_by_click = True
+            except Exception as e:
+                print(f"Erro ao clicar no link Cc: {e}")
+        
+        # Estrategia 2: Se nao encontrou o link, tenta encontrar o campo diretamente
+        if not cc_found_by_click:
+            print("Nao encontrou link Cc, procurando campo diretamente...")
+            cc_field = selector_resolver.find(driver, 'campo_cc', cc_selectors[3:], 15)
+        
+        # Preenche o campo Cc
+        if cc_found_by_click or cc_field:
+            # Se clicou no link Cc, agora precisa encontrar o campo que apareceu
+            if cc_found_by_click:
+                # Procura o campo Cc que deve ter aparecido apos o clique
+                cc_field_selectors = [
+                    (By.CSS_SELECTOR, "div[role='textbox'][aria-label='Cc']"),
+                    (By.CSS_SELECTOR, "input[aria-label*='Cc']"),
+                    (By.CSS_SELECTOR, "div[aria-label*='Cc']"),
+                ]
+                cc_field = selector_resolver.find(driver, 'campo_cc', cc_field_selectors, 15)
+            
+            if cc_field:
+                # Limpa o campo primeiro (caso tenha algo)
+                cc_field.clear()
+                
+                # Todos os emails CC de uma vez, conferindo os chips resolvidos
+                enter_recipients(driver, cc_field, message.cc, f"{step_prefix}: destinatários Cc")
+                print(f"Cc preenchido com: {'; '.join(message.cc)}")
+                
+                # Pressiona TAB para sair do campo Cc
+                cc_field.send_keys(Keys.TAB)
+                wait_for_condition(lambda: not is_focused(driver, cc_field), 2, f"{step_prefix}: saída do campo Cc")
+            else:
+                print("AVISO: Campo Cc nao encontrado apos clique no link")
+        else:
+            print("AVISO: Campo Cc nao encontrado, continuando sem preencher Cc")
+    else:
+        print("Nenhum email para preencher no campo Cc")
+    # FIM DO CAMPO CC
+    
+    print("Preenchendo assunto...")
+    # Campo Subject
+    subject_selectors = [
+        (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div/div/div[3]/div/div/div[3]/div[1]/div/div/div/div/div[3]/div[2]/span/input"),
+        (By.CSS_SELECTOR, "input[aria-label*='Subject']"),
+        (By.CSS_SELECTOR, "input[placeholder*='Add a subject']"),
+        (By.CSS_SELECTOR, "input[name*='Subject']"),
+    ]
+    
+    subject_field = selector_resolver.find(driver, 'assunto', subject_selectors, 15)
+    
+    if subject_field:
+        subject_field.send_keys(message.subject)
+        wait_for_condition(lambda: subject_field.get_attribute('value') == message.subject, 2, f"{step_prefix}: assunto preenchido")
+    
+    fill_compose_body(driver, message, step_prefix)
+
+# Colar HTML no corpo: o editor do Outlook trata o evento de colar; um contenteditable simples usa insertHTML
+PASTE_HTML_SCRIPT = """
+const field = arguments[0];
+const html = arguments[1];
+field.focus();
+const data = new DataTransfer();
+data.setData('text/html', html);
+data.setData('text/plain', arguments[2]);
+const notHandled = field.dispatchEvent(new ClipboardEvent('paste', {clipboardData: data, bubbles: true, cancelable: true}));
+if (notHandled) document.execCommand('insertHTML', false, html);
+"""
+
+def fill_compose_body(driver, message, step_prefix):
+    """Preenche o corpo do email: texto digitado ou, com `html_body`, o HTML colado no editor."""
+    print("Preenchendo corpo do email...")
+    # Corpo do email
+    body_selectors = [
+        (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div/div/div[3]/div/div/div[3]/div[1]/div/div/div/div/div[4]/div/div[1]/div"),
+        (By.CSS_SELECTOR, "div[role='textbox'][aria-label='Message body']"),
+        (By.CSS_SELECTOR, "div[aria-label*='Message body']"),
+        (By.CSS_SELECTOR, "div[contenteditable='true']"),
+    ]
+    
+    body_field = selector_resolver.find(driver, 'corpo', body_selectors, 15)
+    
+    if body_field and message.html_body:
+        driver.execute_script(PASTE_HTML_SCRIPT, body_field, message.html_body, message.body)
+        wait_for_condition(lambda: message.body[:20] in (body_field.text or ''), 2, f"{step_prefix}: corpo preenchido")
+    elif body_field:
+        body_field.send_keys(message.body)
+        wait_for_condition(lambda: message.body[:20] in (body_field.text or ''), 2, f"{step_prefix}: corpo preenchido")
+
+def attach_and_send_outlook_email(driver, message, step_prefix):
+    """Anexa os arquivos na janela de composição aberta e clica em Enviar."""
+    if message.attachments:
+        attach_outlook_files(driver, message, step_prefix)
+    else:
+        print("Boletos no corpo do email: nenhum arquivo para anexar")
+    click_outlook_send(driver, step_prefix)
+
+def attach_outlook_files(driver, message, step_prefix):
+    """Anexa todos os arquivos de uma vez pelo input de arquivo e confere se aparecem na janela."""
+    # ANEXAR MÚLTIPLOS PDFs - todos de uma vez pelo input de arquivo
+    print(f"Anexando {len(message.attachments)} arquivos...")
+    
+    if not attach_files_via_file_input(driver, message.attachments, step_prefix):
+        raise Exception("Anexos não carregados na janela de composição (input de arquivo ausente ou upload não confirmado)")
+    
+    print("Verificando se os arquivos foram anexados...")
+    attachment_found = False
+    
+    attachment_indicators = [
+        (By.CSS_SELECTOR, "[aria-label*='Anexo']"),
+        (By.CSS_SELECTOR, "[data-automation-id*='attachment']"),
+        (By.CSS_SELECTOR, "[class*='attachment']"),
+        (By.CSS_SELECTOR, "[class*='attachments']"),
+        (By.XPATH, "//*[contains(text(), '.pdf')]"),
+        (By.CSS_SELECTOR, "[title*='.pdf']"),
+        (By.CSS_SELECTOR, "[data-tid*='attachment']"),
+        (By.CSS_SELECTOR, "div[role='listitem']"),
+    ]
+    
+    try:
+        # Todos os seletores (inclusive pelo nome de cada arquivo), visibilidade e texto
+        # verificados em uma única consulta ao DOM
+        name_locators = [(By.XPATH, f"//*[contains(text(), '{p.name}')]") for p in message.attachments]
+        match = query_dom_first(driver, attachment_indicators + name_locators,
+                                text_contains=['.pdf', 'anexo', 'attachment'])
+        if match:
+            attachment_found = True
+            print(f"SUCESSO: Anexos detectados com seletor: {match['locator'][1]}")
+    except Exception as e:
+        print(f"Aviso na verificacao dos anexos: {e}")
+    
+    if not attachment_found:
+        print("AVISO: Nao foi possivel detectar os anexos automaticamente, mas continuando o processo...")
+        print("Isso pode acontecer devido a diferencas na interface do Outlook.")
+    
+    print("Todos os arquivos processados para anexação")
+
+def click_outlook_send(driver, step_prefix):
+    """Clica em Enviar e confirma que o email saiu (ou levanta MailThrottledError com o aviso de limite)."""
+    print("Enviando email...")
+    send_selectors = [
+        (By.CSS_SELECTOR, "button[aria-label*='Send']"),
+        (By.CSS_SELECTOR, "button[data-icon-name*='Send']"),
+        (By.XPATH, "//button[contains(@aria-label, 'Send')]"),
+    ]
+    
+    send_button = selector_resolver.find(driver, 'enviar', send_selectors, 15, clickable=True)
+    
+    if send_button:
+        send_button.click()
+        # Aguarda a janela de composição fechar (email saiu) ou o aviso de limite de envio
+        wait_for_condition(lambda: throttle_banner_text(driver) or no_visible_element(driver, COMPOSE_TO_LOCATORS),
+                           15, f"{step_prefix}: email enviado")
+        
+        banner = throttle_banner_text(driver)
+        if banner:
+            # O email não saiu: descarta o rascunho para a próxima tentativa começar do zero
+            discard_outlook_draft(driver, step_prefix)
+            raise MailThrottledError(f"Outlook: {banner[:100]}")
+
+# ================== CONTROLE DE TAXA DE ENVIO (THROTTLING) ==================
+# O intervalo entre emails se adapta ao servidor: diminui aos poucos enquanto os envios dão certo
+# e dobra (backoff exponencial) quando o Outlook mostra o aviso de "sending too many" ou o
+# SMTP responde 4xx. O controlador é compartilhado por todas as sessões de envio.
+
+SEND_THROTTLE_BACKOFF = 30  # Menor pausa após um sinal de throttling (segundos)
+SEND_RATE_RECOVERY = 0.8  # A cada envio bem-sucedido o intervalo é multiplicado por este fator
+SEND_THROTTLE_RETRIES = 3  # Novas tentativas do mesmo email após um sinal de throttling
+
+# Avisos do Outlook Web quando a conta passa do limite de envio
+THROTTLE_BANNER_LOCATORS = [
+    (By.CSS_SELECTOR, "[role='alert']"),
+    (By.CSS_SELECTOR, "[role='status']"),
+    (By.CSS_SELECTOR, "[class*='MessageBar']"),
+]
+THROTTLE_BANNER_TEXTS = ['sending too many', 'too many messages', 'try again later',
+                         'muitas mensagens', 'tente novamente mais tarde']
+
+# Respostas SMTP 5xx que também indicam cota de envio (ex: SubmissionQuotaExceeded do Office 365)
+THROTTLE_SMTP_TEXTS = ['rate limit', 'too many', 'quota', 'throttl', 'try again later']
+
+class MailThrottledError(Exception):
+    """O servidor recusou o email temporariamente por excesso de envios."""
+
+def decode_smtp_text(text):
+    return text.decode('utf-8', errors='replace') if isinstance(text, bytes) else str(text or '')
+
+def is_throttle_response(code, text):
+    """Resposta SMTP de limite temporário: qualquer 4xx ou texto de cota/limite."""
+    return 400 <= code < 500 or any(term in decode_smtp_text(text).lower() for term in THROTTLE_SMTP_TEXTS)
+
+def throttle_banner_text(driver):
+    """Texto do aviso de limite de envio do Outlook Web, se estiver visível (ou None)."""
+    match = query_dom_first(driver, THROTTLE_BANNER_LOCATORS, text_contains=THROTTLE_BANNER_TEXTS)
+    return match['text'].strip() if match else None
+
+def discard_outlook_draft(driver, step_prefix="envio"):
+    """Descarta o rascunho aberto na janela de composição (confirma o 'Discard message?')."""
+    discard_selectors = [
+        (By.CSS_SELECTOR, "button[aria-label*='Discard']"),
+        (By.CSS_SELECTOR, "button[aria-label*='Descartar']"),
+        (By.CSS_SELECTOR, "button[title*='Discard']"),
+    ]
+    try:
+        discard_button = visible_element(driver, discard_selectors)
+        if not discard_button:
+            print("AVISO: Botão de descartar o rascunho não encontrado")
+            return
+        discard_button.click()
+        
+        # Confirmação: o botão do diálogo, não o da janela de composição
+        confirm = wait_for_condition(lambda: next(
+            (match['element'] for match in query_dom(driver, [(By.CSS_SELECTOR, "[role='dialog'] button")],
+                                                     enabled_only=True, text_contains=['discard', 'descartar', 'ok'])
+             if match['element'] != discard_button), None),
+            DEFAULT_WAIT_TIME, f"{step_prefix}: confirmação de descarte")
+        if confirm:
+            confirm.click()
+        wait_for_condition(lambda: no_visible_element(driver, COMPOSE_TO_LOCATORS), DEFAULT_WAIT_TIME,
+                           f"{step_prefix}: rascunho descartado")
+        print("Rascunho descartado")
+    except Exception as e:
+        print(f"AVISO: Não foi possível descartar o rascunho: {e}")
+
+class SendRateController:
+    """
+    Intervalo entre emails compartilhado pelas sessões de envio.
+    - record_success(): intervalo *= SEND_RATE_RECOVERY (até min_interval)
+    - record_throttle(): intervalo dobra (no mínimo SEND_THROTTLE_BACKOFF, até max_interval)
+      e nenhum email sai antes desse tempo
+    wait() bloqueia até a vez do próximo email; current_rate() é a taxa efetiva em emails/min.
+    """
+    
+    def __init__(self, initial_interval, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = min(max(initial_interval, min_interval), self.max_interval)
+        self.successes = 0
+        self.throttles = 0
+        self._next_send = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        """Aguarda a vez de enviar e reserva o horário do email seguinte. Retorna o tempo esperado."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._next_send:
+                    self._next_send = now + self.interval
+                    return waited
+                delay = self._next_send - now
+            # Acorda para conferir de novo: outra sessão pode ter reservado a vez ou recebido throttling
+            time.sleep(delay)
+            waited += delay
+    
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self.interval = max(self.min_interval, self.interval * SEND_RATE_RECOVERY)
+    
+    def record_throttle(self, reason):
+        with self._lock:
+            self.throttles += 1
+            self.interval = min(self.max_interval, max(self.interval * 2, SEND_THROTTLE_BACKOFF))
+            self._next_send = max(self._next_send, time.monotonic() + self.interval)
+            interval = self.interval
+        print(f"[taxa] Throttling detectado ({reason}). Próximo envio em {interval:.1f}s "
+              f"({self.current_rate():.1f} emails/min)")
+    
+    def current_rate(self):
+        """Taxa efetiva atual em emails por minuto."""
+        with self._lock:
+            interval = self.interval
+        return 60 / interval if interval > 0 else float('inf')
+    
+    def print_summary(self):
+        print("\n=== TAXA DE ENVIO ===")
+        print(f"  {self.successes} envios, {self.throttles} sinais de throttling; intervalo final "
+              f"{self.interval:.1f}s ({self.current_rate():.1f} emails/min)")
+
+def create_send_rate_controller():
+    """Controlador de taxa com os limites configurados; começa no intervalo fixo antigo."""
+    return SendRateController(DEFAULT_WAIT_TIME * 2, SEND_MIN_INTERVAL, SEND_MAX_INTERVAL)
+
+def send_with_rate_control(transport, message, rate_controller=None):
+    """
+    Envia a mensagem pelo transporte. Com `rate_controller`, aguarda a vez de enviar e,
+    em caso de throttling, espera o backoff e tenta de novo (até SEND_THROTTLE_RETRIES vezes).
+    """
+    if rate_controller is None:
+        transport.send(message)
+        return
+    
+    for attempt in range(SEND_THROTTLE_RETRIES + 1):
+        rate_controller.wait()
+        try:
+            transport.send(message)
+        except MailThrottledError as e:
+            rate_controller.record_throttle(e)
+            if attempt == SEND_THROTTLE_RETRIES:
+                raise
+            print(f"Nova tentativa {attempt + 1} de {SEND_THROTTLE_RETRIES} para '{message.subject}'")
+        else:
+            rate_controller.record_success()
+            return
+
+# ================== BOLETOS NO CORPO DO EMAIL (SEM ANEXO) ==================
+# Hospitais com poucos boletos recebem a tabela no corpo do email, em HTML, em vez do PDF anexado:
+# sem o upload, cada email sai bem mais rápido. Acima de 'corpo em html ate linhas' o PDF é anexado.
+
+# Tabela de cada PDF gerado nesta execução: {caminho do PDF: {'hospital', 'tipo', 'origem', 'linhas'}}
+pdf_tables = {}
+
+INLINE_TABLE_STYLE = "border-collapse: collapse; font-family: Arial, sans-serif; font-size: 12px"
+INLINE_HEADER_STYLE = "background: #808080; color: #ffffff; text-align: left; padding: 3px 6px; border: 1px solid #000000"
+INLINE_CELL_STYLE = "background: #f5f5dc; padding: 3px 6px; border: 1px solid #000000"
+
+def inline_table_rows(pdf_paths):
+    """Total de boletos das tabelas dos PDFs, ou None se algum PDF não tiver a tabela guardada."""
+    if any(pdf_path not in pdf_tables for pdf_path in pdf_paths):
+        return None
+    return sum(len(pdf_tables[pdf_path]['linhas']) - 1 for pdf_path in pdf_paths)
+
+def build_boleto_html_table(table_data):
+    """Tabela HTML compacta (estilos inline, como o Outlook exige) com o cabeçalho e as linhas."""
+    header = "".join(f'<th style="{INLINE_HEADER_STYLE}">{html.escape(str(cell))}</th>' for cell in table_data[0])
+    rows = "".join(
+        "<tr>" + "".join(f'<td style="{INLINE_CELL_STYLE}">{html.escape(cell)}</td>' for cell in row) + "</tr>"
+        for row in table_data[1:]
+    )
+    return f'<table style="{INLINE_TABLE_STYLE}"><tr>{header}</tr>{rows}</table>'
+
+def build_inline_bodies(intro, pdf_paths):
+    """Corpo em texto e em HTML com a tabela de cada PDF (mesmos dados do PDF)."""
+    text_parts = [intro]
+    html_parts = [f"<p>{html.escape(paragraph).replace(chr(10), '<br>')}</p>" for paragraph in intro.split("\n\n")]
+    for pdf_path in pdf_paths:
+        table = pdf_tables[pdf_path]
+        title = f"{table['hospital']} - {table['tipo']} ({table['origem']}): {len(table['linhas']) - 1} boleto(s)"
+        text_rows = "\n".join(" | ".join(row) for row in table['linhas'])
+        text_parts.append(f"{title}\n{text_rows}")
+        html_parts.append(f"<p><b>{html.escape(title)}</b></p>{build_boleto_html_table(table['linhas'])}")
+    return "\n\n".join(text_parts), "".join(html_parts)
+
+# ================== LIMITE DE TAMANHO DOS ANEXOS (EMAILS NUMERADOS) ==================
+# Antes de ir para a fila, os PDFs de um hospital que passam de 'tamanho maximo dos anexos mb'
+# são compactados (pikepdf, se instalado). O que ainda passar do limite é distribuído em pacotes
+# (first-fit decreasing), um email numerado por pacote: "HOSPITAL X (parte 1 de 2)".
+
+# PDFs já compactados nesta execução (não compacta duas vezes): {caminho: sha256 depois da compactação}
+compressed_pdfs = {}
+
+def attachment_budget_bytes():
+    """Limite de tamanho dos anexos de um email, em bytes (0 = sem limite)."""
+    return int(ATTACHMENT_BUDGET_MB * 1024 * 1024)
+
+def compress_pdf(pdf_path):
+    """
+    Regrava o PDF com os streams recompactados e em object streams (pikepdf), com ID determinístico:
+    o mesmo PDF gera sempre o mesmo arquivo (o outbox reconhece pelo hash). Retorna os bytes economizados,
+    ou None se o pikepdf não estiver instalado.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        return None
+    
+    original_size = pdf_path.stat().st_size
+    temp_path = pdf_path.with_name(f".{pdf_path.name}.compactado")
+    try:
+        with pikepdf.open(pdf_path) as pdf:
+            pdf.remove_unreferenced_resources()
+            pdf.save(temp_path, compress_streams=True, recompress_flate=True,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate, deterministic_id=True)
+        if temp_path.stat().st_size < original_size:
+            os.replace(temp_path, pdf_path)
+            return original_size - pdf_path.stat().st_size
+        return 0
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+def compress_oversized_attachments(hospital_name, pdf_paths):
+    """Compacta os PDFs do hospital quando, juntos, passam do limite de tamanho de um email."""
+    budget = attachment_budget_bytes()
+    total = sum(path.stat().st_size for path in pdf_paths)
+    if budget <= 0 or total <= budget:
+        return
+    
+    saved = 0
+    for pdf_path in pdf_paths:
+        if pdf_path in compressed_pdfs:
+            continue
+        try:
+            result = compress_pdf(pdf_path)
+        except Exception as e:
+            print(f"AVISO: Não foi possível compactar {pdf_path.name}: {e}")
+            result = 0
+        if result is None:
+            print(f"Anexos de {hospital_name}: {total / 1048576:.1f} MB (instale o pikepdf para compactar os PDFs)")
+            return
+        saved += result
+        compressed_pdfs[pdf_path] = file_sha256(pdf_path)
+    print(f"Anexos de {hospital_name}: {total / 1048576:.1f} MB, {saved / 1048576:.1f} MB economizados na compactação")
+    # O manifesto guarda o hash dos PDFs: uma retomada não deve ver os compactados como alterados
+    refresh_pdf_stage_digests()
+
+def current_pdf_digests(pdf_digests):
+    """
+    Hashes {caminho: sha256} dos PDFs conferidos com os arquivos: os PDFs compactados antes do envio
+    ficam com o hash de depois da compactação (mesmo os já excluídos), para o manifesto bater com o disco.
+    """
+    digests = {}
+    for path, digest in pdf_digests.items():
+        if Path(path) in compressed_pdfs:
+            digests[path] = compressed_pdfs[Path(path)]
+        elif Path(path).exists():
+            digests[path] = file_sha256(Path(path))
+        else:
+            digests[path] = digest
+    return digests
+
+def pack_attachments(pdf_paths, budget):
+    """
+    Distribui os PDFs em pacotes de no máximo `budget` bytes (first-fit decreasing, empate pelo nome:
+    os mesmos arquivos geram sempre os mesmos pacotes). Um PDF maior que o limite fica sozinho.
+    Cada pacote mantém a ordem original dos arquivos.
+    """
+    sizes = {path: path.stat().st_size for path in pdf_paths}
+    if budget <= 0 or sum(sizes.values()) <= budget:
+        return [list(pdf_paths)]
+    
+    packages = []  # [bytes ocupados, [caminhos]]
+    for pdf_path in sorted(pdf_paths, key=lambda path: (-sizes[path], path.name)):
+        if sizes[pdf_path] > budget:
+            print(f"AVISO: {pdf_path.name} ({sizes[pdf_path] / 1048576:.1f} MB) passa sozinho do limite de anexos")
+        for package in packages:
+            if package[0] + sizes[pdf_path] <= budget:
+                package[0] += sizes[pdf_path]
+                package[1].append(pdf_path)
                 break
-            except:
-                continue
-        
-        if subject_field:
-            subject_field.send_keys(f"Boletos em aberto: {hospital_name}")
-            time.sleep(2)
-        
-        print("Preenchendo corpo do email...")
-        # Corpo do email
-        body_selectors = [
-            (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div/div/div[3]/div/div/div[3]/div[1]/div/div/div/div/div[4]/div/div[1]/div"),
-            (By.CSS_SELECTOR, "div[role='textbox'][aria-label='Message body']"),
-            (By.CSS_SELECTOR, "div[aria-label*='Message body']"),
-            (By.CSS_SELECTOR, "div[contenteditable='true']"),
+        else:
+            packages.append([sizes[pdf_path], [pdf_path]])
+    
+    order = {path: index for index, path in enumerate(pdf_paths)}
+    return [sorted(paths, key=order.get) for _, paths in packages]
+
+def hospital_message_parts(hospital_name, pdf_paths):
+    """Emails de um hospital: [(nome, PDFs)], numerados quando os anexos não cabem em um só."""
+    packages = pack_attachments(pdf_paths, attachment_budget_bytes())
+    if len(packages) == 1:
+        return [(hospital_name, packages[0])]
+    return [(f"{hospital_name} (parte {index} de {len(packages)})", package)
+            for index, package in enumerate(packages, 1)]
+
+# ================== PRIORIDADE E HORÁRIO LIMITE DO ENVIO ==================
+# Os hospitais são enviados do maior para o menor valor vencido, pesado pelo atraso: um saldo vencido
+# há PRIORITY_AGE_DAYS dias vale o dobro do mesmo saldo vencido hoje. Com 'horario limite do envio'
+# (ou --deadline), nenhum email começa se não der tempo de terminar antes do horário; os hospitais
+# que sobraram ficam pendentes no outbox e no manifesto, e a próxima execução (ou --resume) continua deles.
+
+PRIORITY_AGE_DAYS = 30
+
+# Valor vencido e atraso de cada PDF, calculados na leitura: {caminho do PDF: {'valor_vencido', 'dias_atraso'}}
+pdf_priorities = {}
+
+def boleto_priority(hospital_data, today=None):
+    """
+    Soma do Valor dos boletos já vencidos e dias de atraso do mais antigo. Boletos sem data de
+    vencimento legível contam como vencidos (a planilha é de boletos em aberto).
+    """
+    today = pd.Timestamp(today or datetime.now()).normalize()
+    due_dates = pd.to_datetime(hospital_data['Data Vencimento'], format='%d/%m/%Y', errors='coerce')
+    overdue = due_dates.isna() | (due_dates < today)
+    values = pd.to_numeric(hospital_data['Valor'], errors='coerce').fillna(0)
+    oldest = due_dates[overdue].min()
+    return {
+        'valor_vencido': round(float(values[overdue].sum()), 2),
+        'dias_atraso': int((today - oldest).days) if pd.notna(oldest) else 0,
+    }
+
+def record_boleto_priority(pdf_path, hospital_data):
+    """
+    Guarda o valor vencido e o atraso do PDF reservado em `pdf_path`, calculados na leitura da planilha
+    (a ordem de envio não depende da geração do PDF). Sem prioridade, o hospital vai para o fim da fila.
+    """
+    try:
+        pdf_priorities[pdf_path] = boleto_priority(hospital_data)
+    except Exception as e:
+        print(f"AVISO: Prioridade de {pdf_path.name} não calculada: {e}")
+
+def message_priority(pdf_paths):
+    """Prioridade de um email: valor vencido somado dos PDFs e o maior atraso entre eles."""
+    items = [pdf_priorities[Path(pdf_path)] for pdf_path in pdf_paths if Path(pdf_path) in pdf_priorities]
+    value = sum(item['valor_vencido'] for item in items)
+    days = max((item['dias_atraso'] for item in items), default=0)
+    return {'valor_vencido': value, 'dias_atraso': days,
+            'pontos': value * (1 + days / PRIORITY_AGE_DAYS)}
+
+def prioritize_hospitals(hospital_pdfs):
+    """Hospitais [(nome, PDFs)] do mais para o menos prioritário (empate: ordem alfabética)."""
+    ranked = sorted(hospital_pdfs.items(), key=lambda item: (-message_priority(item[1])['pontos'], item[0]))
+    if pdf_priorities:
+        print("Ordem de envio (valor vencido, dias de atraso):")
+        for position, (hospital_name, pdf_paths) in enumerate(ranked, 1):
+            priority = message_priority(pdf_paths)
+            value = f"{priority['valor_vencido']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+            print(f"  {position:>3}. {hospital_name}: R$ {value}, {priority['dias_atraso']} dias")
+    return ranked
+
+def priorities_for_manifest(pdf_paths):
+    """Prioridades dos PDFs em formato JSON, para a etapa 'pdf' do manifesto."""
+    return {str(pdf_path): pdf_priorities[Path(pdf_path)] for pdf_path in pdf_paths if Path(pdf_path) in pdf_priorities}
+
+def restore_pdf_priorities(pdf_stage):
+    """Recupera as prioridades gravadas na etapa 'pdf' do manifesto (retomada sem gerar os PDFs)."""
+    for pdf_path, priority in ((pdf_stage or {}).get('prioridades') or {}).items():
+        pdf_priorities[Path(pdf_path)] = priority
+
+def parse_deadline(value, now=None):
+    """
+    Horário limite 'HH:MM' (ou 'HH:MM:SS', como vem de uma célula de hora do Excel) na próxima vez
+    que o relógio chegar nele: 05:00 com a execução começando às 22:00 é 05:00 do dia seguinte.
+    Retorna None se vazio ou inválido.
+    """
+    if value is None or str(value).strip() == '':
+        return None
+    now = now or datetime.now()
+    text = str(value).strip()
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            clock = datetime.strptime(text, fmt).time()
+            break
+        except ValueError:
+            continue
+    else:
+        print(f"AVISO: Horário limite do envio inválido '{text}' (use HH:MM); enviando sem limite")
+        return None
+    deadline = datetime.combine(now.date(), clock)
+    if deadline <= now:
+        deadline += timedelta(days=1)
+    return deadline
+
+class SendSchedule:
+    """
+    Horário limite do envio, compartilhado entre as sessões. Guarda quanto cada email levou para
+    não começar um que não termine a tempo, e os hospitais adiados para a próxima execução.
+    """
+    
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.deferred = []  # [(hospital, PDFs, chaves do outbox)]
+        self._durations = []
+        self._lock = threading.Lock()
+    
+    def allows_send(self):
+        """True se ainda dá tempo de enviar mais um email (pela média dos anteriores)."""
+        if self.deadline is None:
+            return True
+        with self._lock:
+            expected = sum(self._durations) / len(self._durations) if self._durations else 0
+        return datetime.now() + timedelta(seconds=expected) <= self.deadline
+    
+    def record_duration(self, seconds):
+        with self._lock:
+            self._durations.append(seconds)
+    
+    def defer(self, hospital_name, pdf_paths, outbox_keys=()):
+        """Deixa o hospital para a próxima execução (os PDFs e as mensagens no outbox continuam pendentes)."""
+        with self._lock:
+            self.deferred.append((hospital_name, list(pdf_paths), list(outbox_keys)))
+        print(f"Horário limite do envio ({self.deadline:%H:%M}): {hospital_name} fica para a próxima execução")
+        email_status_report.add(hospital_name, f"{len(pdf_paths)} arquivos", DEFERRED_STATUS)
+    
+    def deferred_entries(self):
+        """{hospital: {'pdfs': [caminhos], 'chaves': [chaves do outbox]}} dos hospitais adiados, em formato JSON."""
+        with self._lock:
+            return {hospital_name: {'pdfs': [str(path) for path in pdf_paths], 'chaves': outbox_keys}
+                    for hospital_name, pdf_paths, outbox_keys in self.deferred}
+
+# Horário limite da execução (definido no início do programa; sem limite por padrão)
+send_schedule = SendSchedule()
+
+# ================== OUTBOX PERSISTENTE (RETOMADA SEM REENVIO) ==================
+# Cada email de hospital vira uma linha em outbox.sqlite3 com destinatários, hash dos anexos,
+# estado (pendente → enviando → enviado | erro | substituida | incerto) e tentativas. A chave de idempotência
+# (dia da execução + hospital + destinatários + hash dos PDFs) impede que um email já enviado saia de novo no
+# mesmo dia, mesmo depois de uma queda e de uma nova execução completa. `python rpa.py --resume` envia só os pendentes.
+
+OUTBOX_PATH = BASE_DIR / "outbox.sqlite3"
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mensagens (
+    chave TEXT PRIMARY KEY,
+    execucao TEXT NOT NULL,
+    hospital TEXT NOT NULL,
+    destinatarios TEXT NOT NULL,
+    copias TEXT NOT NULL,
+    anexos TEXT NOT NULL,
+    hashes_anexos TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendente',
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    ultimo_erro TEXT,
+    criado_em TEXT NOT NULL,
+    atualizado_em TEXT NOT NULL
+)
+"""
+
+class Outbox:
+    """
+    Fila persistente dos emails dos hospitais (SQLite), segura entre threads.
+    As mudanças de estado são gravadas antes e depois de cada envio.
+    """
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=FULL")
+            self._connection.execute(OUTBOX_SCHEMA)
+        self.run_id = self.latest_run_id()
+        self._recover_interrupted()
+    
+    def _recover_interrupted(self):
+        """
+        Envios que ficaram em 'enviando' (queda no meio do envio) passam para 'incerto': o email pode
+        ter saído antes da queda. Não são reenviados até o operador conferir os Itens Enviados
+        (python rpa.py --resolve-uncertain enviado|reenviar).
+        """
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                "SELECT hospital FROM mensagens WHERE estado = 'enviando'").fetchall()
+            if rows:
+                self._connection.execute(
+                    "UPDATE mensagens SET estado = 'incerto', ultimo_erro = ? WHERE estado = 'enviando'",
+                    ("Execução interrompida durante o envio",))
+        for row in rows:
+            print(f"AVISO: O envio para {row['hospital']} foi interrompido e pode ter saído; não será reenviado "
+                  f"até que os Itens Enviados sejam conferidos (--resolve-uncertain enviado|reenviar)")
+    
+    @staticmethod
+    def _now():
+        return datetime.now().isoformat(timespec='seconds')
+    
+    @staticmethod
+    def idempotency_key(day, hospital_name, message, attachment_hashes):
+        """
+        Hash do dia, do hospital, dos destinatários (sem ordem/maiúsculas) e do conteúdo dos anexos.
+        O dia entra na chave para que a mesma cobrança, recebida de novo em outro dia, volte a ser enviada.
+        """
+        parts = [
+            day,
+            normalize_hospital_name_for_grouping(hospital_name),
+            ','.join(sorted(address.lower() for address in message.to)),
+            ','.join(sorted(address.lower() for address in message.cc)),
+            ','.join(sorted(attachment_hashes)),
         ]
-        
-        body_field = None
-        for by, selector in body_selectors:
-            try:
-                body_field = wait.until(EC.presence_of_element_located((by, selector)))
-                print(f"Corpo do email encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
-        
-        if body_field:
-            mensagem = f"""Prezados(as), Bom dia.
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+    
+    def latest_run_id(self):
+        with self._lock:
+            row = self._connection.execute("SELECT MAX(execucao) AS execucao FROM mensagens").fetchone()
+        return row['execucao'] if row else None
+    
+    def start_run(self):
+        """Inicia uma execução completa: as mensagens registradas a partir daqui pertencem a ela."""
+        self.run_id = datetime.now().strftime('%Y%m%d%H%M%S')
+        return self.run_id
+    
+    def run_day(self):
+        """
+        Dia em que a execução começou ('AAAA-MM-DD'), usado na chave: uma execução que passa da
+        meia-noite (ou é retomada no dia seguinte) continua com as mesmas chaves.
+        """
+        return datetime.strptime(self.run_id[:8], '%Y%m%d').strftime('%Y-%m-%d')
+    
+    def register(self, hospital_name, message):
+        """
+        Registra a mensagem como 'pendente' (se ainda não existir) e retorna (chave, estado).
+        Se a mesma mensagem já existia em uma execução anterior, o estado dela é mantido.
+        """
+        if self.run_id is None:
+            self.start_run()
+        # PDFs anexados ou no corpo: a mesma cobrança tem a mesma chave nos dois formatos
+        source_files = message.attachments + message.inline_files
+        attachment_hashes = [file_sha256(path) for path in source_files]
+        key = self.idempotency_key(self.run_day(), hospital_name, message, attachment_hashes)
+        now = self._now()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO mensagens (chave, execucao, hospital, destinatarios, copias, anexos, "
+                "hashes_anexos, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, self.run_id, hospital_name, json.dumps(message.to), json.dumps(message.cc),
+                 json.dumps([str(path) for path in source_files]), json.dumps(attachment_hashes), now, now))
+            # Pendentes de uma execução anterior passam para a atual (com os PDFs recém-gerados);
+            # uma mensagem encerrada por close_messages volta a ser pendente
+            self._connection.execute(
+                "UPDATE mensagens SET execucao = ?, anexos = ?, atualizado_em = ?, "
+                "estado = CASE WHEN estado = 'substituida' THEN 'pendente' ELSE estado END "
+                "WHERE chave = ? AND estado != 'enviado'",
+                (self.run_id, json.dumps([str(path) for path in source_files]), now, key))
+            row = self._connection.execute("SELECT estado FROM mensagens WHERE chave = ?", (key,)).fetchone()
+        return key, row['estado']
+    
+    def begin_send(self, hospital_name, message):
+        """
+        Marca a mensagem como 'enviando' (+1 tentativa) antes do envio e retorna (chave, estado).
+        Com estado 'enviado' ou 'incerto' a mensagem não é marcada e o email não deve sair.
+        """
+        key, state = self.register(hospital_name, message)
+        if state in ('enviado', 'incerto'):
+            return key, state
+        self._set_state(key, 'enviando', increment_attempts=True)
+        return key, 'enviando'
+    
+    def resolve_uncertain(self, sent):
+        """
+        Decisão do operador sobre os envios 'incerto' depois de conferir os Itens Enviados:
+        `sent` True marca como 'enviado', False volta para 'pendente' (sai no próximo --resume).
+        Retorna os hospitais resolvidos.
+        """
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                "SELECT hospital FROM mensagens WHERE estado = 'incerto' ORDER BY hospital").fetchall()
+            self._connection.execute(
+                "UPDATE mensagens SET estado = ?, ultimo_erro = ?, atualizado_em = ? WHERE estado = 'incerto'",
+                ('enviado' if sent else 'pendente', None if sent else "Reenvio confirmado pelo operador", self._now()))
+        return [row['hospital'] for row in rows]
+    
+    def mark_sent(self, key):
+        self._set_state(key, 'enviado', error=None)
+    
+    def mark_error(self, key, error):
+        self._set_state(key, 'erro', error=str(error)[:500])
+    
+    def _set_state(self, key, state, error=None, increment_attempts=False):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE mensagens SET estado = ?, ultimo_erro = ?, atualizado_em = ?, "
+                "tentativas = tentativas + ? WHERE chave = ?",
+                (state, error, self._now(), 1 if increment_attempts else 0, key))
+    
+    def close_messages(self, keys, reason):
+        """
+        Encerra mensagens que não saíram e não vão mais sair (estado 'substituida'):
+        deixam de aparecer no --resume e no resumo do outbox.
+        """
+        now = self._now()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE mensagens SET estado = 'substituida', ultimo_erro = ?, atualizado_em = ? "
+                "WHERE chave = ? AND estado != 'enviado'",
+                [(reason, now, key) for key in keys])
+    
+    def pending_messages(self):
+        """Mensagens não enviadas da última execução: [{'hospital', 'to', 'cc', 'anexos', 'tentativas'}]."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT * FROM mensagens WHERE execucao = ? AND estado NOT IN ('enviado', 'substituida', 'incerto') "
+                "ORDER BY criado_em, hospital",
+                (self.run_id,)).fetchall()
+        return [{
+            'hospital': row['hospital'],
+            'to': json.loads(row['destinatarios']),
+            'cc': json.loads(row['copias']),
+            'anexos': [Path(path) for path in json.loads(row['anexos'])],
+            'tentativas': row['tentativas'],
+        } for row in rows]
+    
+    def print_summary(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT estado, COUNT(*) AS total FROM mensagens WHERE execucao = ? AND estado != 'substituida' "
+                "GROUP BY estado",
+                (self.run_id,)).fetchall()
+        if rows:
+            print("\n=== OUTBOX ===")
+            print("  " + ", ".join(f"{row['estado']}: {row['total']}" for row in rows))
+            if any(row['estado'] == 'incerto' for row in rows):
+                print("  Envios incertos: confira os Itens Enviados e rode "
+                      "python rpa.py --resolve-uncertain enviado (ou reenviar)")
+    
+    def close(self):
+        with self._lock:
+            self._connection.close()
 
-Segue abaixo a relação de boletos em aberto com o hospital, caso tenha sido efetuado o pagamento favor enviar o comprovante para baixa.."""
-            
-            body_field.send_keys(mensagem)
-            time.sleep(2)
-        
-        # ANEXAR MÚLTIPLOS PDFs
-        print(f"Anexando {len(valid_pdfs)} arquivos PDF...")
-        
-        for i, pdf_path in enumerate(valid_pdfs):
-            print(f"Anexando arquivo {i+1} de {len(valid_pdfs)}: {pdf_path.name}")
-            
-            print("Clicando em Insert...")
-            # Insert option
-            insert_selectors = [
-                (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[1]/div/div/div[1]/div[2]/div/div/div/div/span/div[1]/div/div/div[5]/div/button/span/span/span"),
-                (By.CSS_SELECTOR, "button[aria-label*='Insert']"),
-            ]
-            
-            insert_button = None
-            for by, selector in insert_selectors:
-                try:
-                    insert_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                    print(f"Botao Insert encontrado com: {by} = {selector}")
-                    break
-                except:
-                    continue
-            
-            if insert_button:
-                insert_button.click()
-                time.sleep(2)
-            
-            print("Clicando em Attach file...")
-            # Attach file button
-            attach_selectors = [
-                (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[1]/div/div/div[2]/div[1]/div/div/div/div/div/div/div/div/div/div/div[1]/div/div/div/div[1]/button/span/span[1]/span"),
-                (By.CSS_SELECTOR, "button[aria-label*='Attach file']"),
-                (By.CSS_SELECTOR, "button[data-icon-name*='Attach file']"),
-            ]
-            
-            attach_button = None
-            for by, selector in attach_selectors:
-                try:
-                    attach_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                    print(f"Botao Attach encontrado com: {by} = {selector}")
-                    break
-                except:
-                    continue
-            
-            if attach_button:
-                attach_button.click()
-                time.sleep(2)
-            
-            print("Clicando em Browse this computer...")
-            # Browse this computer button
-            browse_selectors = [
-                (By.XPATH, "/html/body/div[2]/div[6]/div/div/div/div/div/div/ul/li/div/ul/li[1]/button/div/span"),
-                (By.CSS_SELECTOR, "button[aria-label*='Browse this computer']"),
-                (By.CSS_SELECTOR, "div[title*='Browse this computer']"),
-            ]
-            
-            browse_button = None
-            for by, selector in browse_selectors:
-                try:
-                    browse_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                    print(f"Botao Browse encontrado com: {by} = {selector}")
-                    break
-                except:
-                    continue
-            
-            if browse_button:
-                browse_button.click()
-                time.sleep(3)
-            
-            print("Navegando para a pasta dos PDFs...")
-            time.sleep(3)
-            
-            pyautogui.click(x=500, y=100)
-            time.sleep(2)
-            
-            pyautogui.hotkey('ctrl', 'a')
-            time.sleep(1)
-            pyautogui.press('delete')
-            time.sleep(1)
-            
-            pdf_folder_path = str(PROCESSED_FOLDER.resolve())
-            print(f"Digitando caminho da pasta: {pdf_folder_path}")
-            pyautogui.write(pdf_folder_path)
-            time.sleep(1)
-            pyautogui.press('enter')
-            time.sleep(3)
-            
-            pdf_filename = pdf_path.name
-            print(f"Digitando nome do arquivo: {pdf_filename}")
-            pyautogui.write(pdf_filename)
-            time.sleep(1)
-            pyautogui.press('enter')
-            time.sleep(5)
-            
-            print(f"Verificando se o arquivo {i+1} foi anexado...")
-            time.sleep(3)
-            
-            attachment_found = False
-            
-            try:
-                attachment_indicators = [
-                    (By.CSS_SELECTOR, "[aria-label*='Anexo']"),
-                    (By.CSS_SELECTOR, "[data-automation-id*='attachment']"),
-                    (By.CSS_SELECTOR, "[class*='attachment']"),
-                    (By.CSS_SELECTOR, "[class*='attachments']"),
-                    (By.XPATH, "//*[contains(text(), '.pdf')]"),
-                    (By.CSS_SELECTOR, "[title*='.pdf']"),
-                    (By.CSS_SELECTOR, "[data-tid*='attachment']"),
-                    (By.CSS_SELECTOR, "div[role='listitem']"),
-                ]
-                
-                for by, selector in attachment_indicators:
-                    try:
-                        elements = driver.find_elements(by, selector)
-                        for element in elements:
-                            if element.is_displayed():
-                                text = element.text.lower() if element.text else ""
-                                if '.pdf' in text or 'anexo' in text or 'attachment' in text:
-                                    attachment_found = True
-                                    print(f"SUCESSO: Anexo {i+1} detectado com seletor: {selector}")
-                                    break
-                        if attachment_found:
-                            break
-                    except:
-                        continue
-            except Exception as e:
-                print(f"Aviso na verificacao de anexo {i+1}: {e}")
-            
-            if not attachment_found:
-                try:
-                    elements_with_text = driver.find_elements(By.XPATH, f"//*[contains(text(), '{pdf_path.name}')]")
-                    for element in elements_with_text:
-                        if element.is_displayed():
-                            attachment_found = True
-                            print(f"SUCESSO: Anexo {i+1} detectado pelo nome do arquivo: {pdf_path.name}")
-                            break
-                except:
-                    pass
-            
-            if not attachment_found:
-                print(f"AVISO: Nao foi possivel detectar o anexo {i+1} automaticamente, mas continuando o processo...")
-                print("Isso pode acontecer devido a diferencas na interface do Outlook.")
-                attachment_found = True
-            
-            if not attachment_found:
-                print(f"ERRO: Anexo {i+1} nao foi detectado apos tentativa de upload")
-                # Continua tentando anexar os próximos arquivos mesmo com erro
-        
-        print("Todos os arquivos processados para anexação")
+# Outbox da execução (aberto no início do programa; None desativa o controle de reenvio)
+outbox = None
+
+def build_hospital_message(hospital_name, pdf_paths, hospital_email_data):
+    """
+    Email de boletos de um hospital para os destinatários da planilha. Para um grupo de hospitais
+    com os mesmos destinatários (coalesce_hospitals_by_recipients), o corpo ganha uma seção por hospital.
+    Com até INLINE_BODY_MAX_ROWS boletos, as tabelas vão no corpo em HTML e nada é anexado.
+    """
+    rows = inline_table_rows(pdf_paths) if INLINE_BODY_MAX_ROWS > 0 else None
+    if rows is not None and rows <= INLINE_BODY_MAX_ROWS:
+        body, html_body = build_inline_bodies(HOSPITAL_EMAIL_BODY, pdf_paths)
+        return OutgoingEmail(
+            to=hospital_email_data['to'],
+            cc=hospital_email_data['cc'],
+            subject=f"Boletos em aberto: {hospital_name}",
+            body=body,
+            attachments=[],
+            html_body=html_body,
+            inline_files=pdf_paths
+        )
+    
+    body = HOSPITAL_EMAIL_BODY
+    if hospital_email_data.get('hospitais'):
+        attached = set(pdf_paths)
+        sections = []
+        for member_name, member_pdfs in hospital_email_data['hospitais']:
+            files = "\n".join(f"  - {pdf_path.name}" for pdf_path in member_pdfs if pdf_path in attached)
+            if files:
+                sections.append(f"{member_name}:\n{files}")
+        body = f"{HOSPITAL_EMAIL_BODY}\n\n" + "\n\n".join(sections)
+    
+    return OutgoingEmail(
+        to=hospital_email_data['to'],
+        cc=hospital_email_data['cc'],
+        subject=f"Boletos em aberto: {hospital_name}",
+        body=body,
+        attachments=pdf_paths
+    )
+
+def register_hospital_messages(hospital_name, pdf_paths, hospital_emails):
+    """
+    Registra no outbox cada mensagem do hospital como pendente (mais de uma quando os anexos
+    passam do limite de tamanho) e retorna as chaves. Uma mensagem já registrada mantém a chave e o estado.
+    """
+    existing_pdfs = [path for path in pdf_paths if path.exists()]
+    if outbox is None or not existing_pdfs:
+        return []
+    hospital_email_data = find_hospital_email(hospital_name, hospital_emails)
+    if not hospital_email_data:
+        return []
+    try:
+        return [outbox.register(message_name, build_hospital_message(message_name, message_pdfs, hospital_email_data))[0]
+                for message_name, message_pdfs in hospital_message_parts(hospital_name, existing_pdfs)]
+    except Exception as e:
+        print(f"AVISO: Não foi possível registrar {hospital_name} no outbox: {e}")
+        return []
+
+def queue_hospital_email(hospital_queue, hospital_name, pdf_paths, hospital_emails, senders_alive=None):
+    """
+    Coloca o hospital na fila de envio, registrando antes no outbox as mensagens dele como pendentes
+    (anexos acima do limite de tamanho já compactados aqui).
+    Com fila limitada, `senders_alive` diz se ainda há sessão de envio consumindo (ver put_in_sender_queue).
+    Retorna False se o hospital não entrou na fila.
+    """
+    compress_oversized_attachments(hospital_name, [path for path in pdf_paths if path.exists()])
+    register_hospital_messages(hospital_name, pdf_paths, hospital_emails)
+    return put_in_sender_queue(hospital_queue, (hospital_name, pdf_paths), senders_alive)
+
+def delete_sent_pdfs(hospital_name, pdf_paths):
+    """Exclui os PDFs de um hospital depois do envio."""
+    print(f"Excluindo {len(pdf_paths)} arquivos PDF do hospital {hospital_name}...")
+    for pdf_path in pdf_paths:
+        try:
+            if pdf_path.exists():
+                pdf_path.unlink()
+                print(f"  PDF excluido: {pdf_path.name}")
+            else:
+                print(f"  Aviso: Arquivo PDF não encontrado para exclusão: {pdf_path}")
+        except Exception as delete_error:
+            print(f"  Erro ao excluir PDF {pdf_path.name}: {delete_error}")
+
+def send_email_with_attachment(transport, pdf_paths, hospital_name, hospital_emails, rate_controller=None):
+    """
+    Envia um email com MÚLTIPLOS PDFs anexados para os emails específicos do hospital
+    pelo transporte informado (Outlook Web ou SMTP).
+    Com `rate_controller`, respeita o intervalo entre envios e repete o email após throttling.
+    AGORA ACEITA LISTA DE PDFs E CONTINUA MESMO COM ERRO.
+    """
+    
+    try:
+        # VERIFICAÇÃO DOS ARQUIVOS PDF - se nenhum existir, registra erro mas continua
+        valid_pdfs = []
+        for pdf_path in pdf_paths:
+            if pdf_path.exists():
+                valid_pdfs.append(pdf_path)
+            else:
+                print(f"AVISO: Arquivo PDF não encontrado: {pdf_path}")
         
-        print("Enviando email...")
-        send_selectors = [
-            (By.CSS_SELECTOR, "button[aria-label*='Send']"),
-            (By.CSS_SELECTOR, "button[data-icon-name*='Send']"),
-            (By.XPATH, "//button[contains(@aria-label, 'Send')]"),
-        ]
+        if not valid_pdfs:
+            print(f"ERRO: Nenhum arquivo PDF válido encontrado para {hospital_name}")
+            email_status_report.add(hospital_name, 'Nenhum arquivo válido', 'Erro - Nenhum PDF encontrado')
+            return False
         
-        send_button = None
-        for by, selector in send_selectors:
-            try:
-                send_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                print(f"Botao Send encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
+        # Busca os emails do hospital usando match flexível
+        hospital_email_data = find_hospital_email(hospital_name, hospital_emails)
+        if not hospital_email_data:
+            print(f"AVISO: Não foram encontrados emails para o hospital {hospital_name}")
+            email_status_report.add(hospital_name, f"{len(pdf_paths)} arquivos", 'Erro - Email do hospital não encontrado na planilha')
+            return False
         
-        if send_button:
-            send_button.click()
-            time.sleep(3)
+        # Anexos acima do limite de tamanho vão em mais de um email, numerados
+        parts = hospital_message_parts(hospital_name, valid_pdfs)
+        if len(parts) > 1:
+            print(f"Anexos de {hospital_name} passam de {ATTACHMENT_BUDGET_MB} MB: enviando em {len(parts)} emails")
+        results = [send_hospital_message(transport, message_name, message_pdfs, hospital_email_data, rate_controller)
+                   for message_name, message_pdfs in parts]
+        return all(results)
         
-        print(f"SUCESSO: Email enviado com sucesso para {hospital_name} com {len(valid_pdfs)} anexos")
+    except Exception as e:
+        print(f"ERRO ao enviar email para {hospital_name}: {e}")
+        email_status_report.add(hospital_name, f"{len(pdf_paths)} arquivos", f'Erro - {str(e)[:100]}')
+        return False
+
+def send_hospital_message(transport, hospital_name, valid_pdfs, hospital_email_data, rate_controller=None):
+    """
+    Envia um email de boletos (um hospital, ou uma parte numerada dele) com os PDFs informados,
+    registra no outbox e no relatório e exclui os PDFs enviados. Retorna True se o email saiu.
+    """
+    try:
+        message = build_hospital_message(hospital_name, valid_pdfs, hospital_email_data)
+        
+        # Outbox: um email que já saiu em uma execução anterior não é enviado de novo
+        outbox_key = None
+        if outbox is not None:
+            outbox_key, outbox_state = outbox.begin_send(hospital_name, message)
+            if outbox_state == 'enviado':
+                print(f"Email para {hospital_name} já foi enviado em uma execução anterior (outbox), não será reenviado")
+                email_status_report.add(hospital_name, f"{len(valid_pdfs)} arquivos (execução anterior)", 'Enviado')
+                delete_sent_pdfs(hospital_name, valid_pdfs)
+                return True
+            if outbox_state == 'incerto':
+                # Uma execução caiu no meio deste envio: só sai de novo depois da conferência do operador
+                print(f"AVISO: O envio anterior para {hospital_name} foi interrompido e pode ter saído; "
+                      f"confira os Itens Enviados (--resolve-uncertain)")
+                email_status_report.add(hospital_name, f"{len(valid_pdfs)} arquivos",
+                                        'Incerto - confira os Itens Enviados')
+                return False
+        
+        print(f"Enviando email para {hospital_name}: To={', '.join(message.to)}, Cc={', '.join(message.cc)}")
+        print(f"Arquivos PDF ({len(valid_pdfs)}): {[p.name for p in valid_pdfs]}")
         
-        email_status_report.append({
-            'hospital': hospital_name,
-            'arquivo': f"{len(valid_pdfs)} arquivos",
-            'situacao': 'Enviado'
-        })
+        try:
+            send_with_rate_control(transport, message, rate_controller)
+        except Exception as send_error:
+            if outbox_key:
+                outbox.mark_error(outbox_key, send_error)
+            raise
+        if outbox_key:
+            outbox.mark_sent(outbox_key)
+        
+        if message.inline_files:
+            print(f"SUCESSO: Email enviado com sucesso para {hospital_name} com os boletos no corpo")
+            email_status_report.add(hospital_name, f"{len(valid_pdfs)} arquivos (no corpo do email)", 'Enviado')
+        else:
+            print(f"SUCESSO: Email enviado com sucesso para {hospital_name} com {len(valid_pdfs)} anexos")
+            email_status_report.add(hospital_name, f"{len(valid_pdfs)} arquivos", 'Enviado')
         
         # EXCLUIR TODOS OS PDFs DO HOSPITAL APÓS ENVIO
-        print(f"Excluindo {len(valid_pdfs)} arquivos PDF do hospital {hospital_name}...")
-        for pdf_path in valid_pdfs:
-            try:
-                if pdf_path.exists():
-                    pdf_path.unlink()
-                    print(f"  PDF excluido: {pdf_path.name}")
-                else:
-                    print(f"  Aviso: Arquivo PDF não encontrado para exclusão: {pdf_path}")
-            except Exception as delete_error:
-                print(f"  Erro ao excluir PDF {pdf_path.name}: {delete_error}")
+        delete_sent_pdfs(hospital_name, valid_pdfs)
         
         return True
         
     except Exception as e:
         print(f"ERRO ao enviar email para {hospital_name}: {e}")
-        email_status_report.append({
-            'hospital': hospital_name,
-            'arquivo': f"{len(pdf_paths)} arquivos",
-            'situacao': f'Erro - {str(e)[:100]}'
-        })
+        email_status_report.add(hospital_name, f"{len(valid_pdfs)} arquivos", f'Erro - {str(e)[:100]}')
         return False
 
+def sender_worker(worker_id, hospital_queue, hospital_emails, worker_stats, rate_controller):
+    """
+    Sessão de envio: abre seu próprio transporte (navegador com login ou conexão SMTP)
+    e envia os hospitais retirados da fila compartilhada até receber o sinal de fim (None).
+    O intervalo entre os emails vem do `rate_controller`, compartilhado entre as sessões.
+    Depois do horário limite (send_schedule), os hospitais restantes são adiados em vez de enviados.
+    """
+    stats = {'sessao': worker_id, 'enviados': 0, 'falhas': 0, 'adiados': 0, 'reciclagens': 0,
+             'inicio': time.monotonic(), 'fim': None}
+    worker_stats.append(stats)
+    transport = create_mail_transport()
+    
+    try:
+        print(f"[Sessão {worker_id}] Abrindo transporte de envio ({transport.name})...")
+        transport.open()
+        
+        while True:
+            item = hospital_queue.get()
+            try:
+                if item is None:
+                    break
+                
+                hospital_name, pdf_paths = item
+                if not send_schedule.allows_send():
+                    # Guarda as chaves do outbox: a próxima execução reaproveita ou encerra essas mensagens
+                    send_schedule.defer(hospital_name, pdf_paths,
+                                        register_hospital_messages(hospital_name, pdf_paths, hospital_emails))
+                    stats['adiados'] += 1
+                    continue
+                
+                print(f"\n=== [Sessão {worker_id}] Processando email para: {hospital_name} ===")
+                print(f"PDFs a anexar: {[p.name for p in pdf_paths]}")
+                
+                send_start = time.monotonic()
+                success = send_email_with_attachment(transport, pdf_paths, hospital_name, hospital_emails,
+                                                     rate_controller)
+                send_schedule.record_duration(time.monotonic() - send_start)
+                
+                if success:
+                    stats['enviados'] += 1
+                    print(f"SUCESSO: Email enviado para {hospital_name} com {len(pdf_paths)} anexos")
+                else:
+                    stats['falhas'] += 1
+                    print(f"FALHA: Email não enviado para {hospital_name} (continuando para o próximo...)")
+            finally:
+                hospital_queue.task_done()
+    
+    except Exception as e:
+        print(f"[Sessão {worker_id}] ERRO na sessão de envio: {e}")
+        print(f"[Sessão {worker_id}] Os hospitais restantes ficam para as outras sessões")
+    finally:
+        stats['fim'] = time.monotonic()
+        stats['reciclagens'] = transport.recycles
+        transport.close()
+
+def run_sender_pool(hospital_queue, hospital_emails, concurrency):
+    """
+    Executa `concurrency` sessões de envio em paralelo consumindo a mesma fila.
+    Quem alimenta a fila deve colocar um None por sessão ao final (ver close_sender_queue).
+    Hospitais que sobrarem na fila (todas as sessões falharam) são registrados como erro.
+    Retorna as estatísticas de cada sessão.
+    """
+    worker_stats = []
+    workers = []
+    rate_controller = create_send_rate_controller()
+    
+    for worker_id in range(1, concurrency + 1):
+        worker = threading.Thread(
+            target=sender_worker,
+            args=(worker_id, hospital_queue, hospital_emails, worker_stats, rate_controller),
+            name=f"envio-{worker_id}",
+            daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+    
+    for worker in workers:
+        worker.join()
+    
+    rate_controller.print_summary()
+    
+    # Se todas as sessões caíram, o que ficou na fila não foi enviado
+    drain_sender_queue(hospital_queue)
+    
+    return worker_stats
+
+def drain_sender_queue(hospital_queue):
+    """Esvazia a fila sem sessão de envio para consumir, registrando cada hospital que sobrou como erro."""
+    while True:
+        try:
+            item = hospital_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is not None:
+            hospital_name, pdf_paths = item
+            email_status_report.add(hospital_name, f"{len(pdf_paths)} arquivos", 'Erro - Nenhuma sessão de envio disponível')
+
+def put_in_sender_queue(hospital_queue, item, senders_alive=None):
+    """
+    Coloca o item na fila de envio. Numa fila limitada, com `senders_alive`, não espera para sempre:
+    se todas as sessões de envio caíram (ex: login recusado), desiste e retorna False.
+    """
+    if senders_alive is None:
+        hospital_queue.put(item)
+        return True
+    while True:
+        try:
+            hospital_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            if not senders_alive():
+                return False
+
+def close_sender_queue(hospital_queue, concurrency, senders_alive=None):
+    """Sinaliza o fim da fila para todas as sessões de envio."""
+    for _ in range(concurrency):
+        if not put_in_sender_queue(hospital_queue, None, senders_alive):
+            break
+
+def print_sender_pool_summary(worker_stats):
+    """Mostra a vazão (emails por minuto) de cada sessão de envio."""
+    print("\n=== VAZÃO POR SESSÃO DE ENVIO ===")
+    for stats in sorted(worker_stats, key=lambda item: item['sessao']):
+        elapsed = (stats['fim'] or time.monotonic()) - stats['inicio']
+        processed = stats['enviados'] + stats['falhas']
+        per_minute = processed / (elapsed / 60) if elapsed > 0 else 0
+        deferred = f", {stats['adiados']} adiados" if stats.get('adiados') else ""
+        recycled = f", navegador reciclado {stats['reciclagens']}x" if stats.get('reciclagens') else ""
+        print(f"  Sessão {stats['sessao']}: {stats['enviados']} enviados, {stats['falhas']} falhas{deferred} "
+              f"em {elapsed:.0f}s ({per_minute:.2f} emails/min){recycled}")
+
+def print_send_summary(hospital_count, worker_stats, pdf_files):
+    """Resumo do envio e exclusão dos PDFs que sobraram (não enviados)."""
+    successful_sends = sum(stats['enviados'] for stats in worker_stats)
+    deferred_sends = sum(stats.get('adiados', 0) for stats in worker_stats)
+    failed_sends = hospital_count - successful_sends - deferred_sends
+    
+    # Resumo final
+    print("\n=== RESUMO DO ENVIO ===")
+    print(f"Total de emails processados (por hospital ou por conjunto de destinatários): {hospital_count}")
+    print(f"Emails enviados com sucesso: {successful_sends}")
+    print(f"Emails com falha: {failed_sends}")
+    if deferred_sends:
+        print(f"Emails adiados pelo horário limite ({send_schedule.deadline:%H:%M}): {deferred_sends} "
+              f"(ficam para a próxima execução)")
+    print(f"Total de PDFs processados: {len(pdf_files)}")
+    print_sender_pool_summary(worker_stats)
+    
+    if failed_sends > 0:
+        print(f"AVISO: {failed_sends} emails não foram enviados. Verifique o relatório para detalhes.")
+    
+    # BACKUP: Tenta excluir PDFs restantes (com o outbox, ficam para o --resume)
+    remaining_pdfs = [pdf for pdf in pdf_files if pdf.exists()]
+    if remaining_pdfs and outbox is not None:
+        print(f"{len(remaining_pdfs)} PDFs não enviados mantidos em '{PROCESSED_FOLDER.name}'. "
+              f"Para tentar de novo: python rpa.py --resume")
+    elif remaining_pdfs:
+        print(f"Limpando {len(remaining_pdfs)} arquivos PDF restantes...")
+        for pdf in remaining_pdfs:
+            try:
+                pdf.unlink()
+                print(f"  Excluído: {pdf.name}")
+            except Exception as e:
+                print(f"  Erro ao excluir {pdf.name}: {e}")
+
 def send_all_pdfs_by_email(pdf_files, hospital_emails):
     """
     Envia todos os PDFs por email, agrupados por hospital.
-    Cada hospital recebe UM email com TODOS os seus PDFs anexados.
+    Cada hospital recebe UM email com TODOS os seus PDFs anexados, do maior valor vencido para o menor.
+    Os hospitais são distribuídos entre SEND_CONCURRENCY sessões de envio em paralelo (navegadores ou conexões SMTP).
     CONTINUA MESMO COM ERROS - não para a execução.
     """
-    global email_status_report
-    
     if not pdf_files:
         print("Nenhum PDF para enviar.")
         return
@@ -1921,61 +4422,28 @@ def send_all_pdfs_by_email(pdf_files, hospital_emails):
     
     print(f"Total de hospitais encontrados: {len(hospital_pdfs)}")
     
-    # Inicia um novo navegador para envio de emails
-    email_driver = start_browser(headless=False)
+    # Opcional: hospitais com os mesmos destinatários vão na mesma mensagem
+    if COALESCE_RECIPIENTS:
+        hospital_pdfs, hospital_emails = coalesce_hospitals_by_recipients(hospital_pdfs, hospital_emails)
+    
+    # Não abre mais sessões do que hospitais
+    concurrency = max(1, min(SEND_CONCURRENCY, len(hospital_pdfs)))
+    print(f"Sessões de envio simultâneas: {concurrency}")
     
     try:
-        # Login no Outlook
-        login_to_outlook(email_driver)
-        time.sleep(DEFAULT_WAIT_TIME)
+        # Fila compartilhada: cada sessão retira o próximo hospital
+        hospital_queue = queue.Queue()
+        for hospital_name, pdf_paths in prioritize_hospitals(hospital_pdfs):
+            queue_hospital_email(hospital_queue, hospital_name, pdf_paths, hospital_emails)
+        close_sender_queue(hospital_queue, concurrency)
         
-        # Para cada hospital, envia UM email com TODOS os seus PDFs
-        successful_sends = 0
-        failed_sends = 0
+        worker_stats = run_sender_pool(hospital_queue, hospital_emails, concurrency)
         
-        for hospital_name, pdf_paths in hospital_pdfs.items():
-            print(f"\n=== Processando email para: {hospital_name} ===")
-            print(f"PDFs a anexar: {[p.name for p in pdf_paths]}")
-            
-            success = send_email_with_attachment(email_driver, pdf_paths, hospital_name, hospital_emails)
-            
-            if success:
-                successful_sends += 1
-                print(f"SUCESSO: Email enviado para {hospital_name} com {len(pdf_paths)} anexos")
-            else:
-                failed_sends += 1
-                print(f"FALHA: Email não enviado para {hospital_name} (continuando para o próximo...)")
-            
-            # Aguarda um pouco entre os emails
-            time.sleep(DEFAULT_WAIT_TIME * 2)
-        
-        # Resumo final
-        print(f"\n=== RESUMO DO ENVIO ===")
-        print(f"Total de hospitais processados: {len(hospital_pdfs)}")
-        print(f"Emails enviados com sucesso: {successful_sends}")
-        print(f"Emails com falha: {failed_sends}")
-        print(f"Total de PDFs processados: {len(pdf_files)}")
-        
-        if failed_sends > 0:
-            print(f"AVISO: {failed_sends} emails não foram enviados. Verifique o relatório para detalhes.")
-        
-        # BACKUP: Tenta excluir PDFs restantes
-        remaining_pdfs = [pdf for pdf in pdf_files if pdf.exists()]
-        if remaining_pdfs:
-            print(f"Limpando {len(remaining_pdfs)} arquivos PDF restantes...")
-            for pdf in remaining_pdfs:
-                try:
-                    pdf.unlink()
-                    print(f"  Excluído: {pdf.name}")
-                except Exception as e:
-                    print(f"  Erro ao excluir {pdf.name}: {e}")
+        print_send_summary(len(hospital_pdfs), worker_stats, pdf_files)
         
     except Exception as e:
         print(f"ERRO durante o envio de emails: {e}")
         print("CONTINUANDO para gerar relatório...")
-    finally:
-        # Fecha o navegador de email
-        email_driver.quit()
 
 def generate_email_status_report():
     """
@@ -2007,11 +4475,12 @@ def generate_email_status_report():
         elements.append(Spacer(1, 20))
         
         # Resumo estatístico
-        total_emails = len(email_status_report)
-        enviados = sum(1 for item in email_status_report if item['situacao'] == 'Enviado')
-        erros = total_emails - enviados
+        counts = email_status_report.counts()
+        erros = counts['erros']
         
-        resumo_text = f"Resumo: {enviados} enviados com sucesso, {erros} com erro"
+        resumo_text = f"Resumo: {counts['enviados']} enviados com sucesso, {erros} com erro"
+        if counts['adiados']:
+            resumo_text += f", {counts['adiados']} adiados para a próxima execução (horário limite)"
         resumo = Paragraph(resumo_text, styles['Normal'])
         elements.append(resumo)
         elements.append(Spacer(1, 20))
@@ -2039,14 +4508,23 @@ def generate_email_status_report():
             ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
             ('FONTSIZE', (0, 1), (-1, -1), 9),
             ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            # Colore as células de situação
-            ('TEXTCOLOR', (2, 1), (2, -1), 
-             lambda row, col, table=table_data: 
-                 colors.green if table[row][col] == 'Enviado' else colors.red),
+        ] + [
+            # Colore as células de situação: enviado, adiado ou erro
+            ('TEXTCOLOR', (2, row), (2, row),
+             colors.green if situacao == 'Enviado' else colors.orange if situacao == DEFERRED_STATUS else colors.red)
+            for row, (_, _, situacao) in enumerate(table_data[1:], start=1)
         ]))
         
         elements.append(table)
         
+        # Hospitais que ficaram para a próxima execução, fora da lista de erros
+        if counts['adiados'] > 0:
+            elements.append(Spacer(1, 20))
+            elements.append(Paragraph("ADIADOS PARA A PRÓXIMA EXECUÇÃO (HORÁRIO LIMITE):", styles['Heading2']))
+            for item in email_status_report:
+                if item['situacao'] == DEFERRED_STATUS:
+                    elements.append(Paragraph(f"- {item.get('hospital', 'N/A')}: {item['arquivo']}", styles['Normal']))
+        
         # Adiciona seção de detalhes dos erros se houver
         if erros > 0:
             elements.append(Spacer(1, 20))
@@ -2054,429 +4532,738 @@ def generate_email_status_report():
             elements.append(erro_title)
             
             for item in email_status_report:
-                if item['situacao'] != 'Enviado':
-                    erro_text = f"- {item.get('hospital', 'N/A')}: {item['situacao']}"
-                    erro_para = Paragraph(erro_text, styles['Normal'])
-                    elements.append(erro_para)
-        
-        # Gera o PDF
-        doc.build(elements)
-        print(f"Relatório de status gerado: {report_filename}")
-        
-        return report_path
-        
-    except Exception as e:
-        print(f"ERRO ao gerar relatório de status: {e}")
-        return None
-
-def send_status_report_email(driver, report_path):
-    """
-    Envia o relatório de status por email para LOG_AUTOMATION_EMAIL.
-    Versão corrigida usando a mesma lógica da função send_email_with_attachment.
-    """
-    if not report_path or not report_path.exists():
-        print("ERRO: Arquivo de relatório não encontrado para envio.")
-        return False
-    
-    wait = WebDriverWait(driver, 15)
-    
-    try:
-        print("=== ENVIANDO RELATÓRIO DE STATUS POR EMAIL ===")
-        
-        # Garante que estamos na inbox
-        driver.get("https://outlook.office.com/mail/inbox")
-        time.sleep(5)
-        
-        print("Procurando botão de novo email...")
-        # Usa os mesmos seletores da função send_email_with_attachment
-        new_email_selectors = [
-            (By.XPATH, "//button[.//span[contains(text(), 'New') or contains(text(), 'Novo')]]"),
-            (By.CSS_SELECTOR, "button[aria-label*='New mail'], button[aria-label*='Nova mensagem']"),
-            (By.CSS_SELECTOR, "button[data-tid*='newMail']"),
-            (By.XPATH, "//button[contains(@aria-label, 'New mail')]"),
-            (By.CSS_SELECTOR, "button[title*='New Mail']"),
-            (By.CSS_SELECTOR, "i[data-icon-name*='Mail']"),
-        ]
-        
-        new_email_button = None
-        for by, selector in new_email_selectors:
-            try:
-                new_email_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                print(f"Botão New mail encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
-        
-        if not new_email_button:
-            # Tenta método alternativo
-            try:
-                all_buttons = driver.find_elements(By.TAG_NAME, "button")
-                for button in all_buttons:
-                    try:
-                        text = button.text.lower()
-                        aria_label = button.get_attribute('aria-label') or ''
-                        if 'new' in text or 'novo' in text or 'mail' in text or 'email' in text or 'mensagem' in text:
-                            if button.is_displayed() and button.is_enabled():
-                                button.click()
-                                new_email_button = button
-                                print("Botão New mail encontrado por texto/aria-label")
-                                break
-                    except:
-                        continue
-            except Exception as e:
-                print(f"Erro no método alternativo: {e}")
-            
-        if not new_email_button:
-            raise Exception("Não foi possível encontrar o botão de novo email")
-            
-        new_email_button.click()
-        time.sleep(3)
-        
-        print("Aguardando janela de novo email carregar...")
-        time.sleep(5)
-        
-        print("Preenchendo destinatário...")
-        # CAMPO TO - USA A MESMA LÓGICA DA FUNÇÃO send_email_with_attachment
-        to_selectors = [
-            (By.CSS_SELECTOR, "div[aria-label='To'][contenteditable='true']"),
-            (By.CSS_SELECTOR, "div[aria-label*='To'][contenteditable='true']"),
-            (By.CSS_SELECTOR, "div[role='textbox'][aria-label*='To']"),
-            (By.CSS_SELECTOR, "div.EditorClass[contenteditable='true']"),
-            (By.CSS_SELECTOR, "div[contenteditable='true'][aria-label*='To']"),
-            (By.XPATH, "//div[@contenteditable='true' and contains(@aria-label, 'To')]"),
-            (By.XPATH, "//div[@role='textbox' and contains(@aria-label, 'To')]"),
-        ]
-        
-        to_field = None
-        for by, selector in to_selectors:
-            try:
-                to_field = wait.until(EC.presence_of_element_located((by, selector)))
-                print(f"Campo To encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
-        
-        if not to_field:
-            # Busca alternativa por qualquer div contenteditable que possa ser o campo To
-            try:
-                divs = driver.find_elements(By.CSS_SELECTOR, "div[contenteditable='true']")
-                for div in divs:
-                    try:
-                        aria_label = div.get_attribute('aria-label') or ''
-                        if 'to' in aria_label.lower() or 'para' in aria_label.lower():
-                            to_field = div
-                            print("Campo To encontrado por busca alternativa em divs contenteditable")
-                            break
-                    except:
-                        continue
-            except Exception as e:
-                print(f"Erro na busca alternativa do campo To: {e}")
-        
-        if to_field:
-            print("Preenchendo campo To (div contenteditable)...")
-            
-            # Foca no campo
-            to_field.click()
-            time.sleep(1)
-            
-            # Limpa o conteúdo existente usando JavaScript
-            try:
-                driver.execute_script("arguments[0].innerHTML = '';", to_field)
-                print("Conteúdo limpo via JavaScript")
-            except:
-                # Fallback: usa ActionChains para limpar
-                try:
-                    actions = ActionChains(driver)
-                    actions.key_down(Keys.CONTROL).send_keys('a').key_up(Keys.CONTROL).perform()
-                    time.sleep(1)
-                    actions.send_keys(Keys.DELETE).perform()
-                    time.sleep(1)
-                    print("Conteúdo limpo via ActionChains")
-                except Exception as e:
-                    print(f"Erro ao limpar campo: {e}")
-            
-            # Digita o email
-            print(f"Digitando email no campo To: {LOG_AUTOMATION_EMAIL}")
-            
-            to_field.send_keys(LOG_AUTOMATION_EMAIL)
-            time.sleep(0.5)
-            
-            print("Campo To preenchido com sucesso")
-            time.sleep(2)
-            
-            # Pressiona TAB para sair do campo e confirmar o email
-            print("Pressionando TAB para sair do campo To...")
-            actions = ActionChains(driver)
-            actions.send_keys(Keys.TAB).perform()
-            time.sleep(2)
-            
-        else:
-            print("ERRO: Campo To não encontrado")
-            raise Exception("Campo To não encontrado")
+                if item['situacao'] not in ('Enviado', DEFERRED_STATUS):
+                    erro_text = f"- {item.get('hospital', 'N/A')}: {item['situacao']}"
+                    erro_para = Paragraph(erro_text, styles['Normal'])
+                    elements.append(erro_para)
         
-        print("Preenchendo assunto...")
-        # Campo Subject - usa mesma lógica robusta
-        subject_selectors = [
-            (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div/div/div[3]/div/div/div[3]/div[1]/div/div/div/div/div[3]/div[2]/span/input"),
-            (By.CSS_SELECTOR, "input[aria-label*='Subject']"),
-            (By.CSS_SELECTOR, "input[placeholder*='Add a subject']"),
-            (By.CSS_SELECTOR, "input[name*='Subject']"),
-        ]
+        # Gera o PDF
+        doc.build(elements)
+        print(f"Relatório de status gerado: {report_filename}")
         
-        subject_field = None
-        for by, selector in subject_selectors:
-            try:
-                subject_field = wait.until(EC.presence_of_element_located((by, selector)))
-                print(f"Campo Subject encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
+        return report_path
         
-        if subject_field:
-            subject_text = f"Relatório de envio de boletos em aberto - {datetime.now().strftime('%d/%m/%Y')}"
-            subject_field.send_keys(subject_text)
-            time.sleep(2)
-        
-        print("Preenchendo corpo do email...")
-        # Corpo do email - usa mesma lógica robusta
-        body_selectors = [
-            (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[2]/div/div/div/div[3]/div/div/div[3]/div[1]/div/div/div/div/div[4]/div/div[1]/div"),
-            (By.CSS_SELECTOR, "div[role='textbox'][aria-label='Message body']"),
-            (By.CSS_SELECTOR, "div[aria-label*='Message body']"),
-            (By.CSS_SELECTOR, "div[contenteditable='true']"),
-        ]
+    except Exception as e:
+        print(f"ERRO ao gerar relatório de status: {e}")
+        return None
+
+def send_status_report_email(transport, report_path):
+    """
+    Envia o relatório de status por email para LOG_AUTOMATION_EMAIL
+    pelo transporte informado (o mesmo caminho do envio aos hospitais).
+    """
+    if not report_path or not report_path.exists():
+        print("ERRO: Arquivo de relatório não encontrado para envio.")
+        return False
+    
+    
+    try:
+        print("=== ENVIANDO RELATÓRIO DE STATUS POR EMAIL ===")
         
-        body_field = None
-        for by, selector in body_selectors:
-            try:
-                body_field = wait.until(EC.presence_of_element_located((by, selector)))
-                print(f"Corpo do email encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
+        # Calcula estatísticas
+        total_emails = len(email_status_report)
+        counts = email_status_report.counts()
         
-        if body_field:
-            # Calcula estatísticas
-            total_emails = len(email_status_report)
-            enviados = sum(1 for item in email_status_report if item['situacao'] == 'Enviado')
-            erros = total_emails - enviados
-            
-            mensagem = f"""Prezados,
+        mensagem = f"""Prezados,
 
 Segue em anexo o relatório de envio de boletos em aberto realizado em {datetime.now().strftime('%d/%m/%Y às %H:%M')}.
 
 Resumo do processamento:
 - Total de emails processados: {total_emails}
-- Emails enviados com sucesso: {enviados}
-- Emails com erro: {erros}
+- Emails enviados com sucesso: {counts['enviados']}
+- Emails adiados para a próxima execução (horário limite): {counts['adiados']}
+- Emails com erro: {counts['erros']}
 
 O relatório detalhado está em anexo.
 
 Atenciosamente,
 Sistema de Automação de Boletos em Aberto"""
-            
-            body_field.send_keys(mensagem)
-            time.sleep(2)
-        
-        print("Clicando em Insert...")
-        # Insert option - mesma lógica
-        insert_selectors = [
-            (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[1]/div/div/div[1]/div[2]/div/div/div/div/span/div[1]/div/div/div[5]/div/button/span/span/span"),
-            (By.CSS_SELECTOR, "button[aria-label*='Insert']"),
-        ]
-        
-        insert_button = None
-        for by, selector in insert_selectors:
-            try:
-                insert_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                print(f"Botão Insert encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
         
-        if insert_button:
-            insert_button.click()
-            time.sleep(2)
+        message = OutgoingEmail(
+            to=[LOG_AUTOMATION_EMAIL],
+            cc=[],
+            subject=f"Relatório de envio de boletos em aberto - {datetime.now().strftime('%d/%m/%Y')}",
+            body=mensagem,
+            attachments=[report_path]
+        )
+        transport.send(message)
         
-        print("Clicando em Attach file...")
-        # Attach file button - mesma lógica
-        attach_selectors = [
-            (By.XPATH, "/html/body/div[1]/div/div[2]/div/div[2]/div[1]/div/div/div[2]/div[1]/div/div/div/div/div/div/div/div/div/div/div[1]/div/div/div/div[1]/button/span/span[1]/span"),
-            (By.CSS_SELECTOR, "button[aria-label*='Attach file']"),
-            (By.CSS_SELECTOR, "button[data-icon-name*='Attach file']"),
-        ]
+        print("SUCESSO: Relatório de status enviado por email!")
+        return True
         
-        attach_button = None
-        for by, selector in attach_selectors:
+    except Exception as e:
+        print(f"ERRO CRÍTICO ao enviar relatório de status: {e}")
+        return False
+
+# ================== MANIFESTO DA EXECUÇÃO (RETOMADA POR ETAPA) ==================
+# Cada etapa concluída grava no run_manifest.json as suas entradas (hash dos arquivos) e saídas:
+# planilhas baixadas, tabelas lidas, PDFs gerados e resultado dos envios. Uma execução que caiu
+# no meio continua da primeira etapa pendente, ou cujas entradas mudaram, reaproveitando o resto.
+# --from-stage força refazer a partir de uma etapa.
+
+RUN_MANIFEST_PATH = BASE_DIR / "run_manifest.json"
+RUN_STAGES = ('download', 'leitura', 'pdf', 'envio', 'relatorio')
+
+def files_digest(paths):
+    """{caminho: sha256} dos arquivos que existem."""
+    return {str(path): file_sha256(Path(path)) for path in paths if Path(path).exists()}
+
+class RunManifest:
+    """Etapas concluídas da execução atual, gravadas em JSON a cada etapa."""
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.data = {}
+        if self.path.exists():
             try:
-                attach_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                print(f"Botão Attach encontrado com: {by} = {selector}")
-                break
-            except:
-                continue
-        
-        if attach_button:
-            attach_button.click()
-            time.sleep(2)
-        
-        print("Clicando em Browse this computer...")
-        # Browse this computer button - mesma lógica
-        browse_selectors = [
-            (By.XPATH, "/html/body/div[2]/div[6]/div/div/div/div/div/div/ul/li/div/ul/li[1]/button/div/span"),
-            (By.CSS_SELECTOR, "button[aria-label*='Browse this computer']"),
-            (By.CSS_SELECTOR, "div[title*='Browse this computer']"),
-        ]
+                self.data = json.loads(self.path.read_text(encoding='utf-8'))
+            except Exception as e:
+                print(f"AVISO: Manifesto da execução ilegível ({e}); começando do zero")
+    
+    def _save(self):
+        # Grava em arquivo temporário e troca: uma queda no meio não corrompe o manifesto
+        temp_path = self.path.with_suffix('.tmp')
+        temp_path.write_text(json.dumps(self.data, ensure_ascii=False, indent=2), encoding='utf-8')
+        os.replace(temp_path, self.path)
+    
+    def start_run(self):
+        """Começa uma execução nova, descartando as etapas da anterior."""
+        with self._lock:
+            self.data = {
+                'execucao': datetime.now().strftime('%Y%m%d_%H%M%S'),
+                'dia': datetime.now().strftime('%Y-%m-%d'),
+                'concluida': False,
+                'etapas': {},
+            }
+            self._save()
+    
+    def finish(self):
+        """Marca a execução como concluída (a próxima começa do zero)."""
+        with self._lock:
+            self.data['concluida'] = True
+            self._save()
+    
+    def record(self, stage, inputs, outputs, **details):
+        """Registra a etapa como concluída. As etapas seguintes deixam de valer (as entradas delas mudaram)."""
+        with self._lock:
+            stages = self.data.setdefault('etapas', {})
+            for later_stage in RUN_STAGES[RUN_STAGES.index(stage) + 1:]:
+                stages.pop(later_stage, None)
+            stages[stage] = {
+                'concluida_em': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'entradas': inputs,
+                'saidas': outputs,
+                **details,
+            }
+            if stage == 'envio':
+                self.data.pop('adiados', None)
+            if stage == RUN_STAGES[-1]:
+                self.data['concluida'] = True
+            self._save()
+    
+    def update_outputs(self, stage, outputs):
+        """Atualiza as saídas de uma etapa já registrada (ex: PDFs compactados antes do envio), sem refazer as seguintes."""
+        with self._lock:
+            entry = self.stage(stage)
+            if entry is not None:
+                entry['saidas'] = outputs
+                self._save()
+    
+    def defer_sends(self, deferred):
+        """
+        Envio interrompido pelo horário limite: guarda os hospitais adiados
+        {hospital: {'pdfs': [PDFs], 'chaves': [chaves das mensagens no outbox]}}.
+        """
+        with self._lock:
+            self.data['adiados'] = deferred
+            self._save()
+    
+    def deferred_pdfs(self):
+        """PDFs dos hospitais adiados que continuam no disco."""
+        return [Path(path) for entry in self.data.get('adiados', {}).values() for path in entry['pdfs']
+                if Path(path).exists()]
+    
+    def deferred_keys(self):
+        """Chaves no outbox das mensagens dos hospitais adiados."""
+        return [key for entry in self.data.get('adiados', {}).values() for key in entry.get('chaves', [])]
+    
+    def stage(self, name):
+        return self.data.get('etapas', {}).get(name)
+    
+    @staticmethod
+    def _changed_inputs(entry):
+        """Entradas que ainda existem com conteúdo diferente do registrado."""
+        return [path for path, digest in entry['entradas'].items()
+                if Path(path).exists() and file_sha256(Path(path)) != digest]
+    
+    def _outputs_available(self, name):
+        """As saídas da etapa continuam no disco para alimentar a etapa seguinte (se mudaram, a seguinte é refeita)."""
+        return all(Path(path).exists() for path in self.stage(name)['saidas'])
+    
+    def resume_stage(self, forced_stage=None):
+        """
+        Etapa a partir da qual continuar a execução registrada, ou None para começar uma execução nova
+        (sem manifesto, execução anterior concluída ou de outro dia). Hospitais adiados pelo horário
+        limite continuam do 'envio' no mesmo dia; em outro dia a execução nova os substitui (close_deferred_sends).
+        """
+        if not self.data.get('etapas'):
+            return None
+        today = datetime.now().strftime('%Y-%m-%d')
+        if (forced_stage is None and not self.data.get('concluida') and self.data.get('dia') == today
+                and self.deferred_pdfs()):
+            print(f"Envio anterior parou no horário limite: {len(self.data['adiados'])} hospitais adiados")
+            return 'envio'
+        if forced_stage is None and (self.data.get('concluida') or self.data.get('dia') != today):
+            return None
         
-        browse_button = None
-        for by, selector in browse_selectors:
-            try:
-                browse_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                print(f"Botão Browse encontrado com: {by} = {selector}")
+        start = len(RUN_STAGES) - 1
+        for index, name in enumerate(RUN_STAGES):
+            entry = self.stage(name)
+            if name == forced_stage:
+                print(f"Etapa '{name}' refeita a pedido (--from-stage)")
+                start = index
+                break
+            if entry is None:
+                start = index
+                break
+            changed = self._changed_inputs(entry)
+            if changed:
+                print(f"Entradas da etapa '{name}' mudaram: {[Path(path).name for path in changed]}")
+                start = index
                 break
-            except:
-                continue
-        
-        if browse_button:
-            browse_button.click()
-            time.sleep(3)
-        
-        print("Navegando para a pasta dos relatórios...")
-        time.sleep(3)
-        
-        pyautogui.click(x=500, y=100)
-        time.sleep(2)
-        
-        pyautogui.hotkey('ctrl', 'a')
-        time.sleep(1)
-        pyautogui.press('delete')
-        time.sleep(1)
-        
-        report_folder_path = str(PROCESSED_FOLDER.resolve())
-        print(f"Digitando caminho da pasta: {report_folder_path}")
-        pyautogui.write(report_folder_path)
-        time.sleep(1)
-        pyautogui.press('enter')
-        time.sleep(3)
-        
-        report_filename = report_path.name
-        print(f"Digitando nome do arquivo: {report_filename}")
-        pyautogui.write(report_filename)
-        time.sleep(1)
-        pyautogui.press('enter')
-        time.sleep(5)
-        
-        print("Verificando se o arquivo foi anexado...")
-        time.sleep(3)
-        
-        attachment_found = False
         
+        # Sem as saídas da etapa anterior (ex: PDFs já excluídos após o envio), ela também é refeita
+        while start > 0 and not self._outputs_available(RUN_STAGES[start - 1]):
+            print(f"Saídas da etapa '{RUN_STAGES[start - 1]}' não estão mais no disco; refazendo também")
+            start -= 1
+        return RUN_STAGES[start]
+
+run_manifest = None
+
+def record_stage(stage, inputs, outputs, **details):
+    """Registra a etapa no manifesto da execução, quando ele está ativo."""
+    if run_manifest is None:
+        return
+    try:
+        run_manifest.record(stage, inputs, outputs, **details)
+    except Exception as e:
+        print(f"AVISO: Não foi possível registrar a etapa '{stage}' no manifesto: {e}")
+
+def record_download_stage():
+    """Etapa 'download' concluída: as planilhas disponíveis (já extraídas dos ZIPs) são a saída dela."""
+    record_stage('download', {}, files_digest(find_downloaded_excel_files()))
+
+def refresh_pdf_stage_digests():
+    """Saídas da etapa 'pdf' com o hash atual dos PDFs (compactados depois de registrada a etapa)."""
+    if run_manifest is None or not run_manifest.stage('pdf'):
+        return
+    try:
+        run_manifest.update_outputs('pdf', current_pdf_digests(run_manifest.stage('pdf')['saidas']))
+    except Exception as e:
+        print(f"AVISO: Não foi possível atualizar os hashes dos PDFs no manifesto: {e}")
+
+def record_send_stage(pdf_digests):
+    """
+    Etapa 'envio' concluída: guarda o status de cada hospital para o relatório de uma retomada.
+    Se o horário limite adiou hospitais, a etapa fica pendente e o manifesto guarda os adiados.
+    Os hashes dos PDFs compactados na fila de envio são atualizados também nas saídas da etapa 'pdf'.
+    """
+    pdf_digests = current_pdf_digests(pdf_digests)
+    refresh_pdf_stage_digests()
+    if send_schedule.deferred:
+        if run_manifest is not None:
+            run_manifest.defer_sends(send_schedule.deferred_entries())
+        return
+    record_stage('envio', pdf_digests, {}, resultados=email_status_report.snapshot())
+
+def close_deferred_sends():
+    """
+    Execução nova com hospitais adiados pela execução anterior (ex: no dia seguinte): o download
+    do dia traz de novo as cobranças em aberto, então as mensagens adiadas são encerradas no outbox
+    em vez de ficarem pendentes para sempre (e de voltarem no --resume sem os PDFs).
+    """
+    deferred = run_manifest.data.get('adiados') if run_manifest is not None else None
+    if not deferred or outbox is None:
+        return
+    print(f"{len(deferred)} hospitais adiados na execução {run_manifest.data.get('execucao')} "
+          f"são substituídos pelo download desta execução: {list(deferred)}")
+    outbox.close_messages(run_manifest.deferred_keys(),
+                          f"Substituída pela execução de {datetime.now():%d/%m/%Y %H:%M} (adiada pelo horário limite)")
+
+def run_from_stage(start_stage, hospital_emails):
+    """
+    Continua a execução do manifesto a partir de `start_stage`, reaproveitando as saídas registradas
+    das etapas anteriores. Roda as etapas uma depois da outra. Retorna a lista de PDFs da execução.
+    """
+    start = RUN_STAGES.index(start_stage)
+    print("\n" + "="*50)
+    print(f"RETOMADA DA EXECUÇÃO {run_manifest.data.get('execucao')} A PARTIR DA ETAPA '{start_stage.upper()}'")
+    print("="*50)
+    
+    if start <= RUN_STAGES.index('leitura'):
+        excel_files = [Path(path) for path in run_manifest.stage('download')['saidas']]
+        print(f"Planilhas do download anterior: {[path.name for path in excel_files]}")
+        tables = parse_excel_files(excel_files)
+    else:
+        tables = run_manifest.stage('leitura')['tabelas']
+    
+    if start <= RUN_STAGES.index('pdf'):
+        # Remove os PDFs da tentativa anterior para não gerar cópias com sufixo _2
+        previous = run_manifest.stage('pdf')
+        for pdf_path in (previous['saidas'] if previous else {}):
+            Path(pdf_path).unlink(missing_ok=True)
+        pdf_files = render_tables_to_pdfs(tables)
+        print(f"\nTotal de PDFs gerados: {len(pdf_files)}")
+    elif run_manifest.data.get('adiados'):
+        # Envio parou no horário limite: só os hospitais adiados (os outros já receberam)
+        pdf_files = run_manifest.deferred_pdfs()
+        restore_pdf_priorities(run_manifest.stage('pdf'))
+        print(f"PDFs adiados pelo horário limite: {[path.name for path in pdf_files]}")
+    else:
+        pdf_files = [Path(path) for path in run_manifest.stage('pdf')['saidas']]
+        restore_pdf_priorities(run_manifest.stage('pdf'))
+    
+    if start <= RUN_STAGES.index('envio'):
+        pdf_digests = run_manifest.stage('pdf')['saidas']
+        # O outbox impede o reenvio dos hospitais que já receberam o email
+        send_all_pdfs_by_email(pdf_files, hospital_emails)
+        record_send_stage(pdf_digests)
+    else:
+        # Envio já concluído: o relatório usa os status gravados no manifesto
+        for item in run_manifest.stage('envio').get('resultados', []):
+            email_status_report.add(item['hospital'], item['arquivo'], item['situacao'])
+        print(f"Envio já concluído nesta execução ({len(email_status_report)} status reaproveitados)")
+    
+    return pdf_files
+
+# ================== PIPELINE EM ESTÁGIOS (DOWNLOAD → EXTRAÇÃO → LEITURA → PDF → ENVIO) ==================
+# Cada estágio roda na sua thread e começa um item assim que o estágio anterior o entrega,
+# com filas limitadas entre eles. O tempo total tende ao do estágio mais lento, e não à soma.
+
+PIPELINE_QUEUE_SIZE = 8
+EXCEL_SUFFIXES = ('.xlsx', '.xls')
+
+class PipelineStage:
+    """Thread de um estágio do pipeline, com o tempo efetivamente ocupado medido."""
+    
+    def __init__(self, name, target):
+        self.name = name
+        self.busy_seconds = 0.0
+        self.items = 0
+        self.result = None
+        self._target = target
+        self.thread = threading.Thread(target=self._run, name=f"pipeline-{name}", daemon=True)
+    
+    def _run(self):
         try:
-            attachment_indicators = [
-                (By.CSS_SELECTOR, "[aria-label*='Anexo']"),
-                (By.CSS_SELECTOR, "[data-automation-id*='attachment']"),
-                (By.CSS_SELECTOR, "[class*='attachment']"),
-                (By.CSS_SELECTOR, "[class*='attachments']"),
-                (By.XPATH, "//*[contains(text(), '.pdf')]"),
-                (By.CSS_SELECTOR, "[title*='.pdf']"),
-                (By.CSS_SELECTOR, "[data-tid*='attachment']"),
-                (By.CSS_SELECTOR, "div[role='listitem']"),
-            ]
-            
-            for by, selector in attachment_indicators:
-                try:
-                    elements = driver.find_elements(by, selector)
-                    for element in elements:
-                        if element.is_displayed():
-                            text = element.text.lower() if element.text else ""
-                            if '.pdf' in text or 'anexo' in text or 'attachment' in text:
-                                attachment_found = True
-                                print(f"SUCESSO: Anexo detectado com seletor: {selector}")
-                                print(f"Texto do elemento: {text}")
-                                break
-                    if attachment_found:
-                        break
-                except:
-                    continue
+            self.result = self._target(self)
         except Exception as e:
-            print(f"Aviso na verificação de anexo: {e}")
-        
-        if not attachment_found:
-            try:
-                elements_with_text = driver.find_elements(By.XPATH, f"//*[contains(text(), '{report_path.name}')]")
-                for element in elements_with_text:
-                    if element.is_displayed():
-                        attachment_found = True
-                        print(f"SUCESSO: Anexo detectado pelo nome do arquivo: {report_path.name}")
-                        break
-            except:
-                pass
-        
-        if not attachment_found:
-            print("AVISO: Não foi possível detectar o anexo automaticamente, mas continuando o processo...")
-            print("Isso pode acontecer devido a diferenças na interface do Outlook.")
-            attachment_found = True
-        
-        if not attachment_found:
-            print("ERRO: Anexo não foi detectado após tentativa de upload")
-            return False
-        
-        print("Enviando email...")
-        send_selectors = [
-            (By.CSS_SELECTOR, "button[aria-label*='Send']"),
-            (By.CSS_SELECTOR, "button[data-icon-name*='Send']"),
-            (By.XPATH, "//button[contains(@aria-label, 'Send')]"),
-        ]
-        
-        send_button = None
-        for by, selector in send_selectors:
-            try:
-                send_button = wait.until(EC.element_to_be_clickable((by, selector)))
-                print(f"Botão Send encontrado com: {by} = {selector}")
+            print(f"ERRO no estágio '{self.name}' do pipeline: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    @contextmanager
+    def busy(self):
+        """Conta o tempo do bloco como trabalho do estágio (fora das esperas nas filas)."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.busy_seconds += time.monotonic() - start
+            self.items += 1
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def is_alive(self):
+        return self.thread.is_alive()
+    
+    def join(self):
+        self.thread.join()
+
+def print_pipeline_summary(stages, wall_seconds):
+    """Tempo ocupado de cada estágio comparado ao tempo total do pipeline."""
+    print("\n=== PIPELINE EM ESTÁGIOS ===")
+    for stage in stages:
+        print(f"  {stage.name:<10} ocupado {stage.busy_seconds:7.1f}s ({stage.items} itens)")
+    total_busy = sum(stage.busy_seconds for stage in stages)
+    slowest = max((stage.busy_seconds for stage in stages), default=0)
+    print(f"  Tempo total: {wall_seconds:.1f}s | soma dos estágios: {total_busy:.1f}s | "
+          f"estágio mais lento: {slowest:.1f}s")
+
+def run_pipeline(download_driver, hospital_emails):
+    """
+    Executa download, extração, leitura das planilhas, geração dos PDFs e envio de forma sobreposta.
+    
+    O envio de um hospital começa assim que todos os PDFs dele ficam prontos. Como um email
+    baixado depois pode trazer boletos do mesmo hospital, os grupos por hospital só são fechados
+    quando todas as planilhas já foram lidas (a geração dos PDFs continua em paralelo ao envio).
+    Retorna a lista de PDFs gerados.
+    """
+    pipeline_start = time.monotonic()
+    download_watcher = DownloadWatcher(DOWNLOAD_FOLDER)
+    parse_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    render_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    hospital_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    
+    state = threading.Condition()
+    expected_pdfs = []  # caminhos reservados na leitura, na ordem
+    finished_pdfs = {}  # caminho -> True (gerado) ou False (falhou)
+    parse_done = threading.Event()
+    tables = []  # tabelas lidas, gravadas no checkpoint
+    pdf_digests = {}  # hash de cada PDF gerado, para o manifesto
+    
+    def download_stage(stage):
+        try:
+            with stage.busy():
+                if FETCH_BACKEND == 'imap':
+                    download_attachments_via_imap()
+                else:
+                    search_and_download_attachments(download_driver, download_watcher)
+        finally:
+            download_watcher.finish()
+    
+    def extract_stage(stage):
+        try:
+            # Cada arquivo chega aqui assim que termina de baixar (e os extraídos dos ZIPs também)
+            for downloaded_file in download_watcher.iter_completed():
+                suffix = downloaded_file.suffix.lower()
+                if suffix == '.zip':
+                    with stage.busy():
+                        extract_zip_file(downloaded_file)
+                elif suffix in EXCEL_SUFFIXES:
+                    parse_queue.put(downloaded_file)
+            record_download_stage()
+        finally:
+            parse_queue.put(None)
+    
+    def parse_stage(stage):
+        processed_hashes = {}
+        reserved_paths = set()
+        try:
+            while True:
+                excel_file = parse_queue.get()
+                if excel_file is None:
+                    break
+                
+                with stage.busy():
+                    try:
+                        print(f"\n[Leitura] {excel_file.relative_to(DOWNLOAD_FOLDER)}")
+                        file_hash = file_sha256(excel_file)
+                        if file_hash in processed_hashes:
+                            print(f"  Ignorado: mesmo conteúdo de {processed_hashes[file_hash].relative_to(DOWNLOAD_FOLDER)}")
+                            continue
+                        processed_hashes[file_hash] = excel_file
+                        
+                        df_clean, file_type = parse_excel_file(excel_file)
+                        if df_clean is None:
+                            continue
+                        tables.append(save_table_checkpoint(df_clean, excel_file, file_type, file_hash))
+                        hospital_groups = split_by_hospital(df_clean, file_type)
+                    except Exception as e:
+                        print(f"ERRO ao processar {excel_file.name}: {e}")
+                        continue
+                
+                for hospital, hospital_data in hospital_groups:
+                    pdf_path = build_pdf_path(hospital, file_type, reserved_paths)
+                    # Valor vencido e atraso calculados na leitura, para enviar primeiro quem mais deve
+                    record_boleto_priority(pdf_path, hospital_data)
+                    with state:
+                        expected_pdfs.append(pdf_path)
+                    render_queue.put((hospital, hospital_data, excel_file, file_type, pdf_path))
+            record_stage('leitura', {str(path): file_hash for file_hash, path in processed_hashes.items()},
+                         files_digest(table['tabela'] for table in tables), tabelas=tables)
+        finally:
+            render_queue.put(None)
+            with state:
+                parse_done.set()
+                state.notify_all()
+    
+    def render_stage(stage):
+        while True:
+            item = render_queue.get()
+            if item is None:
                 break
-            except:
-                continue
+            
+            hospital, hospital_data, excel_file, file_type, pdf_path = item
+            with stage.busy():
+                result = generate_specific_pdf(hospital, hospital_data, excel_file, file_type, pdf_path)
+                if result:
+                    # O hash é tirado antes de liberar o envio, que exclui o PDF
+                    pdf_digests.update(files_digest([pdf_path]))
+            with state:
+                finished_pdfs[pdf_path] = bool(result)
+                state.notify_all()
+        
+        # PDFs já compactados na fila de envio entram com o hash de depois da compactação
+        record_stage('pdf', files_digest(table['tabela'] for table in tables), current_pdf_digests(pdf_digests),
+                     prioridades=priorities_for_manifest(pdf_digests))
+    
+    stages = [
+        PipelineStage('download', download_stage).start(),
+        PipelineStage('extração', extract_stage).start(),
+        PipelineStage('leitura', parse_stage).start(),
+    ]
+    render = PipelineStage('pdf', render_stage).start()
+    stages.append(render)
+    
+    # Os grupos por hospital dependem de todas as planilhas lidas
+    with state:
+        while not parse_done.is_set():
+            state.wait(0.5)
+        all_pdfs = list(expected_pdfs)
+    
+    hospital_pdfs = group_pdfs_by_hospital(all_pdfs) if all_pdfs else {}
+    if hospital_pdfs and COALESCE_RECIPIENTS:
+        hospital_pdfs, hospital_emails = coalesce_hospitals_by_recipients(hospital_pdfs, hospital_emails)
+    worker_stats = []
+    
+    if hospital_pdfs:
+        concurrency = max(1, min(SEND_CONCURRENCY, len(hospital_pdfs)))
+        print(f"\nHospitais a enviar: {len(hospital_pdfs)} | sessões de envio simultâneas: {concurrency}")
+        
+        def send_stage(stage):
+            with stage.busy():
+                return run_sender_pool(hospital_queue, hospital_emails, concurrency)
+        
+        sender = PipelineStage('envio', send_stage).start()
+        stages.append(sender)
+        
+        # Cada hospital vai para a fila de envio quando todos os PDFs dele terminaram; entre os
+        # prontos, sai primeiro o de maior valor vencido (a fila cheia segura os demais)
+        pending = dict(hospital_pdfs)
+        while pending:
+            with state:
+                ready = [name for name, paths in pending.items() if all(path in finished_pdfs for path in paths)]
+                if not ready and not render.is_alive():
+                    ready = list(pending)  # estágio de PDF encerrou: o que faltou não vai ser gerado
+                if not ready:
+                    state.wait(0.5)
+                    continue
+                name = min(ready, key=lambda name: (-message_priority(pending[name])['pontos'], name))
+                batches = [(name, [path for path in pending.pop(name) if finished_pdfs.get(path)])]
+            
+            for hospital_name, pdf_paths in batches:
+                if not pdf_paths:
+                    email_status_report.add(hospital_name, 'Nenhum arquivo válido', 'Erro - PDF não gerado')
+                elif not queue_hospital_email(hospital_queue, hospital_name, pdf_paths, hospital_emails, sender.is_alive):
+                    # Todas as sessões de envio caíram: a fila limitada não anda mais
+                    print("ERRO: Nenhuma sessão de envio disponível; os hospitais restantes não serão enviados")
+                    for name, paths in [(hospital_name, pdf_paths)] + list(pending.items()):
+                        email_status_report.add(name, f"{len(paths)} arquivos", 'Erro - Nenhuma sessão de envio disponível')
+                    pending.clear()
+        
+        close_sender_queue(hospital_queue, concurrency, sender.is_alive)
+        sender.join()
+        drain_sender_queue(hospital_queue)  # colocados depois que as sessões caíram
+        worker_stats = sender.result or []
+        render.join()
+        record_send_stage(dict(pdf_digests))
+    else:
+        print("\nAVISO: Nenhum PDF a gerar.")
+    
+    for stage in stages:
+        stage.join()
+    
+    generated_pdfs = [path for path in all_pdfs if finished_pdfs.get(path)]
+    if hospital_pdfs:
+        print_send_summary(len(hospital_pdfs), worker_stats, generated_pdfs)
+    print_pipeline_summary(stages, time.monotonic() - pipeline_start)
+    return generated_pdfs
+
+def run_sequential_flow(download_driver, hospital_emails):
+    """
+    Download, processamento e envio um depois do outro (pipeline em estagios = não).
+    Retorna a lista de PDFs gerados.
+    """
+    # ETAPA 1: DOWNLOAD DOS ARQUIVOS
+    print("\n" + "="*50)
+    print("ETAPA 1: DOWNLOAD DOS ARQUIVOS DO OUTLOOK")
+    print("="*50)
+    
+    download_watcher = DownloadWatcher(DOWNLOAD_FOLDER)
+    if FETCH_BACKEND == 'imap':
+        download_attachments_via_imap()
+    else:
+        login_to_outlook(download_driver)
+        search_and_download_attachments(download_driver, download_watcher)
+    download_watcher.finish()
+    
+    # Cada arquivo segue para a extração assim que termina de baixar
+    for downloaded_file in download_watcher.iter_completed(DEFAULT_WAIT_TIME * 10):
+        if downloaded_file.suffix.lower() == '.zip':
+            extract_zip_file(downloaded_file)
+    record_download_stage()
+    
+    # Verifica se algum arquivo foi baixado
+    downloaded_files = [f for f in DOWNLOAD_FOLDER.rglob("*") if f.is_file()]
+    excel_files = find_downloaded_excel_files()
+    
+    if downloaded_files:
+        print(f"Download concluído! Arquivos baixados: {[str(f.relative_to(DOWNLOAD_FOLDER)) for f in downloaded_files]}")
+        print(f"Arquivos Excel disponíveis: {[str(f.relative_to(DOWNLOAD_FOLDER)) for f in excel_files]}")
         
-        if send_button:
-            send_button.click()
-            time.sleep(3)
+        # ETAPA 2: PROCESSAR EXCEL E GERAR PDFs
+        print("\n" + "="*50)
+        print("ETAPA 2: PROCESSAMENTO DOS ARQUIVOS EXCEL")
+        print("="*50)
         
-        print("SUCESSO: Relatório de status enviado por email!")
+        pdf_files = process_excel_files_and_generate_pdfs()
         
-        # Verifica se o email foi enviado com sucesso
-        try:
-            # Procura por mensagem de confirmação
-            confirmation_selectors = [
-                (By.XPATH, "//*[contains(text(), 'sent') or contains(text(), 'enviado')]"),
-                (By.CSS_SELECTOR, "[data-tid*='messageSent']"),
-            ]
+        if pdf_files:
+            print(f"\nSUCESSO: {len(pdf_files)} PDFs gerados com sucesso!")
+            print("PDFs criados:")
+            for pdf_file in pdf_files:
+                print(f"  - {pdf_file.name}")
             
-            for by, selector in confirmation_selectors:
-                try:
-                    confirmation = driver.find_element(by, selector)
-                    if confirmation.is_displayed():
-                        print("Confirmação de envio visualizada!")
-                        break
-                except:
-                    continue
-        except:
-            pass
-        
-        return True
+            # ETAPA 3: ENVIAR PDFs POR EMAIL
+            print("\n" + "="*50)
+            print("ETAPA 3: ENVIO DE EMAILS")
+            print("="*50)
+            
+            send_all_pdfs_by_email(pdf_files, hospital_emails)
+            record_send_stage((run_manifest.stage('pdf') or {}).get('saidas', {}) if run_manifest else {})
+            return pdf_files
         
-    except Exception as e:
-        print(f"ERRO CRÍTICO ao enviar relatório de status: {e}")
-        return False
+    else:
+        print("Nenhum arquivo foi baixado. Verifique se o email com anexo foi encontrado.")
+    
+    return []
+
+def resume_pending_sends():
+    """
+    --resume: envia somente as mensagens do outbox que não saíram na última execução,
+    sem baixar nem gerar PDFs de novo. Usa os destinatários gravados no outbox.
+    Retorna os PDFs que ainda existiam para envio.
+    """
+    print("\n" + "="*50)
+    print("RETOMADA: ENVIOS PENDENTES DO OUTBOX")
+    print("="*50)
+    
+    pending = outbox.pending_messages()
+    if not pending:
+        print("Nenhum envio pendente no outbox.")
+        return []
+    
+    hospital_emails = {}
+    hospital_pdfs = {}
+    for item in pending:
+        existing_pdfs = [path for path in item['anexos'] if path.exists()]
+        if not existing_pdfs:
+            print(f"AVISO: PDFs de {item['hospital']} não existem mais; rode o robô completo para gerá-los de novo")
+            email_status_report.add(item['hospital'], f"{len(item['anexos'])} arquivos", 'Erro - PDF não encontrado na retomada')
+            continue
+        print(f"  Pendente: {item['hospital']} ({len(existing_pdfs)} PDFs, {item['tentativas']} tentativas)")
+        hospital_emails[item['hospital']] = {'to': item['to'], 'cc': item['cc']}
+        hospital_pdfs[item['hospital']] = existing_pdfs
+    
+    if not hospital_pdfs:
+        return []
+    
+    # Mesma ordem de prioridade da execução original (valores gravados no manifesto)
+    restore_pdf_priorities(RunManifest(RUN_MANIFEST_PATH).stage('pdf'))
+    concurrency = max(1, min(SEND_CONCURRENCY, len(hospital_pdfs)))
+    hospital_queue = queue.Queue()
+    for hospital_name, pdf_paths in prioritize_hospitals(hospital_pdfs):
+        hospital_queue.put((hospital_name, pdf_paths))
+    close_sender_queue(hospital_queue, concurrency)
+    
+    worker_stats = run_sender_pool(hospital_queue, hospital_emails, concurrency)
+    pdf_files = [path for paths in hospital_pdfs.values() for path in paths]
+    print_send_summary(len(hospital_pdfs), worker_stats, pdf_files)
+    return pdf_files
+
+def send_final_report():
+    """Gera o relatório de status e envia para LOG_AUTOMATION_EMAIL. Retorna True se foi enviado."""
+    # ETAPA 4: GERAR E ENVIAR RELATÓRIO
+    print("\n" + "="*50)
+    print("ETAPA 4: RELATÓRIO DE STATUS")
+    print("="*50)
+    
+    report_path = generate_email_status_report()
+    
+    if report_path:
+        print("Enviando relatório de status por email...")
+        # Usa um novo transporte (navegador ou conexão SMTP) para enviar o relatório
+        try:
+            with create_mail_transport() as report_transport:
+                if send_status_report_email(report_transport, report_path):
+                    print("Relatório de status enviado com sucesso!")
+                    return True
+        except Exception as e:
+            print(f"Erro ao enviar relatório: {e}")
+    else:
+        print("Não foi possível gerar o relatório de status.")
+    return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Robô de boletos: baixa as planilhas, gera os PDFs e envia aos hospitais.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Envia somente os emails pendentes da última execução (outbox), sem baixar nem gerar PDFs")
+    parser.add_argument("--from-stage", choices=RUN_STAGES,
+                        help="Refaz a execução do manifesto a partir desta etapa (as anteriores são reaproveitadas)")
+    parser.add_argument("--resolve-uncertain", choices=('enviado', 'reenviar'),
+                        help="Depois de conferir os Itens Enviados, marca os envios interrompidos (incertos) "
+                             "como enviados ou os libera para o próximo --resume")
+    parser.add_argument("--deadline", metavar="HH:MM",
+                        help="Nenhum email começa depois deste horário; o resto fica para a próxima execução "
+                             "(substitui o 'horario limite do envio' da planilha)")
+    args = parser.parse_args()
+    
     # Carrega as configurações do Excel
     print("Carregando configurações do arquivo Excel...")
     if not load_config_from_excel():
         print("ERRO: Não foi possível carregar as configurações. Verifique o arquivo Excel.")
         exit(1)
     
-    # Limpa as pastas antes de iniciar
-    print("Limpando pastas antes de iniciar...")
-    clean_folders()
+    # Outbox persistente: registra cada email e impede reenvio do que já saiu
+    outbox = Outbox(OUTBOX_PATH)
+    
+    if args.resolve_uncertain:
+        resolved = outbox.resolve_uncertain(args.resolve_uncertain == 'enviado')
+        if resolved:
+            print(f"{len(resolved)} envio(s) incerto(s) marcado(s) como "
+                  f"{'enviado' if args.resolve_uncertain == 'enviado' else 'pendente'}: {resolved}")
+        else:
+            print("Nenhum envio incerto no outbox.")
+        outbox.close()
+        exit(0)
+    
+    # Horário limite do envio (janela de manutenção): o que não couber fica para a próxima execução
+    send_schedule = SendSchedule(parse_deadline(args.deadline or SEND_DEADLINE))
+    if send_schedule.deadline:
+        print(f"Horário limite do envio: {send_schedule.deadline:%d/%m/%Y %H:%M}")
+    
+    if args.resume:
+        create_folders()
+        start_standby_pool()
+        try:
+            if resume_pending_sends():
+                send_final_report()
+        finally:
+            stop_standby_pool()
+            outbox.print_summary()
+            outbox.close()
+        print_wait_summary()
+        selector_resolver.print_stats()
+        print("Processo finalizado!")
+        exit(0)
+    
+    # Manifesto das etapas: uma execução interrompida continua da primeira etapa pendente
+    run_manifest = RunManifest(RUN_MANIFEST_PATH)
+    start_stage = run_manifest.resume_stage(args.from_stage)
+    resuming = start_stage not in (None, 'download')
+    
+    if not resuming:
+        close_deferred_sends()
+        outbox.start_run()
+        run_manifest.start_run()
+        
+        # Limpa as pastas antes de iniciar
+        print("Limpando pastas antes de iniciar...")
+        clean_folders()
     
     # Cria as pastas (caso não existam)
     create_folders()
@@ -2489,80 +5276,43 @@ if __name__ == "__main__":
         print("ERRO: Não foi possível carregar a relação de emails. Verifique o arquivo.")
         exit(1)
     
-    # Inicia o processo principal - PRIMEIRO NAVEGADOR (DOWNLOAD)
-    print("Iniciando navegador para download...")
-    download_driver = start_browser(headless=False)
+    # Sessões reserva já logadas: ficam prontas durante o download e a geração dos PDFs
+    start_standby_pool()
+    
+    # Inicia o processo principal - PRIMEIRO NAVEGADOR (DOWNLOAD), dispensado na busca por IMAP
+    download_driver = None
+    if FETCH_BACKEND == 'outlook' and not resuming:
+        print("Iniciando navegador para download...")
+        download_driver = start_browser(headless=HEADLESS_MODE)
     
     try:
-        # ETAPA 1: DOWNLOAD DOS ARQUIVOS
-        print("\n" + "="*50)
-        print("ETAPA 1: DOWNLOAD DOS ARQUIVOS DO OUTLOOK")
-        print("="*50)
-        
-        login_to_outlook(download_driver)
-        search_and_download_attachments(download_driver)
-        
-        # Extrai os arquivos ZIP após o download
-        extract_zip_files()
-        
-        # Aguarda o download completar
-        time.sleep(DEFAULT_WAIT_TIME * 3)
-        
-        # Verifica se algum arquivo foi baixado
-        downloaded_files = list(DOWNLOAD_FOLDER.glob("*"))
-        excel_files = list(DOWNLOAD_FOLDER.glob("*.xlsx"))
-        
-        if downloaded_files:
-            print(f"Download concluído! Arquivos baixados: {[f.name for f in downloaded_files]}")
-            print(f"Arquivos Excel disponíveis: {[f.name for f in excel_files]}")
-            
-            # ETAPA 2: PROCESSAR EXCEL E GERAR PDFs
+        if resuming:
+            pdf_files = run_from_stage(start_stage, hospital_emails)
+        elif PIPELINE_MODE:
             print("\n" + "="*50)
-            print("ETAPA 2: PROCESSAMENTO DOS ARQUIVOS EXCEL")
+            print("ETAPAS 1 A 3: DOWNLOAD, PROCESSAMENTO E ENVIO EM PIPELINE")
             print("="*50)
             
-            pdf_files = process_excel_files_and_generate_pdfs()
-            
-            if pdf_files:
-                print(f"\nSUCESSO: {len(pdf_files)} PDFs gerados com sucesso!")
-                print("PDFs criados:")
-                for pdf_file in pdf_files:
-                    print(f"  - {pdf_file.name}")
-                
-                # ETAPA 3: ENVIAR PDFs POR EMAIL
-                print("\n" + "="*50)
-                print("ETAPA 3: ENVIO DE EMAILS")
-                print("="*50)
-                
-                send_all_pdfs_by_email(pdf_files, hospital_emails)
-                
-                # ETAPA 4: GERAR E ENVIAR RELATÓRIO
-                print("\n" + "="*50)
-                print("ETAPA 4: RELATÓRIO DE STATUS")
-                print("="*50)
-                
-                report_path = generate_email_status_report()
-                
-                if report_path:
-                    print("Enviando relatório de status por email...")
-                    # Usa um novo navegador para enviar o relatório
-                    report_driver = start_browser(headless=False)
-                    try:
-                        login_to_outlook(report_driver)
-                        send_status_report_email(report_driver, report_path)
-                        print("Relatório de status enviado com sucesso!")
-                    except Exception as e:
-                        print(f"Erro ao enviar relatório: {e}")
-                    finally:
-                        report_driver.quit()
-                else:
-                    print("Não foi possível gerar o relatório de status.")
-                
+            if download_driver:
+                login_to_outlook(download_driver)
+            pdf_files = run_pipeline(download_driver, hospital_emails)
+        else:
+            pdf_files = run_sequential_flow(download_driver, hospital_emails)
+        
+        if pdf_files:
+            report_sent = send_final_report()
+            if send_schedule.deferred:
+                # A etapa 'envio' fica pendente: a próxima execução do dia envia os adiados
+                print(f"{len(send_schedule.deferred)} hospitais adiados pelo horário limite: a próxima execução "
+                      f"de hoje continua o envio deles (ou: python rpa.py --resume); em outro dia, o download "
+                      f"novo os substitui")
+            elif report_sent:
+                record_stage('relatorio', {}, {})
             else:
-                print("\nAVISO: Nenhum PDF foi gerado.")
-            
+                print("Relatório não enviado: a próxima execução continua da etapa 'relatorio'")
         else:
-            print("Nenhum arquivo foi baixado. Verifique se o email com anexo foi encontrado.")
+            print("\nAVISO: Nenhum PDF foi gerado.")
+            run_manifest.finish()
             
     except Exception as e:
         print(f"Erro durante a execução: {e}")
@@ -2570,10 +5320,16 @@ if __name__ == "__main__":
         traceback.print_exc()
     finally:
         # Fecha o navegador de download
-        try:
-            download_driver.quit()
-            print("Navegador de download fechado.")
-        except:
-            pass
+        if download_driver:
+            try:
+                download_driver.quit()
+                print("Navegador de download fechado.")
+            except:
+                pass
+        stop_standby_pool()
+        outbox.print_summary()
+        outbox.close()
         
+    print_wait_summary()
+    selector_resolver.print_stats()
     print("Processo finalizado!")